@@ -9,9 +9,12 @@ echo "MySQL is ready!"
 
 echo "Running migrations..."
 python manage.py migrate
+python manage.py createcachetable
 
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
 echo "Starting Django server..."
-python manage.py runserver 0.0.0.0:9000
\ No newline at end of file
+# served over ASGI so the live measurement stream does not hold a worker thread per client; Django runs the
+# sync views of a process one at a time on a single thread, so the API gets its concurrency from the workers
+uvicorn polaris.asgi:application --host 0.0.0.0 --port 9000 --workers "${WEB_CONCURRENCY:-4}"
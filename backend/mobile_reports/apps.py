@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MobileReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mobile_reports'
+
+    def ready(self):
+        from . import archive, conditional, live, network_types, rollups, tiles  # noqa: F401 connects the receivers
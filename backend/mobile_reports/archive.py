@@ -0,0 +1,299 @@
+from datetime import timezone as dt_timezone
+from itertools import chain
+import os
+from uuid import uuid4
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.http import Http404
+from rest_framework import status
+from rest_framework.response import Response
+from .filters import BoundingBoxFilter
+from .geo import in_bbox
+from .models import Measurement, MeasurementArchive
+from .partitions import add_months
+from .sync import delete_ids, forget_rows
+
+ARROW_TYPES = {
+    'BigAutoField': pa.int64(),
+    'BigIntegerField': pa.int64(),
+    'ForeignKey': pa.int64(),
+    'IntegerField': pa.int32(),
+    'FloatField': pa.float64(),
+    'CharField': pa.string(),
+    'DateTimeField': pa.timestamp('us', tz='UTC'),
+}
+COLUMNS = [field.attname for field in Measurement._meta.concrete_fields]
+SCHEMA = pa.schema([pa.field(field.attname, ARROW_TYPES[field.get_internal_type()], nullable=field.null)
+                    for field in Measurement._meta.concrete_fields])
+ID, TIMESTAMP = COLUMNS.index('id'), COLUMNS.index('timestamp')
+ARCHIVE_CHUNK_SIZE = 5000
+
+
+class ArchiveConflict(Exception):
+    pass
+
+
+class ArchivedDuplicate(IntegrityError):
+    # a (user, timestamp) already stored in the archive, which the unique key of the table cannot see
+    pass
+
+
+def archive_path(user_id, month, first_id, last_id, suffix=''):
+    return f'measurements/month={month:%Y-%m}/user={user_id}/part-{first_id}-{last_id}{suffix}.parquet'
+
+
+def full_path(path):
+    return os.path.join(settings.MEASUREMENT_ARCHIVE_ROOT, path)
+
+
+def pending_months(cutoff):
+    """(user id, month) of the measurements older than `cutoff`, a month is a UTC datetime."""
+    return (Measurement.objects.filter(timestamp__lt=cutoff)
+                               .annotate(month=TruncMonth('timestamp', tzinfo=dt_timezone.utc))
+                               .order_by('user_id', 'month').values_list('user_id', 'month').distinct())
+
+
+def archive_month(user_id, month, cutoff, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Move the measurements of one user and month older than `cutoff` into a Parquet file, returns its
+    MeasurementArchive or None; raises ArchiveConflict, changing nothing, if rows were deleted meanwhile.
+    """
+    end = add_months(month, 1).replace(tzinfo=month.tzinfo)
+    queryset = Measurement.objects.filter(user_id=user_id, timestamp__gte=month, timestamp__lt=min(end, cutoff))
+    directory = os.path.dirname(full_path(archive_path(user_id, month, 0, 0)))
+    os.makedirs(directory, exist_ok=True)
+    temporary = os.path.join(directory, f'.writing-{os.getpid()}.parquet')
+    ids, timestamps = [], []
+    with pq.ParquetWriter(temporary, SCHEMA, compression='zstd') as writer:
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*COLUMNS)[:chunk_size])
+            if not chunk:
+                break
+            columns = list(zip(*chunk))
+            writer.write_table(pa.table([pa.array(column, field.type) for column, field in zip(columns, SCHEMA)],
+                                        schema=SCHEMA))
+            ids.extend(columns[ID])
+            timestamps.extend(columns[TIMESTAMP])
+            last_id = chunk[-1][ID]
+            if len(chunk) < chunk_size:
+                break
+    if not ids:
+        os.remove(temporary)
+        return None
+
+    path = archive_path(user_id, month, ids[0], ids[-1])
+    os.replace(temporary, full_path(path))
+    try:
+        with transaction.atomic():
+            archive = MeasurementArchive.objects.create(
+                user_id=user_id, month=month.date(), path=path, rows=len(ids), size=os.path.getsize(full_path(path)),
+                first_id=ids[0], last_id=ids[-1], first_timestamp=min(timestamps), last_timestamp=max(timestamps))
+            deleted = 0
+            for start in range(0, len(ids), chunk_size):
+                deleted += delete_ids(Measurement, [(pk, user_id, timestamp) for pk, timestamp
+                                                    in zip(ids[start:start + chunk_size], timestamps[start:start + chunk_size])],
+                                      tombstones=False)
+            if deleted != len(ids):
+                raise ArchiveConflict(f'{len(ids) - deleted} rows of user {user_id} in {month:%Y-%m} were deleted meanwhile')
+    except Exception:
+        os.remove(full_path(path))
+        raise
+    return archive
+
+
+@receiver(post_delete, sender=MeasurementArchive)
+def remove_archive_file(sender, instance, **kwargs):
+    path = full_path(instance.path)
+
+    def remove():
+        if os.path.exists(path):
+            os.remove(path)
+    transaction.on_commit(remove)
+
+
+def sort_key(measurement):
+    return measurement.timestamp, measurement.pk
+
+
+def read_rows(manifest, filters=None):
+    """The rows of an archive file matching the pyarrow `filters`, as unsaved Measurement instances."""
+    table = pq.read_table(full_path(manifest.path), filters=filters or None)
+    return [Measurement(**values) for values in table.to_pylist()]
+
+
+def archived_rows(user_id, cursor=None, floor=None, limit=None, bbox=None):
+    """
+    Archived measurements of a user as unsaved Measurements, newest first, after `cursor` and not after
+    `floor` ((timestamp, id) keys), at most `limit`; only the files that can hold them are read.
+    """
+    manifests = MeasurementArchive.objects.filter(user_id=user_id)
+    filters = []
+    if cursor is not None and cursor[0] is not None:
+        manifests = manifests.filter(first_timestamp__lte=cursor[0])
+        filters.append(('timestamp', '<=', cursor[0]))
+    if floor is not None:
+        manifests = manifests.filter(last_timestamp__gte=floor[0])
+        filters.append(('timestamp', '>=', floor[0]))
+    rows = []
+    for manifest in manifests.order_by('-last_timestamp'):
+        if limit is not None and len(rows) >= limit and rows[limit - 1].timestamp > manifest.last_timestamp:
+            break
+        for row in read_rows(manifest, filters):
+            if cursor is not None and sort_key(row) >= cursor:
+                continue
+            if floor is not None and sort_key(row) < floor:
+                continue
+            if bbox is not None and not in_bbox(row.latitude, row.longitude, *bbox):
+                continue
+            rows.append(row)
+        rows.sort(key=sort_key, reverse=True)
+    return rows if limit is None else rows[:limit]
+
+
+def select_archived(user_id, ids=None, start=None, end=None, before=None, network_type=None):
+    """
+    (manifests, filters) for the archived rows of a user with one of `ids`, from `start`, until
+    `end` included or `before` excluded, of `network_type`.
+    """
+    manifests = MeasurementArchive.objects.filter(user_id=user_id)
+    filters = []
+    if ids is not None:
+        ids = list(ids)
+        manifests = manifests.filter(first_id__lte=max(ids), last_id__gte=min(ids)) if ids else manifests.none()
+        filters.append(('id', 'in', ids))
+    if start is not None:
+        manifests = manifests.filter(last_timestamp__gte=start)
+        filters.append(('timestamp', '>=', start))
+    if end is not None:
+        manifests = manifests.filter(first_timestamp__lte=end)
+        filters.append(('timestamp', '<=', end))
+    if before is not None:
+        manifests = manifests.filter(first_timestamp__lt=before)
+        filters.append(('timestamp', '<', before))
+    if network_type is not None:
+        filters.append(('network_type', '=', network_type))
+    return manifests, filters
+
+
+def find_archived(user_id, pk):
+    """The archived measurement `pk` of a user as an unsaved Measurement, None when there is none."""
+    manifests, filters = select_archived(user_id, ids=[pk])
+    for manifest in manifests:
+        rows = read_rows(manifest, filters)
+        if rows:
+            return rows[0]
+    return None
+
+
+def archived_between(user_id, start=None, before=None):
+    """The archived measurements of a user from `start` until before `before`, in no particular order."""
+    manifests, filters = select_archived(user_id, start=start, before=before)
+    return list(chain.from_iterable(read_rows(manifest, filters) for manifest in manifests))
+
+
+def archived_timestamps(model, user_id, timestamps):
+    """Which of `timestamps` a user already has in the archive, which only holds measurements."""
+    if model is not Measurement or not timestamps:
+        return set()
+    manifests, filters = select_archived(user_id, start=min(timestamps), end=max(timestamps))
+    filters.append(('timestamp', 'in', list(timestamps)))
+    return {row.timestamp for manifest in manifests for row in read_rows(manifest, filters)}
+
+
+def check_not_archived(model, user_id, timestamps):
+    """
+    Raise ArchivedDuplicate if the user has an archived measurement at one of `timestamps`;
+    uploads of recent rows open no file.
+    """
+    if archived_timestamps(model, user_id, timestamps):
+        raise ArchivedDuplicate('a measurement with this timestamp is archived for this user')
+
+
+def delete_archived(user_id, ids=None, start=None, end=None, network_type=None):
+    """
+    Delete archived measurements of a user selected like `select_archived`, returns how many; files
+    are rewritten and the rows tombstoned like a delete from the table.
+    """
+    manifests, filters = select_archived(user_id, ids, start, end, network_type=network_type)
+    return sum(remove_from_file(manifest_id, filters) for manifest_id in manifests.values_list('id', flat=True))
+
+
+def remove_from_file(manifest_id, filters):
+    with transaction.atomic():
+        manifest = MeasurementArchive.objects.select_for_update().filter(id=manifest_id).first()
+        if manifest is None:  # removed by a concurrent delete
+            return 0
+        table = pq.read_table(full_path(manifest.path))
+        selected = pq.filters_to_expression(filters) if filters else pc.scalar(True)
+        removed = table.filter(selected)
+        if not removed.num_rows:
+            return 0
+        kept = table.filter(~selected)
+        rows = [(pk, manifest.user_id, timestamp) for pk, timestamp
+                in zip(removed['id'].to_pylist(), removed['timestamp'].to_pylist())]
+        if not kept.num_rows:
+            manifest.delete()  # the file goes on commit, see remove_archive_file
+            forget_rows(Measurement, rows)
+            return len(rows)
+
+        ids, timestamps = kept['id'].to_pylist(), pc.min_max(kept['timestamp']).as_py()
+        # a new name, so the file the manifest lists stays in place until this commits
+        path = archive_path(manifest.user_id, manifest.month, ids[0], ids[-1], f'-{uuid4().hex[:8]}')
+        pq.write_table(kept, full_path(path), compression='zstd')
+        try:
+            old = full_path(manifest.path)
+            MeasurementArchive.objects.filter(id=manifest.id).update(
+                path=path, rows=kept.num_rows, size=os.path.getsize(full_path(path)), first_id=ids[0],
+                last_id=ids[-1], first_timestamp=timestamps['min'], last_timestamp=timestamps['max'])
+            forget_rows(Measurement, rows)
+        except Exception:
+            os.remove(full_path(path))
+            raise
+        transaction.on_commit(lambda: os.remove(old))
+    return len(rows)
+
+
+class ArchiveListMixin:
+    """
+    With `?archived=true`, `list` merges in the user's archived measurements in (timestamp, id)
+    order; `retrieve` and `destroy` find archived rows by id either way.
+    """
+    archived_param = 'archived'
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        rows = sorted(chain(queryset, self.archived_rows()), key=sort_key, reverse=True)
+        serializer = self.get_serializer(rows, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def archived_rows(self, cursor=None, floor=None, limit=None):
+        # the other listings of the viewset, like get_all, only read the measurement table
+        if self.action != 'list' or self.request.query_params.get(self.archived_param) != 'true':
+            return []
+        return archived_rows(self.request.user.id, cursor, floor, limit, BoundingBoxFilter().get_bbox(self.request))
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action not in ('retrieve', 'destroy'):
+                raise
+        try:
+            pk = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+        row = find_archived(self.request.user.id, pk)
+        if row is None:
+            raise Http404
+        return row
@@ -0,0 +1,98 @@
+from hashlib import sha1
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_cache_control
+from users.purge import account_purged
+from users.signals import admin_access_changed
+from . import generations
+from .models import Measurement, TestResult
+from .signals import rows_deleted, rows_ingested
+
+LISTED_MODELS = (Measurement, TestResult)
+
+
+def changes_key(model, scope):
+    return f'changes:{model._meta.model_name}:{scope}'
+
+
+def changed(model, user_ids, shared=False):
+    """
+    Mark the rows of `model` owned by `user_ids` as changed once the transaction commits, and the
+    listing of every user's rows staff get when `shared`.
+    """
+    keys = {changes_key(model, f'user:{user_id}') for user_id in user_ids}
+    if shared:
+        keys.add(changes_key(model, 'all'))
+    transaction.on_commit(lambda: generations.bump(keys))
+
+
+def listing_etag(request, model, scope):
+    """
+    ETag of a listing of `model` rows in `scope` ('user:<id>' or 'all') from its change generation
+    (see `changed`), the path, media type and user, without reading the rows.
+    """
+    key = changes_key(model, scope)
+    generation = (generations.windowed(key, settings.SHARED_SCOPE_CACHE_TIMEOUT) if scope == 'all'
+                  else generations.current(key))
+    parts = (request.user.pk, request.get_full_path(), request.accepted_media_type, generation)
+    return '"%s"' % sha1('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+def conditional(request, model, scope, respond):
+    """
+    Return 304 Not Modified when the client's If-None-Match still matches the listing,
+    otherwise `respond()`, either way tagged with the current ETag.
+    """
+    etag = listing_etag(request, model, scope)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = respond()
+    response['ETag'] = etag
+    # cached copies must be revalidated, and never shared between users
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConditionalListMixin:
+    """
+    Adds ETag validation to `list` of the user's own rows, an unchanged poll costs one cache read.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return conditional(request, self.get_queryset().model, f'user:{request.user.pk}',
+                           lambda: super(ConditionalListMixin, self).list(request, *args, **kwargs))
+
+
+@receiver(rows_ingested)
+def rows_added(sender, rows, **kwargs):
+    if sender in LISTED_MODELS:
+        changed(sender, {row.user_id for row in rows})
+
+
+@receiver(rows_deleted)
+def rows_removed(sender, rows, **kwargs):
+    if sender in LISTED_MODELS:
+        changed(sender, {user_id for _, user_id, _ in rows})
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def row_changed(sender, instance, **kwargs):
+    # single rows written through the admin or the models themselves
+    if sender in LISTED_MODELS:
+        changed(sender, {instance.user_id})
+
+
+@receiver(account_purged)
+def account_changed(sender, account_id, **kwargs):
+    for model in LISTED_MODELS:
+        changed(model, {account_id}, shared=True)
+
+
+@receiver(admin_access_changed)
+def sharing_changed(sender, user_ids, **kwargs):
+    # the rows are the same, only whether staff see them changed
+    for model in LISTED_MODELS:
+        changed(model, (), shared=True)
@@ -0,0 +1,38 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from .geo import bbox_q
+
+
+class BoundingBoxFilter(BaseFilterBackend):
+    """
+    Filters measurements to `?bbox=west,south,east,north` (degrees) through the indexed tile_key.
+    """
+    bbox_param = 'bbox'
+
+    def filter_queryset(self, request, queryset, view):
+        bbox = self.get_bbox(request)
+        if bbox is None:
+            return queryset
+        return queryset.filter(bbox_q(*bbox))
+
+    def get_bbox(self, request):
+        """(south, west, north, east) of the request, None without a bbox."""
+        bbox = request.query_params.get(self.bbox_param)
+        if not bbox:
+            return None
+        try:
+            west, south, east, north = (float(value) for value in bbox.split(','))
+        except ValueError:
+            raise ValidationError({self.bbox_param: ['expected west,south,east,north']})
+        if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+            raise ValidationError({self.bbox_param: ['coordinates are out of range']})
+        return south, west, north, east
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.bbox_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Bounding box as west,south,east,north in degrees.',
+            'schema': {'type': 'string'},
+        }]
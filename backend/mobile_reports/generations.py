@@ -0,0 +1,24 @@
+import time
+from uuid import uuid4
+from django.core.cache import cache
+
+
+def current(key):
+    """
+    The generation stored under `key`, a random token replaced on every `bump`, so one lost to an
+    eviction never matches again.
+    """
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump(keys):
+    cache.set_many({key: uuid4().hex for key in keys}, None)
+
+
+def windowed(key, seconds):
+    """`current(key)` combined with the `seconds` long time window it is read in, so it also changes as time passes."""
+    return f'{current(key)}:{int(time.time() // seconds)}'
@@ -0,0 +1,79 @@
+import math
+from django.db.models import Q
+
+TILE_KEY_ZOOM = 24  # ~2.4 m cells at the equator, 48 bits
+MAX_LATITUDE = 85.0511287798  # web mercator cut-off
+MAX_COVER_CELLS = 32
+
+
+def tile_xy(latitude, longitude, zoom=TILE_KEY_ZOOM):
+    n = 2 ** zoom
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def spread(value):
+    # put a 0 bit between each of the low 32 bits of value
+    value &= 0xFFFFFFFF
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    value = (value | (value << 1)) & 0x5555555555555555
+    return value
+
+
+def interleave(x, y):
+    return spread(x) | (spread(y) << 1)
+
+
+def tile_key(latitude, longitude):
+    """
+    Quadkey of the point at TILE_KEY_ZOOM as an integer (Morton order), every coarser tile is one
+    contiguous range of keys.
+    """
+    if latitude is None or longitude is None:
+        return None
+    return interleave(*tile_xy(latitude, longitude))
+
+
+def cover(south, west, north, east):
+    """Key ranges [low, high) covering the box, using at most about MAX_COVER_CELLS quadtree cells."""
+    for zoom in range(TILE_KEY_ZOOM, -1, -1):
+        x0, y0 = tile_xy(north, west, zoom)
+        x1, y1 = tile_xy(south, east, zoom)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= MAX_COVER_CELLS:
+            break
+    shift = 2 * (TILE_KEY_ZOOM - zoom)
+    starts = sorted(interleave(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    ranges = []
+    for start in starts:
+        if ranges and ranges[-1][1] == start << shift:
+            ranges[-1][1] = (start + 1) << shift
+        else:
+            ranges.append([start << shift, (start + 1) << shift])
+    return ranges
+
+
+def bbox_q(south, west, north, east):
+    """
+    Q for measurements inside the box: range scans on tile_key, then the exact coordinates; boxes
+    crossing the antimeridian are split in two.
+    """
+    if west > east:
+        return bbox_q(south, west, north, 180.0) | bbox_q(south, -180.0, north, east)
+    ranges = Q()
+    for low, high in cover(south, west, north, east):
+        ranges |= Q(tile_key__gte=low, tile_key__lt=high)
+    return ranges & Q(latitude__gte=south, latitude__lte=north, longitude__gte=west, longitude__lte=east)
+
+
+def in_bbox(latitude, longitude, south, west, north, east):
+    """The test of bbox_q for a single point."""
+    if not south <= latitude <= north:
+        return False
+    if west > east:
+        return longitude >= west or longitude <= east
+    return west <= longitude <= east
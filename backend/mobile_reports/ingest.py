@@ -0,0 +1,93 @@
+from time import perf_counter
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from .archive import ArchivedDuplicate, archived_timestamps, check_not_archived
+from .models import stamp_sync_versions
+from .signals import rows_ingested
+
+ON_CONFLICT_CHOICES = ('error', 'ignore')
+
+
+def batches(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def new_rows(model, batch):
+    """
+    Drop rows of `batch`, all of one user, whose (user, timestamp) already exists in the table, the
+    archive or earlier in the batch.
+    """
+    timestamps = [obj.timestamp for obj in batch if obj.timestamp is not None]
+    seen = set(model.objects.filter(user_id=batch[0].user_id, timestamp__in=timestamps)
+                            .values_list('timestamp', flat=True)) if timestamps else set()
+    seen |= archived_timestamps(model, batch[0].user_id, set(timestamps))
+    fresh = []
+    for obj in batch:
+        if obj.timestamp is not None:
+            if obj.timestamp in seen:
+                continue
+            seen.add(obj.timestamp)
+        fresh.append(obj)
+    return fresh
+
+
+def is_duplicate(error):
+    """Whether an IntegrityError is a unique constraint violation, rather than a NOT NULL or foreign key one."""
+    if isinstance(error, ArchivedDuplicate):
+        return True
+    if connection.vendor == 'mysql':
+        return error.args[0] == 1062  # ER_DUP_ENTRY
+    if connection.vendor == 'postgresql':
+        return getattr(error.__cause__, 'pgcode', None) == '23505'
+    return str(error).startswith('UNIQUE constraint failed')
+
+
+def insert_new(model, objs):
+    """
+    Insert `objs` and return those that were, leaving out rows a concurrent upload stored since
+    `new_rows` ran; only after a duplicate key error are they inserted one by one.
+    """
+    try:
+        with transaction.atomic():
+            return model.objects.bulk_create(objs)
+    except IntegrityError as e:
+        if not is_duplicate(e):
+            raise
+    inserted = []
+    for obj in objs:
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([obj])
+        except IntegrityError as e:
+            if not is_duplicate(e):
+                raise
+            continue
+        inserted.append(obj)
+    return inserted
+
+
+def bulk_insert(model, objs, batch_size=None, ignore_conflicts=False):
+    """
+    Insert `objs` in one transaction, `batch_size` rows per INSERT, sending `rows_ingested` per batch;
+    with `ignore_conflicts` duplicates are skipped and counted. Returns [{'rows', 'ms'}] per batch.
+    """
+    batch_size = batch_size or settings.BULK_UPLOAD_BATCH_SIZE
+    timings = []
+    with transaction.atomic():
+        for batch in batches(objs, batch_size):
+            started = perf_counter()
+            if ignore_conflicts:
+                candidates = new_rows(model, batch)
+                stamp_sync_versions(candidates)
+                fresh = insert_new(model, candidates)
+                timing = {'rows': len(fresh), 'duplicates': len(batch) - len(fresh)}
+            else:
+                check_not_archived(model, batch[0].user_id, {obj.timestamp for obj in batch if obj.timestamp is not None})
+                stamp_sync_versions(batch)
+                fresh = model.objects.bulk_create(batch)
+                timing = {'rows': len(batch)}
+            rows_ingested.send(sender=model, rows=fresh)
+            timing['ms'] = round((perf_counter() - started) * 1000, 3)
+            timings.append(timing)
+    return timings
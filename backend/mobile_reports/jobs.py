@@ -0,0 +1,93 @@
+import json
+import zlib
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+from polaris import workers
+from polaris.workers import claimed
+from .ingest import is_duplicate
+from .models import IngestJob
+from .serializers import BulkUploadMeasurementSerializer, BulkUploadTestResultSerializer
+
+UPLOAD_SERIALIZERS = {
+    'measurement': BulkUploadMeasurementSerializer,
+    'test_report': BulkUploadTestResultSerializer,
+}
+# per-row errors kept on a failed job, the rest are only counted
+MAX_JOB_ERRORS = 1000
+
+
+def enqueue(user, kind, data, rows):
+    payload = zlib.compress(json.dumps(data, cls=JSONEncoder, separators=(',', ':')).encode(), 1)
+    return IngestJob.objects.create(user=user, kind=kind, payload=payload, rows=rows)
+
+
+def claim():
+    """Take the oldest pending job, or a running one whose worker has not finished it in time."""
+    return workers.claim(IngestJob.objects.defer('payload'), settings.INGEST_JOB_TIMEOUT)
+
+
+def run(job):
+    """
+    Validate and store the rows of `job` like the synchronous upload, saving the progress after each
+    chunk; an interrupted job can simply run again.
+    """
+    serializer_class = UPLOAD_SERIALIZERS[job.kind]
+    data = json.loads(zlib.decompress(job.payload))
+    rows = data.get(serializer_class.rows_field)
+    if isinstance(rows, dict):
+        rows = expand(serializer_class, rows)
+    context = {'user': job.user}
+
+    validated, rejected, errors = [], [], {}
+    chunk_size = settings.INGEST_JOB_CHUNK_SIZE
+    for start in range(0, len(rows), chunk_size):
+        chunk = serializer_class(data={**data, serializer_class.rows_field: rows[start:start + chunk_size]},
+                                 context=context)
+        if chunk.is_valid():
+            validated.extend(chunk.validated_data[serializer_class.rows_field])
+            rejected.extend({**row, 'index': row['index'] + start} for row in chunk.rejected)
+        else:
+            envelope_errors = dict(chunk.errors)
+            row_errors = envelope_errors.pop(serializer_class.rows_field, {})
+            if envelope_errors:  # the same for every chunk
+                return fail(job, envelope_errors, 'the upload is invalid')
+            if isinstance(row_errors, dict):
+                errors.update({index + start: detail for index, detail in row_errors.items()})
+            else:
+                return fail(job, {serializer_class.rows_field: row_errors}, 'the upload is invalid')
+        claimed(job).update(validated=min(start + chunk_size, len(rows)))
+    if errors:
+        return fail(job, {serializer_class.rows_field: dict(list(errors.items())[:MAX_JOB_ERRORS])},
+                    f'{len(errors)} rows are invalid')
+
+    upload = serializer_class(context=context)
+    try:
+        with transaction.atomic():
+            upload.create({serializer_class.rows_field: validated, 'on_conflict': data.get('on_conflict', 'error')})
+            done = claimed(job).update(
+                status='done', payload=b'', validated=len(rows), created=upload.created_count,
+                duplicates=upload.duplicate_count, rejected=rejected[:MAX_JOB_ERRORS], finished_at=timezone.now())
+            if not done:
+                # another worker took the job over after INGEST_JOB_TIMEOUT, its run counts
+                transaction.set_rollback(True)
+    except IntegrityError as e:
+        if not is_duplicate(e):
+            raise
+        return fail(job, None, 'some rows already exist for this user and timestamp, '
+                               'resend with "on_conflict": "ignore" to skip them')
+
+
+def expand(serializer_class, rows):
+    return serializer_class().fields[serializer_class.rows_field].expand_columns(rows)
+
+
+def fail(job, errors, detail):
+    claimed(job).update(status='failed', errors=errors, detail=detail, finished_at=timezone.now())
+
+
+def process_next():
+    """Run one job, returns False when there was none."""
+    return workers.process_next(claim, lambda job: run(job),
+                                lambda job: fail(job, None, 'internal error while storing the upload'))
@@ -0,0 +1,221 @@
+import asyncio
+from functools import cache as memoize
+import json
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+from .models import Measurement
+from .serializers import MeasurementSerializer
+from .signals import rows_ingested
+
+User = get_user_model()
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+RESYNC = {'type': 'resync'}
+
+
+class Subscription:
+    """
+    Events for one connected client, delivered on the event loop that serves it.
+    """
+
+    def __init__(self, accept):
+        self.accept = accept
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(SUBSCRIPTION_QUEUE_SIZE)
+
+    def deliver(self, event):
+        if self.queue.full():
+            # the client is not keeping up, drop what it missed and let it catch up with a delta sync
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = RESYNC
+        self.queue.put_nowait(event)
+
+
+class LocalBroker:
+    """
+    Fans events out to the subscriptions of this process, enough for a single ASGI worker without
+    the ingest worker.
+    """
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self, accept):
+        subscription = Subscription(accept)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def has_subscribers(self):
+        return bool(self.subscriptions)
+
+    def publish(self, event):
+        self.dispatch(event)
+
+    def dispatch(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            if not subscription.accept(event):
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:  # its event loop is gone
+                self.unsubscribe(subscription)
+
+
+class CacheBroker(LocalBroker):
+    """
+    Shares events between processes through a numbered log in the Django cache, read by one polling
+    thread per process; the default, since the ingest worker publishes through it too.
+    """
+    sequence_key = 'live:sequence'
+    listening_key = 'live:listening'
+    event_ttl = 60
+    poll_interval = 0.5
+    # how long a process with subscriptions counts as listening after it last said so
+    listening_ttl = 10
+    # an event whose number is taken but which is not in the cache yet is waited for this long
+    missing_event_timeout = 2
+
+    def __init__(self):
+        super().__init__()
+        self.poller = None
+
+    def has_subscribers(self):
+        # clients of any process, so ingests are not published to nobody
+        return bool(self.subscriptions) or cache.get(self.listening_key, False)
+
+    def publish(self, event):
+        # incr is not atomic on every cache (the database cache reads then writes), add is: a number
+        # handed out twice goes to the first event added under it and the other takes the next one
+        while True:
+            try:
+                sequence = cache.incr(self.sequence_key)
+            except ValueError:
+                cache.add(self.sequence_key, 0, None)
+                continue
+            if cache.add(f'live:event:{sequence}', event, self.event_ttl):
+                return sequence
+
+    def subscribe(self, accept):
+        cache.set(self.listening_key, True, self.listening_ttl)
+        # subscribed first, so a poller that finds no subscriptions has already given way to a new one
+        subscription = super().subscribe(accept)
+        with self.lock:
+            if self.poller is None:
+                self.poller = threading.Thread(target=self.poll, name='live-broker', daemon=True)
+                self.poller.start()
+        return subscription
+
+    def poll(self):
+        last = cache.get(self.sequence_key, 0)
+        missing_since = None
+        announced = time.monotonic()
+        while True:
+            time.sleep(self.poll_interval)
+            with self.lock:
+                if not self.subscriptions:  # the last client left, the next one starts another poller
+                    self.poller = None
+                    return
+            if time.monotonic() - announced > self.listening_ttl / 2:
+                cache.set(self.listening_key, True, self.listening_ttl)
+                announced = time.monotonic()
+            current = cache.get(self.sequence_key, 0)
+            if current < last:  # the cache was flushed
+                last = current
+            if current == last:
+                continue
+            events = cache.get_many([f'live:event:{sequence}' for sequence in range(last + 1, current + 1)])
+            for sequence in range(last + 1, current + 1):
+                event = events.get(f'live:event:{sequence}')
+                if event is None:
+                    missing_since = missing_since or time.monotonic()
+                    if time.monotonic() - missing_since < self.missing_event_timeout:
+                        break
+                else:
+                    self.dispatch(event)
+                missing_since = None
+                last = sequence
+
+
+@memoize
+def get_broker():
+    return import_string(settings.LIVE_BROKER_BACKEND)()
+
+
+def measurement_event(user_id, shared, rows):
+    """
+    Event for measurements of one user that were just stored: what they add to the dashboard
+    aggregates, and the rows themselves for small ingests.
+    """
+    network_types = {}
+    rsrp = [row.rsrp for row in rows if row.rsrp is not None]
+    for row in rows:
+        network_types[row.network_type] = network_types.get(row.network_type, 0) + 1
+    include_rows = len(rows) <= settings.LIVE_MAX_ROWS
+    return {
+        'type': 'measurements',
+        'user_id': user_id,
+        'shared': shared,
+        'delta': {
+            'count': len(rows),
+            'network_types': network_types,
+            'rsrp': {'count': len(rsrp), 'sum': sum(rsrp),
+                     'min': min(rsrp, default=None), 'max': max(rsrp, default=None)},
+        },
+        'truncated': not include_rows,
+        'rows': MeasurementSerializer(rows, many=True).data if include_rows else [],
+    }
+
+
+@receiver(rows_ingested, sender=Measurement)
+def publish_measurements(sender, rows, **kwargs):
+    broker = get_broker()
+    if rows and broker.has_subscribers():
+        transaction.on_commit(lambda: publish_rows(broker, rows))
+
+
+def publish_rows(broker, rows):
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row.user_id, []).append(row)
+    shared = dict(User.objects.filter(id__in=by_user).values_list('id', 'allow_admin_access'))
+    for user_id, user_rows in by_user.items():
+        broker.publish(json.loads(json.dumps(measurement_event(user_id, shared.get(user_id, False), user_rows),
+                                             cls=JSONEncoder)))
+
+
+def server_sent_event(event):
+    return f'event: {event["type"]}\ndata: {json.dumps(event, cls=JSONEncoder)}\n\n'.encode()
+
+
+async def event_stream(accept, heartbeat=None):
+    """Server-sent events of the broker for which `accept(event)` holds, with comment heartbeats."""
+    heartbeat = heartbeat or settings.LIVE_HEARTBEAT_INTERVAL
+    broker = get_broker()
+    subscription = broker.subscribe(accept)
+    try:
+        yield b'retry: 5000\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            yield server_sent_event(event)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,29 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from mobile_reports.archive import ARCHIVE_CHUNK_SIZE, ArchiveConflict, archive_month, pending_months
+
+
+class Command(BaseCommand):
+    help = ('Move measurements older than --days into compressed Parquet files, one set per user and month, '
+            'listed in MeasurementArchive. The measurement listing returns them with ?archived=true.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.MEASUREMENT_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE, help='rows per Parquet row group')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        files = rows = size = 0
+        for user_id, month in pending_months(cutoff):
+            try:
+                archive = archive_month(user_id, month, cutoff, options['chunk_size'])
+            except ArchiveConflict as e:
+                self.stderr.write(f'skipped, {e}')
+                continue
+            if archive is None:
+                continue
+            files, rows, size = files + 1, rows + archive.rows, size + archive.size
+            self.stdout.write(f'{archive.path}: {archive.rows} rows, {archive.size / 1024:.0f} KiB')
+        self.stdout.write(f'archived {rows} measurements into {files} files, {size / 1024 / 1024:.1f} MiB')
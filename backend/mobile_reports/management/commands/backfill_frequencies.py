@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from mobile_reports.conditional import changed
+from mobile_reports.models import Measurement, stamp_sync_versions
+from mobile_reports.utils import fill_frequencies
+
+
+class Command(BaseCommand):
+    help = ('Fill frequency and frequency_band of stored measurements from their arfcn and network type. '
+            'Uploads are filled at ingest, run this for rows stored before that.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--recompute', action='store_true',
+                            help='overwrite values already set instead of only filling missing ones')
+
+    def handle(self, *args, **options):
+        queryset = Measurement.objects.filter(arfcn__isnull=False)
+        if not options['recompute']:
+            queryset = queryset.filter(frequency__isnull=True) | queryset.filter(frequency_band__isnull=True)
+        queryset = queryset.order_by('id').only('id', 'user_id', 'arfcn', 'network_type', 'frequency', 'frequency_band')
+
+        last_id, updated = 0, 0
+        while batch := list(queryset.filter(id__gt=last_id)[:options['batch_size']]):
+            last_id = batch[-1].id
+            if options['recompute']:
+                for measurement in batch:
+                    measurement.frequency = measurement.frequency_band = None
+            filled = fill_frequencies(batch)
+            if not filled:
+                continue
+            with transaction.atomic():
+                # changed rows are sent to delta sync again
+                stamp_sync_versions(filled)
+                Measurement.objects.bulk_update(filled, ['frequency', 'frequency_band', 'sync_version'])
+                changed(Measurement, {measurement.user_id for measurement in filled})
+            updated += len(filled)
+        self.stdout.write(f'filled frequencies of {updated} measurements')
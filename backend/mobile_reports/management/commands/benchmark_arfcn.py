@@ -0,0 +1,40 @@
+from random import Random
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from mobile_reports.utils import arfcn_to_band, arfcns_to_bands, BANDS, RAT_NETWORK_TYPES
+
+
+class Command(BaseCommand):
+    help = 'Per-row cost of the ARFCN band lookup, one call per row and in batch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--cells', type=int, default=50,
+                            help='distinct channels in the realistic payload, uploads come from few cells')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        for label, (arfcns, network_types) in (('random channels', self.payload(rows, None)),
+                                               (f'{options["cells"]} channels', self.payload(rows, options['cells']))):
+            started = perf_counter()
+            expected = [arfcn_to_band(arfcn, network_type) for arfcn, network_type in zip(arfcns, network_types)]
+            scalar = perf_counter() - started
+
+            started = perf_counter()
+            result = arfcns_to_bands(arfcns, network_types)
+            batch = perf_counter() - started
+
+            if result != expected:
+                raise CommandError('batch and scalar lookups disagree')
+            self.stdout.write(f'{label:<16} {rows:,} rows  per row {scalar / rows * 1e9:6.0f} ns  '
+                              f'batch {batch / rows * 1e9:6.0f} ns')
+
+    def payload(self, rows, cells):
+        random = Random(rows)
+        # draw from and around the band tables so misses are exercised too
+        channels = [(random.randint(band[0] - 50, band[1] + 50), random.choice(RAT_NETWORK_TYPES[rat]))
+                    for _ in range(cells or rows) for rat in [random.choice(list(BANDS))]
+                    for band in [random.choice(BANDS[rat])]]
+        if cells:
+            channels = [random.choice(channels) for _ in range(rows)]
+        return [arfcn for arfcn, _ in channels], [network_type for _, network_type in channels]
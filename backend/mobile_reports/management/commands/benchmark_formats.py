@@ -0,0 +1,46 @@
+import gzip
+import io
+import json
+from time import perf_counter
+import msgpack
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from mobile_reports.parsers import GzipJSONParser, MessagePackParser
+from .benchmark_validation import Command as ValidationBenchmark
+
+
+class Command(BaseCommand):
+    help = 'Compare bytes on wire and parse time of the bulk upload encodings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            records = ValidationBenchmark().payload(rows, invalid=0)
+            columns = list(records[0])
+            columnar = {'columns': columns, 'rows': [[record[name] for name in columns] for record in records]}
+            encodings = [
+                ('json objects', GzipJSONParser, json.dumps({'measurements': records}).encode()),
+                ('json columnar', GzipJSONParser, json.dumps({'measurements': columnar}).encode()),
+                ('msgpack columnar', MessagePackParser, msgpack.packb({'measurements': columnar})),
+            ]
+            self.stdout.write(f'{rows} rows')
+            for label, parser, body in encodings:
+                for compressed in (False, True):
+                    payload = gzip.compress(body) if compressed else body
+                    elapsed = self.parse_time(parser, payload, compressed, options['repeat'])
+                    name = f'{label}{" + gzip" if compressed else ""}'
+                    self.stdout.write(f'  {name:<26} {len(payload):>11,} bytes  {elapsed * 1000:8.1f} ms')
+
+    def parse_time(self, parser, payload, compressed, repeat):
+        headers = {'HTTP_CONTENT_ENCODING': 'gzip'} if compressed else {}
+        request = RequestFactory().post('/', **headers)
+        best = None
+        for _ in range(repeat):
+            started = perf_counter()
+            parser().parse(io.BytesIO(payload), parser.media_type, {'request': request})
+            elapsed = perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
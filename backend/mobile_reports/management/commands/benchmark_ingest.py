@@ -0,0 +1,60 @@
+from datetime import timedelta
+from time import perf_counter
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from mobile_reports.ingest import bulk_insert
+from mobile_reports.models import Measurement
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/second of per-row create() against batched bulk_create for measurement uploads. Nothing is kept in the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, nargs='+', default=[100, 500, 1000])
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        self.report('create() per row', rows, self.run(rows, self.per_row))
+        for batch_size in options['batch_size']:
+            self.report(f'bulk_create batch={batch_size}', rows,
+                        self.run(rows, lambda objs: bulk_insert(Measurement, objs, batch_size)))
+
+    def run(self, rows, insert):
+        elapsed = None
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username='benchmark', phone_number='09000000000',
+                                                email='benchmark@polaris.local')
+                objs = self.measurements(user, rows)
+                started = perf_counter()
+                insert(objs)
+                elapsed = perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        return elapsed
+
+    def per_row(self, objs):
+        # the ingest path before batching: one INSERT round trip per row (each also committed on its own in production)
+        for obj in objs:
+            obj.save(force_insert=True)
+
+    def measurements(self, user, rows):
+        start = timezone.now() - timedelta(days=365)
+        return [Measurement(user=user, latitude=35.7, longitude=51.4,
+                            timestamp=start + timedelta(seconds=i), network_type='LTE',
+                            arfcn=1300, rsrp=-95, rsrq=-11, http_upload=1.0, http_download=5.0,
+                            ping_time=40.0, dns_response=20, web_response=300, sms_delivery_time=2000)
+                for i in range(rows)]
+
+    def report(self, label, rows, elapsed):
+        self.stdout.write(f'{label:<28} {rows} rows in {elapsed:.3f}s  {rows / elapsed:,.0f} rows/s')
@@ -0,0 +1,65 @@
+from datetime import timedelta
+from random import Random
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework import serializers
+from mobile_reports.serializers import BulkMeasurementSerializer
+from mobile_reports.validators import ColumnarValidator
+
+
+class Command(BaseCommand):
+    help = 'Compare the serializer and columnar validation engines on generated bulk measurement payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--invalid', type=float, default=0.01, help='fraction of rows with a bad value')
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            payload = self.payload(rows, options['invalid'])
+
+            started = perf_counter()
+            expected = self.serializer_path(payload)
+            serializer_time = perf_counter() - started
+
+            started = perf_counter()
+            result = ColumnarValidator(BulkMeasurementSerializer).validate(payload)
+            columnar_time = perf_counter() - started
+
+            if [dict(row) for row in expected[0]] != result[0] or expected[1] != result[1]:
+                raise CommandError(f'engines disagree on {rows} rows')
+            self.stdout.write(f'{rows:>7} rows  serializer {serializer_time:.3f}s  '
+                              f'columnar {columnar_time:.3f}s  x{serializer_time / columnar_time:.1f}')
+
+    def serializer_path(self, payload):
+        child = BulkMeasurementSerializer()
+        result, errors = [], {}
+        for index, row in enumerate(payload):
+            try:
+                result.append(child.run_validation(row))
+            except serializers.ValidationError as e:
+                errors[index] = e.detail
+        return result, errors
+
+    def payload(self, rows, invalid):
+        random = Random(rows)
+        start = timezone.now() - timedelta(days=30)
+        payload = []
+        for i in range(rows):
+            row = {
+                'latitude': 35.6 + random.random(), 'longitude': 51.3 + random.random(),
+                'timestamp': (start + timedelta(seconds=i)).isoformat(),
+                'network_type': random.choice(['LTE', 'HSPA+', 'GSM', '5G']),
+                'tac': str(random.randint(1, 65535)), 'lac': None, 'cell_id': str(random.randint(1, 2**28)),
+                'plmn_id': '43235', 'arfcn': random.randint(0, 6000), 'frequency': None, 'frequency_band': None,
+                'rsrp': random.randint(-140, -44), 'rsrq': random.randint(-20, -3), 'rscp': None,
+                'ecIo': None, 'rxLev': None, 'http_upload': random.random() * 20,
+                'http_download': random.random() * 80, 'ping_time': random.random() * 200,
+                'dns_response': float(random.randint(5, 300)), 'web_response': float(random.randint(50, 3000)),
+                'sms_delivery_time': -1.0,
+            }
+            if random.random() < invalid:
+                row[random.choice(['latitude', 'rsrp', 'ping_time', 'network_type'])] = random.choice(['x', 1000, -5, ''])
+            payload.append(row)
+        return payload
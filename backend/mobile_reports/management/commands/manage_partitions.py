@@ -0,0 +1,88 @@
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from mobile_reports.archive import ArchiveConflict, archive_month, pending_months
+from mobile_reports.models import Measurement
+from mobile_reports.partitions import (detach_statements, detached_rows, detached_table, existing_partitions,
+                                       expire_statements, expired_partitions, future_statements, retention_cutoff,
+                                       utc_now)
+from mobile_reports.sync import forget_rows
+
+
+class Command(BaseCommand):
+    help = ('Create the coming monthly partitions of the measurement table and drop, or archive, '
+            'the ones past the retention period. Meant to run daily, on MySQL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.MEASUREMENT_PARTITIONS_AHEAD,
+                            help='months to have partitions for beyond the current one')
+        parser.add_argument('--retention-months', type=int, default=settings.MEASUREMENT_RETENTION_MONTHS,
+                            help='full months kept before the current one, 0 keeps everything')
+        parser.add_argument('--policy', choices=['drop', 'archive'], default=settings.MEASUREMENT_RETENTION_POLICY,
+                            help='archive moves the rows of expired partitions to the Parquet archive, drop deletes them')
+        parser.add_argument('--dry-run', action='store_true', help='print the statements instead of running them')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError('the measurement table is only partitioned on MySQL')
+        partitions = existing_partitions()
+        if not partitions:
+            raise CommandError('the measurement table is not partitioned, run the migrations first')
+
+        now = utc_now()
+        self.run(future_statements(partitions, now, options['ahead']), options['dry_run'])
+        expired = []
+        if options['retention_months'] > 0:
+            expired = expired_partitions(partitions, retention_cutoff(now, options['retention_months']))
+        bounds = dict(partitions)
+        for name in expired:
+            self.expire(name, bounds[name].replace(tzinfo=dt_timezone.utc), options['policy'] == 'archive',
+                        options['dry_run'])
+        self.stdout.write(f'{len(partitions)} partitions, {len(expired)} expired'
+                          + (' (dry run)' if options['dry_run'] else ''))
+
+    def expire(self, name, bound, archive, dry_run):
+        if archive:
+            self.archive(name, bound, dry_run)
+        else:
+            self.drop(name, dry_run)
+
+    def archive(self, name, bound, dry_run):
+        # the rows move to Parquet files the way archive_measurements moves them and stay listed with
+        # ?archived=true, then the partition is empty and dropping it deletes nothing
+        if dry_run:
+            self.stdout.write(f'-- archive the rows of {name}')
+        else:
+            for user_id, month in pending_months(bound):
+                try:
+                    archive_month(user_id, month, bound)
+                except ArchiveConflict as e:
+                    self.stderr.write(f'skipped, {e}')
+            if Measurement.objects.filter(timestamp__lt=bound).exists():
+                self.stderr.write(f'{name} kept, some of its rows could not be archived')
+                return
+        self.run(expire_statements(name, detached=False), dry_run)
+
+    def drop(self, name, dry_run):
+        # the rows are swapped out first and tombstoned, with rows_deleted for the rollups and tiles, in
+        # chunks; a run interrupted after the swap finds the table and carries on from there
+        if detached_table(name) not in connection.introspection.table_names():
+            self.run(detach_statements(name), dry_run)
+        if dry_run:
+            self.stdout.write(f'-- tombstones for the rows of {name}')
+        else:
+            forgotten = 0
+            for rows in detached_rows(name, settings.BULK_DELETE_CHUNK_SIZE):
+                with transaction.atomic():
+                    forget_rows(Measurement, rows)
+                forgotten += len(rows)
+            self.stdout.write(f'-- {forgotten} rows of {name} tombstoned')
+        self.run(expire_statements(name, detached=True), dry_run)
+
+    def run(self, statements, dry_run):
+        for statement in statements:
+            self.stdout.write(statement)
+            if not dry_run:
+                with connection.cursor() as cursor:
+                    cursor.execute(statement)
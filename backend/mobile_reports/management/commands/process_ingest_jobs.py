@@ -0,0 +1,11 @@
+from mobile_reports.jobs import process_next
+from polaris.workers import WorkerCommand
+
+
+class Command(WorkerCommand):
+    help = ('Store the bulk uploads queued with ?mode=async. Runs until stopped, '
+            'several instances can run side by side.')
+    processed = 'ingest jobs'
+
+    def process_next(self):
+        return process_next()
@@ -0,0 +1,24 @@
+from datetime import timedelta
+from time import sleep
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from mobile_reports.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = ('Delete deletion tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS. '
+            'Delta sync rejects watermarks older than that, so nothing still needs them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help='hours to wait before purging again, runs until stopped; 0 purges once')
+
+    def handle(self, *args, **options):
+        while True:
+            cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+            count, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+            self.stdout.write(f'purged {count} tombstones')
+            if not options['every']:
+                break
+            sleep(options['every'] * 3600)
@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from mobile_reports.rollups import rebuild
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Recompute the hourly and daily measurement rollups from the raw measurements. '
+            'Ingest keeps them up to date, run this to backfill and after deleting measurements.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, nargs='*', help='only these user ids')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(user_measurements__isnull=False).distinct().order_by('id')
+        if options['user']:
+            users = User.objects.filter(id__in=options['user']).order_by('id')
+        for user in users.iterator():
+            rebuild(user)
+            self.stdout.write(f'rebuilt rollups of user {user.id}')
@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from time import perf_counter
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent multi-stream speed-test sessions against a running server and report how they went.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:9000/api/mobile')
+        parser.add_argument('--user', help='phone number of the user to test as, a token is minted for it')
+        parser.add_argument('--token', help='access token to use instead of --user')
+        parser.add_argument('--sessions', type=int, default=10, help='sessions running at the same time')
+        parser.add_argument('--streams', type=int, default=4)
+        parser.add_argument('--direction', choices=['download', 'upload'], default='download')
+        parser.add_argument('--bytes', type=int, default=16 * 1024 * 1024, help='bytes per stream')
+
+    def handle(self, *args, **options):
+        if options['token']:
+            token = options['token']
+        elif options['user']:
+            user = get_user_model().objects.filter(phone_number=options['user']).first()
+            if user is None:
+                raise CommandError(f'no user {options["user"]}')
+            token = str(AccessToken.for_user(user))
+        else:
+            raise CommandError('pass --user or --token')
+        self.options = options
+        self.headers = {'Authorization': f'Bearer {token}'}
+        # sent as bytes so it has a Content-Length, WSGI servers cannot read chunked bodies
+        self.body = b'\0' * options['bytes'] if options['direction'] == 'upload' else None
+
+        started = perf_counter()
+        with ThreadPoolExecutor(options['sessions'] * (options['streams'] + 1)) as pool:
+            outcomes = list(pool.map(lambda _: self.session(pool), range(options['sessions'])))
+        elapsed = perf_counter() - started
+
+        failures = [outcome for outcome in outcomes if isinstance(outcome, str)]
+        results = [outcome for outcome in outcomes if not isinstance(outcome, str)]
+        self.stdout.write(f'{len(results)} sessions succeeded, {len(failures)} failed in {elapsed:.1f} s')
+        for failure in sorted(set(failures)):
+            self.stdout.write(f'  {failures.count(failure)} x {failure}')
+        if len(results) > 1:
+            seconds = quantiles([duration for duration, _ in results], n=20)
+            mbps = quantiles([result['throughput_mbps'] or 0 for _, result in results], n=20)
+            self.stdout.write(f'session time  p50 {seconds[9]:.2f} s  p95 {seconds[18]:.2f} s')
+            self.stdout.write(f'throughput    p50 {mbps[9]:.1f} Mbps  p5 {mbps[0]:.1f} Mbps')
+
+    def session(self, pool):
+        # streams run on their own threads, the pool is sized for all of them next to the sessions
+        options = self.options
+        started = perf_counter()
+        try:
+            response = requests.post(f'{options["url"]}/speedtest/', headers=self.headers, json={
+                'direction': options['direction'], 'streams': options['streams'], 'stream_bytes': options['bytes']})
+            response.raise_for_status()
+            session_url = f'{options["url"]}/speedtest/{response.json()["id"]}'
+            streams = [pool.submit(self.stream, session_url) for _ in range(options['streams'])]
+            for stream in streams:
+                stream.result()
+            response = requests.post(f'{session_url}/finish/', headers=self.headers)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            return str(e)
+        return perf_counter() - started, response.json()['throughput']
+
+    def stream(self, session_url):
+        if self.body is None:
+            with requests.get(f'{session_url}/download/', headers=self.headers, stream=True) as response:
+                response.raise_for_status()
+                for _ in response.iter_content(256 * 1024):
+                    pass
+        else:
+            requests.post(f'{session_url}/upload/', headers={**self.headers, 'Content-Type': 'application/octet-stream'},
+                          data=self.body).raise_for_status()
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mobile_reports', '0004_remove_measurement_rac_remove_measurement_ssrsrp_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='measurement',
+            name='timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='measurement',
+            unique_together={('user', 'timestamp')},
+        ),
+    ]
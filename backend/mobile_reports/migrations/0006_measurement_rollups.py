@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mobile_reports', '0005_measurement_unique_per_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMeasurementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('network_type', models.CharField(max_length=15)),
+                ('cell_id', models.CharField(blank=True, default='', max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+                ('rsrp_count', models.BigIntegerField(default=0)),
+                ('rsrp_sum', models.FloatField(default=0)),
+                ('rsrp_min', models.FloatField(blank=True, null=True)),
+                ('rsrp_max', models.FloatField(blank=True, null=True)),
+                ('rsrq_count', models.BigIntegerField(default=0)),
+                ('rsrq_sum', models.FloatField(default=0)),
+                ('rsrq_min', models.FloatField(blank=True, null=True)),
+                ('rsrq_max', models.FloatField(blank=True, null=True)),
+                ('ping_time_count', models.BigIntegerField(default=0)),
+                ('ping_time_sum', models.FloatField(default=0)),
+                ('ping_time_min', models.FloatField(blank=True, null=True)),
+                ('ping_time_max', models.FloatField(blank=True, null=True)),
+                ('http_download_count', models.BigIntegerField(default=0)),
+                ('http_download_sum', models.FloatField(default=0)),
+                ('http_download_min', models.FloatField(blank=True, null=True)),
+                ('http_download_max', models.FloatField(blank=True, null=True)),
+                ('http_upload_count', models.BigIntegerField(default=0)),
+                ('http_upload_sum', models.FloatField(default=0)),
+                ('http_upload_min', models.FloatField(blank=True, null=True)),
+                ('http_upload_max', models.FloatField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'abstract': False,
+                'unique_together': {('user', 'bucket', 'network_type', 'cell_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyMeasurementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('network_type', models.CharField(max_length=15)),
+                ('cell_id', models.CharField(blank=True, default='', max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+                ('rsrp_count', models.BigIntegerField(default=0)),
+                ('rsrp_sum', models.FloatField(default=0)),
+                ('rsrp_min', models.FloatField(blank=True, null=True)),
+                ('rsrp_max', models.FloatField(blank=True, null=True)),
+                ('rsrq_count', models.BigIntegerField(default=0)),
+                ('rsrq_sum', models.FloatField(default=0)),
+                ('rsrq_min', models.FloatField(blank=True, null=True)),
+                ('rsrq_max', models.FloatField(blank=True, null=True)),
+                ('ping_time_count', models.BigIntegerField(default=0)),
+                ('ping_time_sum', models.FloatField(default=0)),
+                ('ping_time_min', models.FloatField(blank=True, null=True)),
+                ('ping_time_max', models.FloatField(blank=True, null=True)),
+                ('http_download_count', models.BigIntegerField(default=0)),
+                ('http_download_sum', models.FloatField(default=0)),
+                ('http_download_min', models.FloatField(blank=True, null=True)),
+                ('http_download_max', models.FloatField(blank=True, null=True)),
+                ('http_upload_count', models.BigIntegerField(default=0)),
+                ('http_upload_sum', models.FloatField(default=0)),
+                ('http_upload_min', models.FloatField(blank=True, null=True)),
+                ('http_upload_max', models.FloatField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'abstract': False,
+                'unique_together': {('user', 'bucket', 'network_type', 'cell_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_tile_keys(apps, schema_editor):
+    from mobile_reports.geo import tile_key
+    Measurement = apps.get_model('mobile_reports', 'Measurement')
+    last_id = 0
+    while True:
+        batch = list(Measurement.objects.filter(id__gt=last_id).order_by('id')
+                     .only('id', 'latitude', 'longitude')[:2000])
+        if not batch:
+            return
+        for measurement in batch:
+            measurement.tile_key = tile_key(measurement.latitude, measurement.longitude)
+        Measurement.objects.bulk_update(batch, ['tile_key'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mobile_reports', '0006_measurement_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='tile_key',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_tile_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['user', 'tile_key'], name='mobile_repo_user_id_893adc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['tile_key'], name='mobile_repo_tile_ke_c1546b_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_network_types(apps, schema_editor):
+    Measurement = apps.get_model('mobile_reports', 'Measurement')
+    UserNetworkType = apps.get_model('mobile_reports', 'UserNetworkType')
+    pairs = Measurement.objects.order_by().values_list('user_id', 'network_type').distinct()
+    UserNetworkType.objects.bulk_create([UserNetworkType(user_id=user_id, network_type=network_type)
+                                         for user_id, network_type in pairs.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mobile_reports', '0007_measurement_tile_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserNetworkType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('network_type', models.CharField(max_length=15)),
+            ],
+            options={
+                'ordering': ['network_type'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['user', 'network_type'], name='mobile_repo_user_id_7994c1_idx'),
+        ),
+        migrations.AddField(
+            model_name='usernetworktype',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='network_types', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='usernetworktype',
+            index=models.Index(fields=['network_type'], name='mobile_repo_network_a3ecc6_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='usernetworktype',
+            unique_together={('user', 'network_type')},
+        ),
+        migrations.RunPython(fill_network_types, migrations.RunPython.noop),
+    ]
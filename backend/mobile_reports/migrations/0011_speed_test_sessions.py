@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mobile_reports', '0010_ingest_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpeedTestSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('direction', models.CharField(choices=[('download', 'download'), ('upload', 'upload')], max_length=10)),
+                ('streams', models.PositiveSmallIntegerField()),
+                ('stream_bytes', models.BigIntegerField()),
+                ('warmup_ms', models.PositiveIntegerField()),
+                ('is_finished', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('result', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='mobile_reports.testresult')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='speed_tests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SpeedTestStream',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bytes', models.BigIntegerField()),
+                ('started_at', models.FloatField()),
+                ('finished_at', models.FloatField()),
+                ('samples', models.JSONField(default=list)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfers', to='mobile_reports.speedtestsession')),
+            ],
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from mobile_reports.partitions import TABLE, initial_layout, utc_now
+
+# months partitioned ahead by the first layout, manage_partitions keeps them coming
+PARTITIONS_AHEAD = 3
+
+
+def fill_timestamps(apps, schema_editor):
+    # every unique key of a partitioned table must contain the partitioning column, the primary key too
+    Measurement = apps.get_model('mobile_reports', 'Measurement')
+    Measurement.objects.filter(timestamp__isnull=True).update(timestamp=F('created_at'))
+
+
+def partition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(`timestamp`) FROM `{TABLE}`')
+        oldest = cursor.fetchone()[0]
+    if oldest is not None and oldest.tzinfo is not None:
+        oldest = oldest.replace(tzinfo=None)
+    schema_editor.execute(f'ALTER TABLE `{TABLE}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `timestamp`) '
+                          + initial_layout(oldest, utc_now(), PARTITIONS_AHEAD))
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute(f'ALTER TABLE `{TABLE}` REMOVE PARTITIONING')
+    schema_editor.execute(f'ALTER TABLE `{TABLE}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mobile_reports', '0011_speed_test_sessions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_timestamps, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='measurement',
+            name='timestamp',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='user_measurements', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(partition, unpartition),
+    ]
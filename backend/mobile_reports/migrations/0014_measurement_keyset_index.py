@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mobile_reports', '0013_measurement_archives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='measurement',
+            name='mobile_repo_user_id_eb544b_idx',
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['-timestamp', '-id'], name='mobile_repo_timesta_c90051_idx'),
+        ),
+    ]
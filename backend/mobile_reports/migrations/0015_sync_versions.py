@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def fill_sync_versions(apps, schema_editor):
+    # existing rows keep their id as version, tombstones go after every row id so that no row and
+    # tombstone share a version, and each user's counter starts past all of them
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    SyncCounter = apps.get_model('mobile_reports', 'SyncCounter')
+    Tombstone = apps.get_model('mobile_reports', 'Tombstone')
+    offset = 0
+    for name in ('Measurement', 'TestResult'):
+        model = apps.get_model('mobile_reports', name)
+        model.objects.update(sync_version=F('id'))
+        offset = max(offset, model.objects.aggregate(last=Max('id'))['last'] or 0)
+    Tombstone.objects.update(sync_version=F('id') + offset)
+    start = offset + (Tombstone.objects.aggregate(last=Max('id'))['last'] or 0)
+    SyncCounter.objects.bulk_create([SyncCounter(user_id=user_id, value=start)
+                                     for user_id in User.objects.values_list('id', flat=True)], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mobile_reports', '0014_measurement_keyset_index'),
+        ('users', '0002_account_purges'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='tombstone',
+            name='mobile_repo_user_id_54ab7d_idx',
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='sync_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='sync_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='sync_version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_sync_versions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['user', 'sync_version'], name='mobile_repo_user_id_20823b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testresult',
+            index=models.Index(fields=['user', 'sync_version'], name='mobile_repo_user_id_ba5ee1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'model', 'sync_version'], name='mobile_repo_user_id_cf0cf8_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mobile_reports', '0015_sync_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='speedtestsession',
+            name='reserved',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
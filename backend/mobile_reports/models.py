@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.transaction import TransactionManagementError
 from django.contrib.auth import get_user_model
 from .utils import *
+from .geo import tile_key
 User = get_user_model()
 
 
@@ -21,11 +24,11 @@ class Device(models.Model):
 
 
 class Measurement(models.Model):
-
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_measurements')
+    # partitioned by month on timestamp on MySQL (see partitions.py), which allows no foreign key constraints
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_measurements', db_constraint=False)
     latitude = models.FloatField()
     longitude = models.FloatField()
-    timestamp = models.DateTimeField(null=True, blank=True,unique=True)
+    timestamp = models.DateTimeField()
     network_type = models.CharField(max_length=15)
     lac = models.CharField(max_length=100, null=True, blank=True)  # Location Area Code
     tac = models.CharField(max_length=100, null=True, blank=True)  # Tracking Area Code
@@ -48,13 +51,29 @@ class Measurement(models.Model):
     web_response = models.BigIntegerField()
     sms_delivery_time = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
+    tile_key = models.BigIntegerField(null=True, blank=True, editable=False)  # quadkey, see geo.tile_key
+    sync_version = models.BigIntegerField(default=0, editable=False)  # see stamp_sync_versions
     class Meta:
         ordering = ['-timestamp']
+        unique_together = ('user', 'timestamp'),  # also the index of a user's rows by time
         indexes = [
-            models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['-timestamp', '-id']),  # everyone's rows in keyset order, for get_all
+            models.Index(fields=['user', 'sync_version']),
             models.Index(fields=['latitude', 'longitude']),
+            models.Index(fields=['user', 'tile_key']),
+            models.Index(fields=['tile_key']),
+            models.Index(fields=['user', 'network_type']),
         ]
         
+    def set_tile_key(self):
+        self.tile_key = tile_key(self.latitude, self.longitude)
+        
+    def save(self, *args, **kwargs):
+        self.set_tile_key()
+        fill_frequencies([self])
+        with transaction.atomic():
+            stamp_sync_versions([self])
+            super().save(*args, **sync_version_saved(kwargs))
         
     def __str__(self):
         return f"Measurement at {self.timestamp} by {self.user}"
@@ -77,12 +96,244 @@ class TestResult(models.Model):
     success = models.BooleanField()
     additional_info = models.JSONField(null=True, blank=True) 
     created_at = models.DateTimeField(auto_now_add=True)
+    sync_version = models.BigIntegerField(default=0, editable=False)  # see stamp_sync_versions
     class Meta:
         ordering = ['-timestamp']
         unique_together = ('user', 'timestamp'),
         indexes = [
             models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['user', 'sync_version']),
             ]
     
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            stamp_sync_versions([self])
+            super().save(*args, **sync_version_saved(kwargs))
+    
+    def __str__(self):
+        return f"{self.test_type} Test - {self.value}"
+
+
+class MeasurementRollup(models.Model):
+    # metrics aggregated per bucket, each with its own count since any of them can be missing
+    METRICS = ('rsrp', 'rsrq', 'ping_time', 'http_download', 'http_upload')
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    bucket = models.DateTimeField()
+    network_type = models.CharField(max_length=15)
+    cell_id = models.CharField(max_length=100, blank=True, default='')  # '' when the cell is unknown
+    count = models.BigIntegerField(default=0)
+    rsrp_count = models.BigIntegerField(default=0)
+    rsrp_sum = models.FloatField(default=0)
+    rsrp_min = models.FloatField(null=True, blank=True)
+    rsrp_max = models.FloatField(null=True, blank=True)
+    rsrq_count = models.BigIntegerField(default=0)
+    rsrq_sum = models.FloatField(default=0)
+    rsrq_min = models.FloatField(null=True, blank=True)
+    rsrq_max = models.FloatField(null=True, blank=True)
+    ping_time_count = models.BigIntegerField(default=0)
+    ping_time_sum = models.FloatField(default=0)
+    ping_time_min = models.FloatField(null=True, blank=True)
+    ping_time_max = models.FloatField(null=True, blank=True)
+    http_download_count = models.BigIntegerField(default=0)
+    http_download_sum = models.FloatField(default=0)
+    http_download_min = models.FloatField(null=True, blank=True)
+    http_download_max = models.FloatField(null=True, blank=True)
+    http_upload_count = models.BigIntegerField(default=0)
+    http_upload_sum = models.FloatField(default=0)
+    http_upload_min = models.FloatField(null=True, blank=True)
+    http_upload_max = models.FloatField(null=True, blank=True)
+    class Meta:
+        abstract = True
+        ordering = ['bucket']
+        unique_together = ('user', 'bucket', 'network_type', 'cell_id'),
+        
+    def __str__(self):
+        return f"{self.count} {self.network_type} measurements at {self.bucket} by {self.user}"
+
+
+
+class HourlyMeasurementRollup(MeasurementRollup):
+    pass
+
+
+
+class DailyMeasurementRollup(MeasurementRollup):
+    pass
+
+
+
+class UserNetworkType(models.Model):
+    # distinct network types each user has measurements of, kept up to date by network_types.py
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='network_types')
+    network_type = models.CharField(max_length=15)
+    class Meta:
+        ordering = ['network_type']
+        unique_together = ('user', 'network_type'),
+        indexes = [
+            models.Index(fields=['network_type']),
+        ]
+        
+    def __str__(self):
+        return f"{self.network_type} measured by {self.user}"
+
+
+
+class Tombstone(models.Model):
+    # ids of deleted measurements and test results, so delta sync can report deletions (see sync.py)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    model = models.CharField(max_length=30)  # model_name of the deleted row
+    row_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    sync_version = models.BigIntegerField(default=0)  # see stamp_sync_versions
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'model', 'sync_version']),
+            models.Index(fields=['deleted_at']),
+        ]
+        
+    def __str__(self):
+        return f"{self.model} {self.row_id} deleted at {self.deleted_at}"
+
+
+
+class IngestJob(models.Model):
+    # a queued bulk upload, stored by the upload endpoint and run by the process_ingest_jobs command
+    KINDS = {
+        'measurement': 'measurement',
+        'test_report': 'test_report',
+    }
+    STATUSES = {
+        'pending': 'pending',
+        'running': 'running',
+        'done': 'done',
+        'failed': 'failed',
+    }
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ingest_jobs')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    payload = models.BinaryField(blank=True)  # zlib-compressed JSON of the upload, emptied once it is stored
+    rows = models.IntegerField(default=0)
+    validated = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    duplicates = models.IntegerField(default=0)
+    rejected = models.JSONField(default=list, blank=True)  # rows skipped with accept_partial
+    errors = models.JSONField(null=True, blank=True)  # why a failed job was not stored, per row where it applies
+    detail = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+        
+    def __str__(self):
+        return f"{self.kind} upload {self.id} of {self.user} ({self.status})"
+
+
+
+class SpeedTestSession(models.Model):
+    # a multi-stream speed test, the streams are run against it and combined by finish (see speedtest.py)
+    DIRECTIONS = {
+        'download': 'download',
+        'upload': 'upload',
+    }
+    TEST_TYPES = {
+        'download': 'HTTPD',
+        'upload': 'HTTPU',
+    }
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='speed_tests')
+    direction = models.CharField(max_length=10, choices=DIRECTIONS)
+    streams = models.PositiveSmallIntegerField()
+    stream_bytes = models.BigIntegerField()  # size of each download stream
+    warmup_ms = models.PositiveIntegerField()
+    reserved = models.PositiveSmallIntegerField(default=0)  # streams started, counted before they run
+    is_finished = models.BooleanField(default=False)
+    result = models.OneToOneField(TestResult, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        ordering = ['-created_at']
+        
+    def __str__(self):
+        return f"{self.streams} stream {self.direction} test of {self.user}"
+
+
+
+class SpeedTestStream(models.Model):
+    session = models.ForeignKey(SpeedTestSession, on_delete=models.CASCADE, related_name='transfers')
+    bytes = models.BigIntegerField()
+    started_at = models.FloatField()  # epoch seconds, comparable between workers
+    finished_at = models.FloatField()
+    samples = models.JSONField(default=list)  # [[epoch seconds, bytes so far], ...]
+    
     def __str__(self):
-        return f"{self.test_type} Test - {self.value}"
\ No newline at end of file
+        return f"{self.bytes} bytes of {self.session}"
+
+
+
+class MeasurementArchive(models.Model):
+    # one Parquet file of measurements moved out of the measurement table by archive_measurements, see archive.py
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    month = models.DateField()  # first day of the month the rows are from
+    path = models.CharField(max_length=255, unique=True)  # relative to MEASUREMENT_ARCHIVE_ROOT
+    rows = models.IntegerField()
+    size = models.BigIntegerField()  # bytes on disk
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        ordering = ['-last_timestamp']
+        indexes = [
+            models.Index(fields=['user', 'last_timestamp']),
+        ]
+        
+    def __str__(self):
+        return f"{self.rows} measurements of {self.month:%Y-%m} in {self.path}"
+
+
+
+class SyncCounter(models.Model):
+    # the last sync version handed out to a row of the user
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"sync version {self.value} of {self.user}"
+
+
+def reserve_sync_versions(user_id, count):
+    """
+    Reserve `count` consecutive sync versions of a user and return the last one, in the transaction
+    that writes the rows; the counter row stays locked until commit, so versions become visible in order.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise TransactionManagementError('sync versions must be reserved inside the writing transaction')
+    counter = SyncCounter.objects.filter(user_id=user_id)
+    if not counter.update(value=F('value') + count):
+        SyncCounter.objects.get_or_create(user_id=user_id)  # the first row of a new user
+        counter.update(value=F('value') + count)
+    return counter.values_list('value', flat=True).get()
+
+
+def stamp_sync_versions(rows):
+    """Give each of `rows` a new sync version of its user (see sync.changes), users are locked in id order."""
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row.user_id, []).append(row)
+    for user_id in sorted(by_user):
+        user_rows = by_user[user_id]
+        last = reserve_sync_versions(user_id, len(user_rows))
+        for version, row in enumerate(user_rows, last - len(user_rows) + 1):
+            row.sync_version = version
+
+
+def sync_version_saved(kwargs):
+    # a save limited to some fields still has to store the new version
+    if kwargs.get('update_fields') is not None:
+        kwargs['update_fields'] = {*kwargs['update_fields'], 'sync_version'}
+    return kwargs
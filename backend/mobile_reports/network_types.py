@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.dispatch import receiver
+from users.purge import account_purged
+from .models import Measurement, UserNetworkType
+from .signals import rows_ingested
+
+
+def cache_key(user_id=None):
+    return f'network_types:{"all" if user_id is None else f"user:{user_id}"}'
+
+
+def network_types(user_id=None):
+    """
+    Sorted distinct network types of one user's measurements, or everyone's when `user_id` is None,
+    cached for NETWORK_TYPES_CACHE_TIMEOUT seconds and read from UserNetworkType on a miss.
+    """
+    key = cache_key(user_id)
+    types = cache.get(key)
+    if types is None:
+        queryset = UserNetworkType.objects.all()
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        types = list(queryset.order_by('network_type').values_list('network_type', flat=True).distinct())
+        cache.set(key, types, settings.NETWORK_TYPES_CACHE_TIMEOUT)
+    return types
+
+
+def invalidate(user_ids):
+    cache.delete_many([cache_key(user_id) for user_id in user_ids] + [cache_key()])
+
+
+@receiver(rows_ingested, sender=Measurement)
+def record_network_types(sender, rows, **kwargs):
+    # the table rather than the cache decides what is new, a cached list may be out of date;
+    # nearly every upload only repeats types the user already has, that is one indexed read
+    pairs = {(row.user_id, row.network_type) for row in rows}
+    query = Q()
+    for user_id in {user_id for user_id, _ in pairs}:
+        query |= Q(user_id=user_id, network_type__in=[network_type for owner, network_type in pairs
+                                                      if owner == user_id])
+    known = set(UserNetworkType.objects.filter(query).values_list('user_id', 'network_type'))
+    new = [UserNetworkType(user_id=user_id, network_type=network_type) for user_id, network_type in pairs - known]
+    if new:
+        UserNetworkType.objects.bulk_create(new, ignore_conflicts=True)
+        user_ids = {row.user_id for row in new}
+        transaction.on_commit(lambda: invalidate(user_ids))
+
+
+@receiver(account_purged)
+def forget_network_types(sender, account_id, **kwargs):
+    transaction.on_commit(lambda: invalidate([account_id]))
+
+
+def refresh_network_types(user_id):
+    """Recompute the network types of a user from the measurements, call after deleting measurements."""
+    with transaction.atomic():
+        types = set(Measurement.objects.filter(user_id=user_id).order_by()
+                               .values_list('network_type', flat=True).distinct())
+        known = set(UserNetworkType.objects.filter(user_id=user_id).values_list('network_type', flat=True))
+        if known - types:
+            UserNetworkType.objects.filter(user_id=user_id, network_type__in=known - types).delete()
+        if types - known:
+            UserNetworkType.objects.bulk_create([UserNetworkType(user_id=user_id, network_type=network_type)
+                                                 for network_type in types - known], ignore_conflicts=True)
+        transaction.on_commit(lambda: invalidate([user_id]))
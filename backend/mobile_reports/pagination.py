@@ -0,0 +1,129 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in cursor pagination keyed on (timestamp, id), newest first: one index range scan per page,
+    no OFFSET or COUNT(*). Without `page_size` or `cursor` the whole queryset is returned.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    ordering = ('-timestamp', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_query_param not in request.query_params
+                and self.page_size_query_param not in request.query_params):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(*cursor, queryset.model._meta.get_field('timestamp').null))
+
+        # fetch one extra row to know whether a next page exists without counting
+        results = list(queryset[:self.page_size + 1])
+        archived_rows = getattr(view, 'archived_rows', None)
+        if archived_rows is not None:
+            # rows moved to cold storage (see archive.py) belong on the page if they sort before the last row
+            floor = self.key(results[-1]) if len(results) > self.page_size else None
+            results = sorted(results + archived_rows(cursor, floor, self.page_size + 1),
+                             key=self.key, reverse=True)[:self.page_size + 1]
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(*self.key(self.page[-1])))
+
+    @staticmethod
+    def key(row):
+        if isinstance(row, dict):
+            return row['timestamp'], row['id']
+        return row.timestamp, row.pk
+
+    @staticmethod
+    def after(timestamp, pk, nullable=False):
+        # rows strictly after the cursor in (timestamp DESC, id DESC) order; only test results may
+        # have no timestamp, those sort last in descending order on MySQL and SQLite
+        if timestamp is None:
+            return Q(timestamp__isnull=True, id__lt=pk)
+        after = Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+        return after | Q(timestamp__isnull=True) if nullable else after
+
+    def encode_cursor(self, timestamp, pk):
+        payload = {'t': timestamp.isoformat() if timestamp else None, 'i': pk}
+        encoded = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode())
+        return encoded.decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            timestamp = parse_datetime(payload['t']) if payload['t'] is not None else None
+            pk = int(payload['i'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if payload['t'] is not None and timestamp is None:
+            raise NotFound(self.invalid_cursor_message)
+        return timestamp, pk
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
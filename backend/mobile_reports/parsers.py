@@ -0,0 +1,61 @@
+import io
+import zlib
+import msgpack
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+DECOMPRESS_CHUNK_SIZE = 64 * 1024
+
+
+def decompressed(stream, parser_context):
+    """
+    Return `stream` gunzipped when it was sent with `Content-Encoding: gzip`, capped at
+    BULK_UPLOAD_MAX_DECOMPRESSED_SIZE.
+    """
+    request = (parser_context or {}).get('request')
+    encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower() if request is not None else ''
+    if encoding in ('', 'identity'):
+        return stream
+    if encoding != 'gzip':
+        raise ParseError(f'unsupported content encoding "{encoding}"')
+
+    limit = settings.BULK_UPLOAD_MAX_DECOMPRESSED_SIZE
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    output = io.BytesIO()
+    try:
+        while chunk := stream.read(DECOMPRESS_CHUNK_SIZE):
+            output.write(decompressor.decompress(chunk, limit + 1 - output.tell()))
+            if output.tell() > limit:
+                raise ParseError('decompressed request body is too large')
+        output.write(decompressor.flush())
+    except zlib.error as exc:
+        raise ParseError(f'gzip decode error - {exc}')
+    output.seek(0)
+    return output
+
+
+class GzipJSONParser(JSONParser):
+    """
+    JSON parser that also accepts gzip-compressed bodies.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return super().parse(decompressed(stream, parser_context), media_type, parser_context)
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack bodies, optionally gzip-compressed.
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(decompressed(stream, parser_context).read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class XMessagePackParser(MessagePackParser):
+    media_type = 'application/x-msgpack'
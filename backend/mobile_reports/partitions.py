@@ -0,0 +1,137 @@
+from datetime import datetime, timezone as dt_timezone
+from django.db import connection
+
+# Measurement is range partitioned by month on `timestamp` on MySQL, see migration 0012.
+# Bounds are UTC, the way USE_TZ stores datetimes.
+TABLE = 'mobile_reports_measurement'
+CATCH_ALL = 'pmax'
+# the first layout gives older rows a single partition instead of one per month
+INITIAL_MONTHS = 24
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'p{month:%Y%m}'
+
+
+def partition_sql(name, bound):
+    """A RANGE COLUMNS partition holding rows before `bound`, or every remaining row for None."""
+    if bound is None:
+        return f'PARTITION {name} VALUES LESS THAN (MAXVALUE)'
+    return f"PARTITION {name} VALUES LESS THAN ('{bound:{DATETIME_FORMAT}}')"
+
+
+def monthly_partitions(first, last):
+    """Partitions for the months `first` to `last` included, each named after its month."""
+    months = []
+    month = first
+    while month <= last:
+        months.append(partition_sql(partition_name(month), add_months(month, 1)))
+        month = add_months(month, 1)
+    return months
+
+
+def initial_layout(oldest, now, ahead):
+    """
+    PARTITION BY clause for a table whose oldest row is at `oldest` (None when empty): monthly
+    partitions up to `ahead` months ahead, at most INITIAL_MONTHS back, one for older rows and pmax.
+    """
+    current = month_start(now)
+    first = add_months(current, -INITIAL_MONTHS)
+    partitions = []
+    if oldest is None:
+        first = current
+    elif oldest < first:
+        partitions.append(partition_sql(f'p{add_months(first, -1):%Y%m}_older', first))
+    else:
+        first = month_start(oldest)
+    partitions += monthly_partitions(first, add_months(current, ahead))
+    partitions.append(partition_sql(CATCH_ALL, None))
+    return f'PARTITION BY RANGE COLUMNS(`timestamp`) ({", ".join(partitions)})'
+
+
+def existing_partitions():
+    """(name, upper bound) of the partitions of the table in order, the bound is None for the catch-all."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS '
+                       'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL '
+                       'ORDER BY PARTITION_ORDINAL_POSITION', [TABLE])
+        rows = cursor.fetchall()
+    return [(name, None if description == 'MAXVALUE' else datetime.strptime(description.strip("'"), DATETIME_FORMAT))
+            for name, description in rows]
+
+
+def future_statements(partitions, now, ahead):
+    """
+    Split the catch-all, empty unless rows are far in the future, so there is a partition for each
+    month up to `ahead` months from now.
+    """
+    bounds = [bound for _, bound in partitions if bound is not None]
+    last = add_months(month_start(now), ahead)
+    first = max(bounds) if bounds else month_start(now)  # the month after the last partition
+    if first > last:
+        return []
+    new = monthly_partitions(first, last) + [partition_sql(CATCH_ALL, None)]
+    return [f'ALTER TABLE `{TABLE}` REORGANIZE PARTITION {CATCH_ALL} INTO ({", ".join(new)})']
+
+
+def retention_cutoff(now, months):
+    """Start of the oldest month kept when `months` full months are kept before the current one."""
+    return add_months(month_start(now), -months)
+
+
+def expired_partitions(partitions, cutoff):
+    """Partitions whose rows are all older than `cutoff`."""
+    return [name for name, bound in partitions if bound is not None and bound <= cutoff]
+
+
+def detached_table(name):
+    return f'{TABLE}_detached_{name}'
+
+
+def detach_statements(name):
+    """
+    Swap the rows of partition `name` into a table of their own with EXCHANGE PARTITION, a metadata
+    change whatever its size, so they can be tombstoned before the partition is dropped.
+    """
+    return [
+        f'CREATE TABLE `{detached_table(name)}` LIKE `{TABLE}`',
+        f'ALTER TABLE `{detached_table(name)}` REMOVE PARTITIONING',
+        f'ALTER TABLE `{TABLE}` EXCHANGE PARTITION {name} WITH TABLE `{detached_table(name)}`',
+    ]
+
+
+def detached_rows(name, chunk_size):
+    """(id, user_id, timestamp) of the rows swapped out of partition `name`, in lists of `chunk_size`."""
+    last_id = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT `id`, `user_id`, `timestamp` FROM `{detached_table(name)}` WHERE `id` > %s '
+                           f'ORDER BY `id` LIMIT %s', [last_id, chunk_size])
+            chunk = cursor.fetchall()
+        if not chunk:
+            return
+        # a raw cursor returns the stored UTC datetimes naive
+        yield [(pk, user_id, timestamp.replace(tzinfo=dt_timezone.utc)) for pk, user_id, timestamp in chunk]
+        last_id = chunk[-1][0]
+
+
+def expire_statements(name, detached):
+    """Drop the emptied partition `name`, and the table its rows were `detached` into, if any."""
+    statements = [f'ALTER TABLE `{TABLE}` DROP PARTITION {name}']
+    if detached:
+        statements.append(f'DROP TABLE `{detached_table(name)}`')
+    return statements
+
+
+def utc_now():
+    return datetime.now(dt_timezone.utc).replace(tzinfo=None)
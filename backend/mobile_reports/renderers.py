@@ -0,0 +1,29 @@
+import json
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets `text/event-stream` clients negotiate the live endpoint. The stream itself is a
+    StreamingHttpResponse, this only renders the error responses, as a single `error` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f'event: error\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n'.encode()
+
+
+class OctetStreamRenderer(BaseRenderer):
+    """
+    Lets `application/octet-stream` clients negotiate the HTTP test endpoints, whose bodies are
+    streamed directly. Error responses are rendered as JSON.
+    """
+    media_type = 'application/octet-stream'
+    format = 'bin'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=JSONEncoder).encode()
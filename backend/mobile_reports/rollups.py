@@ -0,0 +1,196 @@
+from datetime import timedelta, timezone as dt_timezone
+from django.db import connection, transaction
+from django.db.models import Count, FloatField, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+from django.dispatch import receiver
+from .archive import archived_between
+from .models import Measurement, MeasurementRollup, HourlyMeasurementRollup, DailyMeasurementRollup
+from .signals import rows_deleted, rows_ingested
+
+METRICS = MeasurementRollup.METRICS
+# timings are -1 when the test did not run, keep them out of the aggregates
+TIMING_METRICS = ('ping_time', 'http_download', 'http_upload')
+KEY_FIELDS = ('user_id', 'bucket', 'network_type', 'cell_id')
+VALUE_FIELDS = ('count',) + tuple(f'{metric}_{part}' for metric in METRICS for part in ('count', 'sum', 'min', 'max'))
+UPSERT_BATCH_SIZE = 500
+
+
+def truncate_hour(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def truncate_day(timestamp):
+    return truncate_hour(timestamp).replace(hour=0)
+
+
+GRANULARITIES = {
+    'hour': (HourlyMeasurementRollup, truncate_hour, TruncHour),
+    'day': (DailyMeasurementRollup, truncate_day, TruncDay),
+}
+
+
+def metric_value(measurement, metric):
+    value = getattr(measurement, metric)
+    if value is None or (metric in TIMING_METRICS and value < 0):
+        return None
+    return value
+
+
+def aggregate(measurements, truncate):
+    """Fold measurements into {(user_id, bucket, network_type, cell_id): {field: value}}."""
+    groups = {}
+    for measurement in measurements:
+        key = (measurement.user_id, truncate(measurement.timestamp),
+               measurement.network_type, measurement.cell_id or '')
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = dict.fromkeys(VALUE_FIELDS, 0)
+            for metric in METRICS:
+                group[f'{metric}_min'] = group[f'{metric}_max'] = None
+        group['count'] += 1
+        for metric in METRICS:
+            value = metric_value(measurement, metric)
+            if value is None:
+                continue
+            group[f'{metric}_count'] += 1
+            group[f'{metric}_sum'] += value
+            low, high = group[f'{metric}_min'], group[f'{metric}_max']
+            group[f'{metric}_min'] = value if low is None or value < low else low
+            group[f'{metric}_max'] = value if high is None or value > high else high
+    return groups
+
+
+def merge_sql(column, existing, new):
+    if column.endswith(('_min', '_max')):
+        function = {('mysql', '_min'): 'LEAST', ('mysql', '_max'): 'GREATEST',
+                    ('postgresql', '_min'): 'LEAST', ('postgresql', '_max'): 'GREATEST',
+                    ('sqlite', '_min'): 'MIN', ('sqlite', '_max'): 'MAX'}[connection.vendor, column[-4:]]
+        # either side may be NULL when a bucket had no value for the metric
+        return f'{function}(COALESCE({existing}, {new}), COALESCE({new}, {existing}))'
+    return f'{existing} + {new}'
+
+
+def upsert(model, groups):
+    """
+    Add `groups` onto the stored rollups with one INSERT ... ON DUPLICATE KEY UPDATE per batch, so
+    concurrent uploads into a bucket cannot overwrite each other.
+    """
+    if not groups:
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = KEY_FIELDS + VALUE_FIELDS
+    if connection.vendor == 'mysql':
+        conflict = 'ON DUPLICATE KEY UPDATE ' + ', '.join(
+            f'{quote(c)} = {merge_sql(c, quote(c), f"VALUES({quote(c)})")}' for c in VALUE_FIELDS)
+    else:
+        conflict = (f'ON CONFLICT ({", ".join(quote(c) for c in KEY_FIELDS)}) DO UPDATE SET ' + ', '.join(
+            f'{quote(c)} = {merge_sql(c, f"{table}.{quote(c)}", f"excluded.{quote(c)}")}' for c in VALUE_FIELDS))
+    row_sql = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    items = sorted(groups.items(), key=lambda item: item[0][:2])  # stable lock order between writers
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_BATCH_SIZE):
+            batch = items[start:start + UPSERT_BATCH_SIZE]
+            params = []
+            for (user_id, bucket, network_type, cell_id), values in batch:
+                params += [user_id, connection.ops.adapt_datetimefield_value(bucket), network_type, cell_id]
+                params += [values[field] for field in VALUE_FIELDS]
+            cursor.execute(f'INSERT INTO {table} ({", ".join(quote(c) for c in columns)}) '
+                           f'VALUES {", ".join([row_sql] * len(batch))} {conflict}', params)
+
+
+@receiver(rows_ingested, sender=Measurement)
+def update_rollups(sender, rows, **kwargs):
+    for model, truncate, _ in GRANULARITIES.values():
+        upsert(model, aggregate(rows, truncate))
+
+
+def combine(queryset, *group_by):
+    """Merge rollup rows per `group_by`: counts and sums add up, min/max take the extreme."""
+    # annotated under an alias since the names clash with the model fields
+    aggregates = {f'agg_{field}': (Min if field.endswith('_min') else Max if field.endswith('_max') else Sum)(field)
+                  for field in VALUE_FIELDS}
+    for row in queryset.values(*group_by).order_by(*group_by).annotate(**aggregates):
+        yield {key[4:] if key.startswith('agg_') else key: value for key, value in row.items()}
+
+
+def rebuild(user, start=None, end=None):
+    """
+    Recompute the rollups of `user` (or its id) from its measurements, archived ones included, for
+    every day or the whole UTC days from `start` until before `end`.
+    """
+    user_id = getattr(user, 'pk', user)
+    span, buckets = {}, {}
+    if start is not None:
+        span['timestamp__gte'] = buckets['bucket__gte'] = start
+    if end is not None:
+        span['timestamp__lt'] = buckets['bucket__lt'] = end
+    measurements = (Measurement.objects.filter(user_id=user_id, **span)
+                    .annotate(bucket=TruncHour('timestamp'), cell=Coalesce('cell_id', Value('')))
+                    .values('bucket', 'network_type', 'cell').order_by())
+    aggregates = {'count': Count('id')}
+    for metric in METRICS:
+        present = Q(**{f'{metric}__isnull': False})
+        if metric in TIMING_METRICS:
+            present &= Q(**{f'{metric}__gte': 0})
+        aggregates.update({
+            f'{metric}_count': Count(metric, filter=present),
+            f'{metric}_sum': Coalesce(Sum(metric, filter=present, output_field=FloatField()), Value(0.0)),
+            f'{metric}_min': Min(metric, filter=present),
+            f'{metric}_max': Max(metric, filter=present),
+        })
+
+    with transaction.atomic():
+        for model, _, _ in GRANULARITIES.values():
+            model.objects.filter(user_id=user_id, **buckets).delete()
+        HourlyMeasurementRollup.objects.bulk_create(
+            [HourlyMeasurementRollup(user_id=user_id, cell_id=row.pop('cell'), **row)
+             for row in measurements.annotate(**aggregates).iterator()],
+            batch_size=UPSERT_BATCH_SIZE)
+        upsert(HourlyMeasurementRollup, aggregate(archived_between(user_id, start, end), truncate_hour))
+
+        daily = combine(HourlyMeasurementRollup.objects.filter(user_id=user_id, **buckets).annotate(day=TruncDay('bucket')),
+                        'day', 'network_type', 'cell_id')
+        DailyMeasurementRollup.objects.bulk_create(
+            [DailyMeasurementRollup(user_id=user_id, bucket=row.pop('day'), **row) for row in daily],
+            batch_size=UPSERT_BATCH_SIZE)
+
+
+@receiver(rows_deleted, sender=Measurement)
+def remove_from_rollups(sender, rows, moved, **kwargs):
+    # rows moved to the archive still count; min and max cannot be taken back, the days are recomputed
+    if moved:
+        return
+    days = {}
+    for _, user_id, timestamp in rows:
+        days.setdefault(user_id, set()).add(truncate_day(timestamp))
+    for user_id, user_days in days.items():
+        rebuild(user_id, min(user_days), max(user_days) + timedelta(days=1))
+
+
+def filter_rollups(queryset, network_type=None, start=None, end=None):
+    queryset = queryset.exclude(network_type='UNKNOWN')
+    if network_type:
+        queryset = queryset.filter(network_type=network_type)
+    if start:
+        queryset = queryset.filter(bucket__gte=start)
+    if end:
+        queryset = queryset.filter(bucket__lte=end)
+    return queryset
+
+
+def rollup_series(queryset):
+    """Rollups summed over cells per (bucket, network_type), with avg/min/max for each metric."""
+    series = []
+    for row in combine(queryset, 'bucket', 'network_type'):
+        item = {'bucket': row['bucket'], 'network_type': row['network_type'], 'count': row['count']}
+        for metric in METRICS:
+            count = row[f'{metric}_count']
+            item[metric] = {
+                'avg': row[f'{metric}_sum'] / count if count else None,
+                'min': row[f'{metric}_min'],
+                'max': row[f'{metric}_max'],
+            }
+        series.append(item)
+    return series
@@ -1,5 +1,17 @@
+from collections.abc import Mapping
 from rest_framework import serializers
 from .models import *
+from .ingest import bulk_insert, ON_CONFLICT_CHOICES
+from .utils import fill_frequencies
+from .validators import ColumnarValidator, MEASUREMENT_RANGES, SignalFieldsMixin
+from .stats import TIME_BUCKETS
+from .tiles import GRID_SIZES, MAX_ZOOM
+from .speedtest import DEFAULT_DOWNLOAD_SIZE
+from django.conf import settings
+
+# the table is partitioned on timestamp (see partitions.py), a measurement without one is refused with 400
+MEASUREMENT_FIELDS = {**MEASUREMENT_RANGES,
+                      'timestamp': {'help_text': 'Required, uploads without it are rejected with 400.'}}
 
 class ProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -17,11 +29,12 @@ class DeviceSerializer(serializers.ModelSerializer):
 
 
 
-class MeasurementSerializer(serializers.ModelSerializer):
+class MeasurementSerializer(SignalFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Measurement
         fields = '__all__'
         read_only_fields = ['id','user','created_at']
+        extra_kwargs = MEASUREMENT_FIELDS
 
 
 
@@ -33,11 +46,12 @@ class TestResultSerializer(serializers.ModelSerializer):
         
         
         
-class BulkMeasurementSerializer(serializers.ModelSerializer):
+class BulkMeasurementSerializer(SignalFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Measurement
         exclude = ['user']
         read_only_fields = ['id','created_at']
+        extra_kwargs = MEASUREMENT_FIELDS
         
         
         
@@ -49,31 +63,213 @@ class BulkTestResultSerializer(serializers.ModelSerializer):
         
 
         
-class BulkUploadMeasurementSerializer(serializers.Serializer):
-    measurements = serializers.ListField(child=BulkMeasurementSerializer())
+class BulkRowsField(serializers.ListField):
+    """
+    ListField of rows, also accepted as {'columns', 'rows'}, that with `accept_partial` leaves invalid
+    rows out and lists them in `rejected`; with `columnar` it can validate through ColumnarValidator.
+    """
+    accept_partial = False
+    default_error_messages = {
+        'columns': 'Expected "columns" to be a list of field names and "rows" a list of lists of the same length.',
+    }
+    
+    def __init__(self, *args, columnar=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.columnar = ColumnarValidator(type(self.child)) if columnar else None
+    
+    def to_internal_value(self, data):
+        if isinstance(data, Mapping) and 'columns' in data:
+            data = self.expand_columns(data)
+        return super().to_internal_value(data)
+    
+    def expand_columns(self, data):
+        columns, rows = data.get('columns'), data.get('rows')
+        if not isinstance(columns, list) or not all(isinstance(name, str) for name in columns) or not isinstance(rows, list):
+            self.fail('columns')
+        width = len(columns)
+        if not all(isinstance(row, list) and len(row) == width for row in rows):
+            self.fail('columns')
+        return [dict(zip(columns, row)) for row in rows]
+    
+    def run_child_validation(self, data):
+        if self.columnar is not None and settings.BULK_VALIDATION_ENGINE == 'columnar':
+            result, errors = self.columnar.validate(data)
+        elif self.accept_partial:
+            result, errors = [], {}
+            for index, item in enumerate(data):
+                try:
+                    result.append(self.child.run_validation(item))
+                except serializers.ValidationError as e:
+                    errors[index] = e.detail
+        else:
+            return super().run_child_validation(data)
+        
+        if errors and not self.accept_partial:
+            raise serializers.ValidationError(errors)
+        self.rejected = [{'index': index, 'errors': detail} for index, detail in errors.items()]
+        return result
 
-    def create(self, validated_data):
-        created_measurement = []
 
-        
-        for measurement_data in validated_data['measurements']:
-            measurement = Measurement.objects.create(user=self.context['user'],**measurement_data)
-            created_measurement.append(measurement)
+
+class QueuedRowsField(BulkRowsField):
+    """
+    Rows of an upload that is queued, only the shape is checked, the fields are validated by the job.
+    """
+    default_error_messages = {
+        'row': 'Expected every row to be an object.',
+    }
+    
+    def run_child_validation(self, data):
+        if not all(isinstance(row, Mapping) for row in data):
+            self.fail('row')
+        return data
+
+
+
+class BulkUploadSerializer(serializers.Serializer):
+    rows_field = None
+    # 'ignore' makes uploads idempotent: rows already stored for (user, timestamp) are counted as duplicates
+    on_conflict = serializers.ChoiceField(choices=ON_CONFLICT_CHOICES, default='error')
+    # insert the valid rows and report the invalid ones instead of rejecting the whole upload
+    accept_partial = serializers.BooleanField(default=False)
+    
+    def to_internal_value(self, data):
+        if isinstance(data, Mapping):
+            try:
+                accept_partial = self.fields['accept_partial'].run_validation(data.get('accept_partial', serializers.empty))
+            except serializers.ValidationError:
+                accept_partial = False  # reported by the regular validation below
+            self.fields[self.rows_field].accept_partial = accept_partial
+        return super().to_internal_value(data)
+    
+    @classmethod
+    def envelope(cls, *args, **kwargs):
+        """This serializer with its rows only checked for shape, to queue the upload."""
+        serializer = cls(*args, **kwargs)
+        serializer.fields[cls.rows_field] = QueuedRowsField()
+        return serializer
+    
+    @property
+    def rejected(self):
+        return getattr(self.fields[self.rows_field], 'rejected', [])
+    
+    @property
+    def created_count(self):
+        return sum(batch['rows'] for batch in self.batch_timings)
+    
+    @property
+    def duplicate_count(self):
+        return sum(batch.get('duplicates', 0) for batch in self.batch_timings)
+
+
+
+class BulkUploadMeasurementSerializer(BulkUploadSerializer):
+    rows_field = 'measurements'
+    measurements = BulkRowsField(child=BulkMeasurementSerializer(), columnar=True)
+
+    def create(self, validated_data):
+        created_measurement = [Measurement(user=self.context['user'],**measurement_data)
+                               for measurement_data in validated_data['measurements']]
+        for measurement in created_measurement:
+            measurement.set_tile_key()  # bulk_create does not call save()
+        fill_frequencies(created_measurement)
+        self.batch_timings = bulk_insert(Measurement, created_measurement,
+                                         ignore_conflicts=validated_data['on_conflict'] == 'ignore')
         return created_measurement
     
 
 
-class BulkUploadTestResultSerializer(serializers.Serializer):
-    test_results = serializers.ListField(child=BulkTestResultSerializer())
+class BulkUploadTestResultSerializer(BulkUploadSerializer):
+    rows_field = 'test_results'
+    test_results = BulkRowsField(child=BulkTestResultSerializer())
     def create(self, validated_data):
-        created_test_result = []
-        
-        for test_data in validated_data['test_results']:
-            test_result = TestResult.objects.create(user=self.context['user'],**test_data)
-            created_test_result.append(test_result)
+        created_test_result = [TestResult(user=self.context['user'],**test_data)
+                               for test_data in validated_data['test_results']]
+        self.batch_timings = bulk_insert(TestResult, created_test_result,
+                                         ignore_conflicts=validated_data['on_conflict'] == 'ignore')
         return created_test_result
     
     
     
+class MeasurementStatsSerializer(serializers.Serializer):
+    network_type = serializers.CharField(required=False)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    utc_offset = serializers.IntegerField(min_value=-14 * 60, max_value=14 * 60, default=0) # minutes, for count_by_hour
+    bucket = serializers.ChoiceField(choices=list(TIME_BUCKETS), default='hour')
+    all = serializers.BooleanField(default=False) # staff only, data of every user that allows admin access
+    
+    
+    
+class MapTileSerializer(serializers.Serializer):
+    z = serializers.IntegerField(min_value=0, max_value=MAX_ZOOM)
+    x = serializers.IntegerField(min_value=0)
+    y = serializers.IntegerField(min_value=0)
+    grid = serializers.ChoiceField(choices=GRID_SIZES, default=16)
+    network_type = serializers.CharField(required=False)
+    all = serializers.BooleanField(default=False) # staff only, data of every user that allows admin access
+    
+    def validate(self, attrs):
+        if attrs['x'] >= 2 ** attrs['z'] or attrs['y'] >= 2 ** attrs['z']:
+            raise serializers.ValidationError('tile is out of range for this zoom level')
+        return attrs
+    
+    
+    
+class BulkUploadModeSerializer(serializers.Serializer):
+    # 'async' queues the upload and answers 202 with a job to poll instead of storing it in the request
+    mode = serializers.ChoiceField(choices=('sync', 'async'), default='sync')
+    
+    
+    
+class IngestJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IngestJob
+        exclude = ['user', 'payload']
+        read_only_fields = [field.name for field in IngestJob._meta.fields]
+    
+    
+    
+class LiveSerializer(serializers.Serializer):
+    all = serializers.BooleanField(default=False) # staff only, data of every user that allows admin access
+    
+    
+    
+class HTTPDownloadSerializer(serializers.Serializer):
+    bytes = serializers.IntegerField(min_value=1, max_value=settings.HTTP_TEST_MAX_BYTES, default=DEFAULT_DOWNLOAD_SIZE)
+    
+    
+    
+class HTTPUploadSerializer(serializers.Serializer):
+    save = serializers.BooleanField(default=False) # store the result as an HTTPU test result
+    
+    
+    
+class SpeedTestSessionSerializer(serializers.ModelSerializer):
+    streams = serializers.IntegerField(min_value=1, max_value=settings.SPEED_TEST_MAX_STREAMS, default=4)
+    stream_bytes = serializers.IntegerField(min_value=1, max_value=settings.HTTP_TEST_MAX_BYTES, default=64 * 1024 * 1024)
+    warmup_ms = serializers.IntegerField(min_value=0, max_value=30000, default=1000)
+    result = TestResultSerializer(read_only=True)
+    class Meta:
+        model = SpeedTestSession
+        fields = ['id', 'direction', 'streams', 'stream_bytes', 'warmup_ms', 'is_finished', 'result', 'created_at']
+        read_only_fields = ['id', 'is_finished', 'result', 'created_at']
+    
+    
+    
 class BulkDeleteSerializer(serializers.Serializer):
-    ids = serializers.ListField(child=serializers.IntegerField())
\ No newline at end of file
+    ids = serializers.ListField(child=serializers.IntegerField())
+    
+    
+    
+class DeleteRangeSerializer(serializers.Serializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    network_type = serializers.CharField(required=False) # measurements only
+    
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError('give a start, an end or a network type, or delete by ids')
+        if 'start' in attrs and 'end' in attrs and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'end': ['end must not be before start']})
+        return attrs
\ No newline at end of file
@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# sent inside the ingest transaction once rows are inserted, with `rows` the new model instances
+rows_ingested = Signal()
+# sent inside the deleting transaction once rows are gone, with `rows` their (id, user_id, timestamp)
+# and `moved` set when they were only moved out of the table, into the archive (see archive.py)
+rows_deleted = Signal()
@@ -0,0 +1,207 @@
+import asyncio
+import os
+import re
+from time import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .ingest import is_duplicate
+from .models import TestResult
+from .signals import rows_ingested
+
+CHUNK_SIZE = 256 * 1024
+# the size the app received before, 512 KiB of random bytes written out as a Python repr
+DEFAULT_DOWNLOAD_SIZE = 2 * 1024 * 1024
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+BODY_TIMING_KEY = 'polaris.body_timing'
+SAMPLE_INTERVAL = 0.1
+
+_chunks = None
+
+
+def payload_chunks():
+    """
+    The download payload: HTTP_TEST_BUFFER_SIZE random bytes generated once per process,
+    split into CHUNK_SIZE bytes objects that are handed to the server as they are.
+    """
+    global _chunks
+    if _chunks is None:
+        size = max(CHUNK_SIZE, settings.HTTP_TEST_BUFFER_SIZE // CHUNK_SIZE * CHUNK_SIZE)
+        buffer = os.urandom(size)
+        _chunks = tuple(buffer[start:start + CHUNK_SIZE] for start in range(0, size, CHUNK_SIZE))
+    return _chunks
+
+
+def iter_payload(start, end):
+    """Bytes `start` to `end` (exclusive) of the payload repeated end to end, with no copying except at the edges."""
+    chunks = payload_chunks()
+    position = start
+    while position < end:
+        chunk = chunks[position // CHUNK_SIZE % len(chunks)]
+        offset = position % CHUNK_SIZE
+        length = min(CHUNK_SIZE - offset, end - position)
+        yield chunk if length == CHUNK_SIZE else chunk[offset:offset + length]
+        position += length
+
+
+def stream_payload(start, end, asynchronous, on_finish=None):
+    """
+    Body iterator for bytes `start` to `end` of the payload, timed as a Transfer passed to `on_finish`;
+    `asynchronous` under ASGI, for the reason given in streaming.export_stream.
+    """
+    if asynchronous:
+        return aiter_timed(iter_payload(start, end), on_finish)
+    return iter_timed(iter_payload(start, end), on_finish)
+
+
+def iter_timed(chunks, on_finish):
+    transfer = Transfer()
+    try:
+        for chunk in chunks:
+            yield chunk
+            transfer.add(len(chunk))
+    finally:
+        if on_finish is not None:
+            on_finish(transfer.finish())
+
+
+async def aiter_timed(chunks, on_finish):
+    transfer = Transfer()
+    try:
+        for chunk in chunks:
+            yield chunk
+            transfer.add(len(chunk))
+    finally:
+        if on_finish is not None:
+            # still recorded when the client goes away and the response is cancelled
+            await asyncio.shield(sync_to_async(on_finish)(transfer.finish()))
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single `bytes=` range of a `size` byte body, end exclusive; None to serve the
+    whole body, ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':  # the last `last` bytes
+        start, end = max(size - int(last), 0), size
+    else:
+        start, end = int(first), size if last == '' else min(int(last) + 1, size)
+    if start >= size or start >= end:
+        raise ValueError(header)
+    return start, end
+
+
+class Transfer:
+    """Bytes moved by one stream as (wall clock time, bytes so far) samples every SAMPLE_INTERVAL."""
+
+    def __init__(self, started=None, samples=None, finished=None):
+        self.started = time() if started is None else started
+        self.samples = samples or [(self.started, 0)]
+        self.bytes = self.samples[-1][1]
+        self.finished = finished
+
+    def add(self, count):
+        self.bytes += count
+        now = time()
+        if now - self.samples[-1][0] >= SAMPLE_INTERVAL:
+            self.samples.append((now, self.bytes))
+
+    def finish(self):
+        self.finished = time()
+        if self.samples[-1][1] != self.bytes:
+            self.samples.append((self.finished, self.bytes))
+        return self
+
+    @property
+    def seconds(self):
+        return self.finished - self.started
+
+    def bytes_at(self, moment):
+        """Bytes moved by `moment`, interpolated between samples."""
+        previous = (self.started, 0)
+        for sample in self.samples:
+            if sample[0] >= moment:
+                if sample[0] == previous[0]:
+                    return sample[1] if moment >= sample[0] else previous[1]
+                share = (moment - previous[0]) / (sample[0] - previous[0])
+                return previous[1] + max(share, 0) * (sample[1] - previous[1])
+            previous = sample
+        return self.bytes
+
+
+def throughput(transfers, warmup):
+    """
+    Combined throughput of parallel transfers, leaving out the first `warmup` seconds, or nothing
+    when the streams end before that.
+    """
+    start = min(transfer.started for transfer in transfers)
+    end = max(transfer.finished for transfer in transfers)
+    cutoff = start + warmup if start + warmup < end else start
+    total = sum(transfer.bytes - transfer.bytes_at(cutoff) for transfer in transfers)
+    duration = end - cutoff
+    return {
+        'streams': len(transfers),
+        'bytes': round(total),
+        'total_bytes': sum(transfer.bytes for transfer in transfers),
+        'duration_ms': round(duration * 1000, 3),
+        'warmup_ms': round((cutoff - start) * 1000, 3),
+        'throughput_mbps': round(total * 8 / duration / 10**6, 3) if duration > 0 else None,
+    }
+
+
+def save_test_result(user, test_type, result):
+    """Store a server-measured `throughput` result as a TestResult, None if one exists for this instant."""
+    try:
+        with transaction.atomic():
+            instance = TestResult.objects.create(user=user, timestamp=timezone.now(), test_type=test_type,
+                                                 value=result['throughput_mbps'] or 0, success=bool(result['bytes']),
+                                                 additional_info={'source': 'server', **result})
+            rows_ingested.send(sender=TestResult, rows=[instance])
+    except IntegrityError as e:
+        if not is_duplicate(e):
+            raise
+        return None
+    return instance
+
+
+def consume_upload(request):
+    """
+    Read and drop the body of a request, returns its Transfer: the one BodyTimingMiddleware recorded
+    under ASGI, timed here from the socket under WSGI.
+    """
+    transfer = Transfer()
+    while chunk := request.read(CHUNK_SIZE):
+        transfer.add(len(chunk))
+    transfer.finish()
+    received = getattr(request, 'scope', {}).get(BODY_TIMING_KEY)
+    if received is not None and received.finished is not None:
+        return received
+    return transfer
+
+
+class BodyTimingMiddleware:
+    """
+    ASGI middleware recording in the scope, as a Transfer, how the body of each HTTP request arrived.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        transfer = scope[BODY_TIMING_KEY] = Transfer()
+
+        async def timed_receive():
+            message = await receive()
+            if message['type'] == 'http.request':
+                transfer.add(len(message.get('body', b'')))
+                if not message.get('more_body', False):
+                    transfer.finish()
+            return message
+        return await self.app(scope, timed_receive, send)
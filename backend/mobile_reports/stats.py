@@ -0,0 +1,65 @@
+from datetime import timedelta
+from django.db.models import Avg, Count, ExpressionWrapper, DateTimeField, F, Q
+from django.db.models.functions import ExtractHour, TruncDay, TruncHour
+
+TIME_BUCKETS = {
+    'hour': TruncHour,
+    'day': TruncDay,
+}
+SIGNAL_FIELDS = ('rsrp', 'rsrq', 'rscp', 'rxLev')
+
+
+def filter_measurements(queryset, network_type=None, start=None, end=None):
+    # the dashboard never charts UNKNOWN networks
+    queryset = queryset.exclude(network_type='UNKNOWN')
+    if network_type:
+        queryset = queryset.filter(network_type=network_type)
+    if start:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end:
+        queryset = queryset.filter(timestamp__lte=end)
+    return queryset
+
+
+def known(queryset, field):
+    return queryset.exclude(Q(**{f'{field}__isnull': True}) | Q(**{f'{field}__in': ['', 'UNKNOWN']}))
+
+
+def counts_by(queryset, field, top=None):
+    rows = (queryset.filter(**{f'{field}__isnull': False})
+            .values(field).annotate(count=Count('id')).order_by('-count', field))
+    if top:
+        rows = rows[:top]
+    return [{'value': row[field], 'count': row['count']} for row in rows]
+
+
+def count_by_hour(queryset, utc_offset=0):
+    # shift by the client's UTC offset in SQL instead of CONVERT_TZ, which needs MySQL's tz tables
+    local = ExpressionWrapper(F('timestamp') + timedelta(minutes=utc_offset), output_field=DateTimeField())
+    hours = [0] * 24
+    for row in (queryset.annotate(hour=ExtractHour(local))
+                .values('hour').annotate(count=Count('id')).order_by()):
+        hours[row['hour']] = row['count']
+    return hours
+
+
+def signal_over_time(queryset, bucket='hour'):
+    rows = (queryset.annotate(bucket=TIME_BUCKETS[bucket]('timestamp'))
+            .values('bucket').annotate(**{field: Avg(field) for field in SIGNAL_FIELDS}).order_by('bucket'))
+    return [{'timestamp': row['bucket'], **{field: row[field] for field in SIGNAL_FIELDS}} for row in rows]
+
+
+def measurement_stats(queryset, utc_offset=0, bucket='hour', top_cells=5):
+    """
+    Dashboard aggregates computed with GROUP BY in the database, sized by the distinct values and
+    time buckets rather than the number of measurements.
+    """
+    return {
+        'count': queryset.count(),
+        'network_types': counts_by(known(queryset, 'network_type'), 'network_type'),
+        'arfcn': counts_by(queryset.exclude(arfcn=0), 'arfcn'),
+        'frequency_bands': counts_by(known(queryset, 'frequency_band'), 'frequency_band'),
+        'count_by_hour': count_by_hour(queryset, utc_offset),
+        'top_cells': counts_by(known(queryset, 'cell_id'), 'cell_id', top=top_cells),
+        'signal_over_time': signal_over_time(queryset, bucket),
+    }
@@ -0,0 +1,89 @@
+from asgiref.sync import sync_to_async
+from rest_framework.utils.encoders import JSONEncoder
+from .pagination import KeysetPagination
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def model_fields(model):
+    # concrete field names, foreign keys come out of .values() as their pk like in ModelSerializer
+    return [field.name for field in model._meta.concrete_fields]
+
+
+def export_stream(queryset, fields, export_format, asynchronous):
+    """
+    Body iterator exporting `fields` of `queryset` as `export_format`; `asynchronous` under ASGI,
+    where Django drains a synchronous iterator into memory before sending it.
+    """
+    if asynchronous:
+        rows = aiter_rows(queryset, fields)
+        return andjson_stream(rows) if export_format == 'ndjson' else ajson_array_stream(rows)
+    rows = iter_rows(queryset, fields)
+    return ndjson_stream(rows) if export_format == 'ndjson' else json_array_stream(rows)
+
+
+def iter_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield `queryset` as dicts, newest first, in keyset windows of `chunk_size`, so only one window
+    is in memory even with MySQL drivers that buffer whole result sets.
+    """
+    queryset = queryset.order_by(*KeysetPagination.ordering).values(*fields)
+    cursor = None
+    while True:
+        window = queryset if cursor is None else queryset.filter(KeysetPagination.after(*cursor))
+        count = 0
+        for row in window[:chunk_size].iterator(chunk_size=chunk_size):
+            count += 1
+            last = row
+            yield row
+        if count < chunk_size:
+            return
+        cursor = (last['timestamp'], last['id'])
+
+
+async def aiter_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """`iter_rows` for ASGI, each window is read in a worker thread while the event loop sends the last one."""
+    queryset = queryset.order_by(*KeysetPagination.ordering).values(*fields)
+    cursor = None
+    while True:
+        window = queryset if cursor is None else queryset.filter(KeysetPagination.after(*cursor))
+        rows = await sync_to_async(list)(window[:chunk_size])
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            return
+        cursor = (rows[-1]['timestamp'], rows[-1]['id'])
+
+
+def ndjson_stream(rows):
+    encoder = JSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+async def andjson_stream(rows):
+    encoder = JSONEncoder()
+    async for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def json_array_stream(rows):
+    encoder = JSONEncoder()
+    separator = '['
+    for row in rows:
+        yield separator + encoder.encode(row)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+async def ajson_array_stream(rows):
+    encoder = JSONEncoder()
+    separator = '['
+    async for row in rows:
+        yield separator + encoder.encode(row)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
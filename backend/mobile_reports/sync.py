@@ -0,0 +1,184 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import timedelta
+import json
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, models, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+from .models import Tombstone, stamp_sync_versions
+from .signals import rows_deleted
+
+SYNC_PAGE_SIZE = 1000
+
+
+class WatermarkExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'watermark is older than the deletion history, sync again without one'
+    default_code = 'watermark_expired'
+
+
+def delete_rows(queryset):
+    """
+    Delete the rows of `queryset` and leave a tombstone for each one, returns the number deleted.
+    """
+    with transaction.atomic():
+        rows = list(queryset.order_by().values_list('id', 'user_id', 'timestamp'))
+        return delete_ids(queryset.model, rows)
+
+
+def follow_relation(relation, ids):
+    """Apply the on_delete of `relation` to the rows pointing at the `ids` about to be deleted."""
+    name = relation.field.name
+    dependents = relation.related_model._base_manager.filter(**{f'{name}__in': ids})
+    on_delete = relation.on_delete
+    if on_delete is models.DO_NOTHING:
+        return
+    if on_delete is models.CASCADE:
+        dependents.delete()
+    elif on_delete is models.SET_NULL:
+        dependents.update(**{name: None})
+    elif on_delete is models.SET_DEFAULT:
+        dependents.update(**{name: relation.field.get_default()})
+    elif on_delete in (models.PROTECT, models.RESTRICT):
+        protected = list(dependents[:10])
+        if protected:
+            error = models.ProtectedError if on_delete is models.PROTECT else models.RestrictedError
+            raise error(f'{relation.related_model._meta.label} rows still point at the rows being deleted '
+                        f'through {name}', protected)
+    else:
+        raise ImproperlyConfigured(f'delete_ids does not handle the on_delete of '
+                                   f'{relation.related_model._meta.label}.{name}')
+
+
+def delete_ids(model, rows, tombstones=True):
+    """
+    Delete (id, user_id, timestamp) `rows` of `model` with one DELETE, following its relations here,
+    and tombstone them unless they only moved elsewhere; `rows_deleted` is sent either way.
+    """
+    if not rows:
+        return 0
+    ids = [pk for pk, _, _ in rows]
+    for relation in model._meta.get_fields(include_hidden=True):
+        if relation.auto_created and relation.is_relation and not relation.concrete:
+            follow_relation(relation, ids)
+    quote = connection.ops.quote_name
+    sql = (f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} '
+           f'IN ({", ".join(["%s"] * len(ids))})')
+    params = list(ids)
+    timestamps = [timestamp for _, _, timestamp in rows]
+    if None not in timestamps:
+        # the measurement table is partitioned by timestamp, the range lets MySQL skip the other partitions
+        sql += f' AND {quote(model._meta.get_field("timestamp").column)} BETWEEN %s AND %s'
+        params += [connection.ops.adapt_datetimefield_value(min(timestamps)),
+                   connection.ops.adapt_datetimefield_value(max(timestamps))]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        count = cursor.rowcount
+    forget_rows(model, rows, tombstones)
+    return count
+
+
+def forget_rows(model, rows, tombstones=True):
+    """
+    The bookkeeping of (id, user_id, timestamp) `rows` of `model` that just left its table:
+    tombstones unless they were only moved elsewhere, then `rows_deleted`.
+    """
+    if tombstones:
+        tombstones = [Tombstone(user_id=user_id, model=model._meta.model_name, row_id=pk) for pk, user_id, _ in rows]
+        stamp_sync_versions(tombstones)
+        Tombstone.objects.bulk_create(tombstones, batch_size=1000)
+    rows_deleted.send(sender=model, rows=rows, moved=not tombstones)
+
+
+def delete_in_chunks(queryset, chunk_size=None, time_limit=None):
+    """
+    Delete `queryset` in short transactions of `chunk_size` rows, returns (deleted, chunks, more);
+    `more` is set when `time_limit` ran out, calling again picks up where this stopped.
+    """
+    chunk_size = chunk_size or settings.BULK_DELETE_CHUNK_SIZE
+    deadline = time.monotonic() + (time_limit or settings.BULK_DELETE_TIME_LIMIT)
+    deleted = chunks = 0
+    while True:
+        with transaction.atomic():
+            # LIMIT on the SELECT rather than the DELETE, the ids are needed for the tombstones
+            rows = list(queryset.order_by().values_list('id', 'user_id', 'timestamp')[:chunk_size])
+            deleted += delete_ids(queryset.model, rows)
+        chunks += 1
+        if len(rows) < chunk_size:
+            return deleted, chunks, False
+        if time.monotonic() > deadline:
+            return deleted, chunks, True
+
+
+def encode_watermark(version):
+    payload = {'v': version, 't': int(timezone.now().timestamp())}
+    return urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_watermark(encoded):
+    """The sync version of a watermark, 0 for an empty one."""
+    if not encoded:
+        return 0
+    try:
+        payload = json.loads(urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+        if 'r' in payload and 'v' not in payload:
+            # a watermark of row ids from before sync versions, they do not compare
+            raise WatermarkExpired()
+        version, issued = int(payload['v']), int(payload['t'])
+    except (TypeError, ValueError, KeyError):
+        raise ValidationError({'since': ['invalid watermark']})
+    if issued < (timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)).timestamp():
+        # tombstones this old may have been purged, the deletions since then are unknown
+        raise WatermarkExpired()
+    return version
+
+
+def changes(queryset, user_id, since, limit=SYNC_PAGE_SIZE):
+    """
+    Rows of `queryset` written and ids deleted after the watermark `since`, by per-user sync version
+    (see models.reserve_sync_versions); `more` is set when the page was cut at `limit`.
+    """
+    version = decode_watermark(since)
+    rows = list(queryset.filter(sync_version__gt=version).order_by('sync_version')[:limit + 1])
+    deleted = list(Tombstone.objects.filter(user_id=user_id, model=queryset.model._meta.model_name,
+                                            sync_version__gt=version)
+                                    .order_by('sync_version').values_list('sync_version', 'row_id')[:limit + 1])
+    # the page is the first `limit` changes of both lists, which never share a version
+    versions = sorted([row.sync_version for row in rows] + [deleted_version for deleted_version, _ in deleted])
+    more = len(versions) > limit
+    if versions:
+        version = versions[:limit][-1]
+    return ([row for row in rows if row.sync_version <= version],
+            [pk for deleted_version, pk in deleted if deleted_version <= version], encode_watermark(version), more)
+
+
+class DeltaSyncMixin:
+    """
+    `?since=<watermark>` on `list` returns only what changed since the watermark, see `changes`.
+    """
+    sync_query_param = 'since'
+
+    def list(self, request, *args, **kwargs):
+        if self.sync_query_param not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        rows, deleted, watermark, more = changes(self.filter_queryset(self.get_queryset()), request.user.id,
+                                                 request.query_params[self.sync_query_param],
+                                                 self.sync_page_size(request))
+        serializer = self.get_serializer(rows, many=True)
+        return Response(OrderedDict([
+            ('watermark', watermark),
+            ('more', more),
+            ('results', serializer.data),
+            ('deleted', deleted),
+        ]), status=status.HTTP_200_OK)
+
+    def sync_page_size(self, request):
+        try:
+            return min(max(int(request.query_params['page_size']), 1), SYNC_PAGE_SIZE)
+        except (KeyError, ValueError):
+            return SYNC_PAGE_SIZE
@@ -1,3 +1,1606 @@
-from django.test import TestCase
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta, timezone as dt_timezone
+import gzip
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from unittest import mock
+import asyncio
+from asgiref.sync import async_to_sync, sync_to_async
+import msgpack
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, models, transaction
+from django.db.transaction import TransactionManagementError
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .archive import ArchiveConflict, archive_month, full_path
+from .geo import TILE_KEY_ZOOM, bbox_q, cover, in_bbox, interleave, tile_key, tile_xy
+from .ingest import insert_new, is_duplicate
+from .jobs import claim, process_next, run
+from .live import (RESYNC, SUBSCRIPTION_QUEUE_SIZE, CacheBroker, LocalBroker, Subscription, event_stream,
+                   measurement_event)
+from .models import *
+from .partitions import (detach_statements, detached_table, existing_partitions, expire_statements,
+                         expired_partitions, future_statements, initial_layout, retention_cutoff)
+from .management.commands.manage_partitions import Command as ManagePartitionsCommand
+from .network_types import network_types
+from .rollups import VALUE_FIELDS, rebuild
+from .serializers import BulkMeasurementSerializer
+from .signals import rows_deleted, rows_ingested
+from .speedtest import (BODY_TIMING_KEY, CHUNK_SIZE, BodyTimingMiddleware, Transfer, consume_upload, iter_payload,
+                        parse_range, payload_chunks, throughput)
+from .streaming import aiter_rows, iter_rows
+from .sync import delete_ids, encode_watermark
+from .utils import BANDS, BandTable, arfcn_to_band, arfcns_to_bands, fill_frequencies
+from .tiles import tile_bounds
+from .validators import CELL_INFO_UNAVAILABLE, ColumnarValidator
 
-# Create your tests here.
+User = get_user_model()
+
+BASE_TIME = datetime(2025, 7, 1, tzinfo=dt_timezone.utc)
+
+
+def measurement_data(index, **fields):
+    """An uploadable measurement, one second after the previous index."""
+    data = {
+        'latitude': 35.7 + index * 1e-4, 'longitude': 51.4,
+        'timestamp': (BASE_TIME + timedelta(seconds=index)).isoformat().replace('+00:00', 'Z'),
+        'network_type': 'LTE', 'arfcn': 1300, 'rsrp': -90, 'rsrq': -10,
+        'http_upload': 1.0, 'http_download': 2.0, 'ping_time': 30.0,
+        'dns_response': 10, 'web_response': 100, 'sms_delivery_time': 1000,
+    }
+    data.update(fields)
+    return data
+
+
+def test_result_data(index, **fields):
+    data = {'timestamp': (BASE_TIME + timedelta(seconds=index)).isoformat().replace('+00:00', 'Z'),
+            'test_type': 'PING', 'value': 30.0, 'success': True}
+    data.update(fields)
+    return data
+
+
+def create_user(number, **fields):
+    return User.objects.create_user(username=f'user{number}', phone_number=f'0912{number:07d}',
+                                    email=f'user{number}@example.com', password='x', **fields)
+
+
+class APITestCase(TestCase):
+    """A user and a staff member with an authenticated client each."""
+
+    def setUp(self):
+        self.user = create_user(1)
+        self.staff = create_user(2, is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.staff_client = APIClient()
+        self.staff_client.force_authenticate(self.staff)
+
+    def authenticated(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def upload(self, rows, client=None, **options):
+        return (client or self.client).post('/api/mobile/bulk_upload/measurement/',
+                                            {'measurements': rows, **options}, format='json')
+
+    def create_measurements(self, count, user=None, start=0, **fields):
+        rows = [Measurement(user=user or self.user, **{**measurement_data(start + index), **fields})
+                for index in range(count)]
+        for row in rows:
+            row.save()
+        return rows
+
+
+class KeysetPaginationTests(APITestCase):
+
+    def collect(self, client, url):
+        ids, pages = [], 0
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url, pages = response.data['next'], pages + 1
+        return ids, pages
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        rows = self.create_measurements(25)
+        ids, pages = self.collect(self.client, '/api/mobile/measurement/?page_size=7')
+        self.assertEqual(pages, 4)
+        self.assertEqual(ids, [row.id for row in reversed(rows)])
+
+    def test_rows_with_the_same_timestamp_are_ordered_by_id(self):
+        other = create_user(3)
+        rows = self.create_measurements(5) + self.create_measurements(5, user=other)
+        ids, _ = self.collect(self.staff_client, '/api/mobile/measurement/get_all/?page_size=3')
+        expected = sorted(rows, key=lambda row: (row.timestamp, row.id), reverse=True)
+        self.assertEqual(ids, [row.id for row in expected])
+
+    def test_without_page_parameters_the_whole_list_is_returned(self):
+        self.create_measurements(3)
+        response = self.client.get('/api/mobile/measurement/')
+        self.assertEqual(len(response.data), 3)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/mobile/measurement/?cursor=zzz').status_code, 404)
+
+    def test_test_results_with_no_timestamp_come_last(self):
+        stamped = [TestResult.objects.create(user=self.user, timestamp=BASE_TIME + timedelta(seconds=index),
+                                             test_type='PING', value=1, success=True) for index in range(3)]
+        unstamped = [TestResult.objects.create(user=self.user, timestamp=None, test_type='PING', value=1,
+                                               success=True) for _ in range(3)]
+        ids, _ = self.collect(self.client, '/api/mobile/test_result/?page_size=2')
+        self.assertEqual(ids, [row.id for row in reversed(stamped)] + [row.id for row in reversed(unstamped)])
+
+
+class ExportTests(APITestCase):
+
+    def export(self, export_format):
+        response = self.staff_client.get(f'/api/mobile/measurement/get_all/?export={export_format}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        rows = self.create_measurements(5)
+        response, body = self.export('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([line['id'] for line in lines], [row.id for row in reversed(rows)])
+        self.assertEqual(lines[0]['user'], self.user.id)
+
+    def test_json_array(self):
+        rows = self.create_measurements(3)
+        _, body = self.export('json')
+        self.assertEqual([item['id'] for item in json.loads(body)], [row.id for row in reversed(rows)])
+
+    def test_empty_json_array(self):
+        self.assertEqual(self.export('json')[1], '[]')
+
+    def test_rows_are_read_in_windows(self):
+        rows = self.create_measurements(7)
+        exported = list(iter_rows(Measurement.objects.all(), ['id', 'timestamp'], chunk_size=3))
+        self.assertEqual([row['id'] for row in exported], [row.id for row in reversed(rows)])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.staff_client.get('/api/mobile/measurement/get_all/?export=xml').status_code, 400)
+
+    def test_asynchronous_windows(self):
+        rows = self.create_measurements(7)
+
+        async def collect():
+            return [row async for row in aiter_rows(Measurement.objects.all(), ['id', 'timestamp'], chunk_size=3)]
+        self.assertEqual([row['id'] for row in async_to_sync(collect)()], [row.id for row in reversed(rows)])
+
+    async def test_asgi_exports_are_streamed(self):
+        rows = await sync_to_async(self.create_measurements)(3)
+        client, headers = AsyncClient(), {'Authorization': f'Bearer {AccessToken.for_user(self.staff)}'}
+        for export_format in ('ndjson', 'json'):
+            response = await client.get(f'/api/mobile/measurement/get_all/?export={export_format}', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)  # a synchronous iterator would be read into memory first
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+            exported = ([json.loads(line) for line in body.splitlines()] if export_format == 'ndjson'
+                        else json.loads(body))
+            self.assertEqual([row['id'] for row in exported], [row.id for row in reversed(rows)])
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/api/mobile/measurement/get_all/?export=json').status_code, 403)
+
+
+@override_settings(BULK_UPLOAD_BATCH_SIZE=4)
+class BulkInsertTests(APITestCase):
+
+    def test_rows_are_inserted_in_batches(self):
+        sent = []
+        receiver = lambda sender, rows, **kwargs: sent.append(len(rows))
+        rows_ingested.connect(receiver, sender=Measurement)
+        try:
+            response = self.upload([measurement_data(index) for index in range(10)])
+        finally:
+            rows_ingested.disconnect(receiver, sender=Measurement)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 10)
+        self.assertEqual([batch['rows'] for batch in response.data['batches']], [4, 4, 2])
+        self.assertEqual(sent, [4, 4, 2])
+        self.assertEqual(Measurement.objects.filter(user=self.user).count(), 10)
+
+    def test_a_failing_batch_rolls_back_the_whole_upload(self):
+        self.create_measurements(1, start=9)
+        response = self.upload([measurement_data(index) for index in range(10)])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Measurement.objects.filter(user=self.user).count(), 1)
+
+    def test_test_results(self):
+        response = self.client.post('/api/mobile/bulk_upload/test_report/',
+                                    {'test_results': [test_result_data(index) for index in range(6)]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['batches']), 2)
+        self.assertEqual(TestResult.objects.filter(user=self.user).count(), 6)
+
+
+class IdempotentUploadTests(APITestCase):
+
+    def test_reupload_with_ignore_stores_nothing_twice(self):
+        rows = [measurement_data(index) for index in range(5)]
+        self.assertEqual(self.upload(rows).data['created'], 5)
+        response = self.upload(rows + [measurement_data(5)], on_conflict='ignore')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['duplicates']), (1, 5))
+        self.assertEqual(Measurement.objects.filter(user=self.user).count(), 6)
+
+    def test_duplicates_within_an_upload(self):
+        response = self.upload([measurement_data(0), measurement_data(0), measurement_data(1)], on_conflict='ignore')
+        self.assertEqual((response.data['created'], response.data['duplicates']), (2, 1))
+
+    def test_users_do_not_conflict_with_each_other(self):
+        self.upload([measurement_data(0)])
+        response = self.upload([measurement_data(0)], client=self.staff_client)
+        self.assertEqual(response.status_code, 201)
+
+    def test_single_create_of_an_existing_timestamp(self):
+        self.create_measurements(1)
+        response = self.client.post('/api/mobile/measurement/', measurement_data(0), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('timestamp', response.data)
+
+    def test_rows_stored_concurrently_are_counted_as_duplicates(self):
+        # the lookup ran before a concurrent upload of the same rows committed
+        self.create_measurements(2)
+        sent = []
+        receiver = lambda sender, rows, **kwargs: sent.extend(rows)
+        rows_ingested.connect(receiver, sender=Measurement)
+        try:
+            with mock.patch('mobile_reports.ingest.new_rows', lambda model, batch: batch):
+                response = self.upload([measurement_data(index) for index in range(4)], on_conflict='ignore')
+        finally:
+            rows_ingested.disconnect(receiver, sender=Measurement)
+        self.assertEqual((response.data['created'], response.data['duplicates']), (2, 2))
+        self.assertEqual([row.timestamp.second for row in sent], [2, 3])
+        self.assertEqual(Measurement.objects.filter(user=self.user).count(), 4)
+
+    def test_other_integrity_errors_are_not_ignored(self):
+        row = Measurement(user=self.user, **measurement_data(0))
+        row.network_type = None
+        with self.assertRaises(IntegrityError) as raised:
+            insert_new(Measurement, [row])
+        self.assertFalse(is_duplicate(raised.exception))
+
+    def test_is_duplicate(self):
+        self.create_measurements(1)
+        with self.assertRaises(IntegrityError) as raised:
+            Measurement.objects.bulk_create([Measurement(user=self.user, **measurement_data(0))])
+        self.assertTrue(is_duplicate(raised.exception))
+
+
+class PartialUploadTests(APITestCase):
+
+    def rows(self):
+        rows = [measurement_data(index) for index in range(6)]
+        rows[2]['latitude'] = 'abc'
+        del rows[4]['ping_time']
+        return rows
+
+    def test_valid_rows_are_stored_and_the_others_reported(self):
+        response = self.upload(self.rows(), accept_partial=True)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 4)
+        self.assertEqual([row['index'] for row in response.data['rejected']], [2, 4])
+        self.assertIn('latitude', response.data['rejected'][0]['errors'])
+        self.assertIn('ping_time', response.data['rejected'][1]['errors'])
+        self.assertEqual(Measurement.objects.filter(user=self.user).count(), 4)
+
+    def test_without_accept_partial_nothing_is_stored(self):
+        response = self.upload(self.rows())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sorted(response.data['measurements']), [2, 4])
+        self.assertFalse(Measurement.objects.exists())
+
+    @override_settings(BULK_VALIDATION_ENGINE='serializer')
+    def test_with_the_serializer_engine(self):
+        response = self.upload(self.rows(), accept_partial=True)
+        self.assertEqual([row['index'] for row in response.data['rejected']], [2, 4])
+
+    def test_invalid_flag(self):
+        response = self.upload(self.rows(), accept_partial='maybe')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('accept_partial', response.data)
+
+    def test_test_reports(self):
+        rows = [test_result_data(0), test_result_data(1, test_type='X')]
+        response = self.client.post('/api/mobile/bulk_upload/test_report/',
+                                    {'test_results': rows, 'accept_partial': True}, format='json')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['rejected'][0]['index'], 1)
+
+
+class ColumnarValidatorTests(TestCase):
+
+    def rows(self):
+        rows = [measurement_data(index) for index in range(12)]
+        rows[1]['rsrp'] = '-95'  # numbers as strings go through the field
+        rows[2]['rsrp'] = -20  # above the bound
+        rows[3]['latitude'] = None
+        rows[4]['lac'] = None
+        rows[5]['dns_response'] = 12.0  # integral float
+        rows[6]['dns_response'] = 12.5
+        rows[7]['network_type'] = '  LTE  '
+        rows[8]['network_type'] = 'x' * 20
+        rows[9]['timestamp'] = 'yesterday'
+        del rows[10]['http_upload']
+        rows[11] = 'not a row'
+        return rows
+
+    def test_same_result_as_the_serializer(self):
+        rows = self.rows()
+        expected, expected_errors = [], {}
+        for index, row in enumerate(rows):
+            try:
+                expected.append(BulkMeasurementSerializer().run_validation(row))
+            except serializers.ValidationError as e:
+                expected_errors[index] = e.detail
+        validated, errors = ColumnarValidator(BulkMeasurementSerializer).validate(rows)
+        self.assertEqual(validated, expected)
+        self.assertEqual(errors, expected_errors)
+        self.assertEqual(sorted(errors), [2, 3, 6, 8, 9, 10, 11])
+
+    def test_values_are_converted(self):
+        validated, _ = ColumnarValidator(BulkMeasurementSerializer).validate(self.rows()[:8])
+        by_latitude = {round(row['latitude'], 4): row for row in validated}
+        self.assertEqual(by_latitude[35.7001]['rsrp'], -95)
+        self.assertEqual(by_latitude[35.7005]['dns_response'], 12)
+        self.assertEqual(by_latitude[35.7007]['network_type'], 'LTE')
+        self.assertIsNone(by_latitude[35.7004]['lac'])
+
+
+class UnavailableSignalTests(APITestCase):
+    # the Android app sends CellInfo.UNAVAILABLE for signal values the modem did not report
+
+    def test_bulk_uploads_store_null(self):
+        rows = [measurement_data(0, rsrp=CELL_INFO_UNAVAILABLE, rsrq=CELL_INFO_UNAVAILABLE),
+                measurement_data(1, rscp=CELL_INFO_UNAVAILABLE)]
+        self.assertEqual(self.upload(rows).status_code, 201)
+        stored = Measurement.objects.filter(user=self.user).order_by('timestamp')
+        self.assertEqual([(row.rsrp, row.rsrq, row.rscp) for row in stored], [(None, None, None), (-90, -10, None)])
+
+    def test_single_uploads_store_null(self):
+        response = self.client.post('/api/mobile/measurement/', measurement_data(0, rsrp=CELL_INFO_UNAVAILABLE),
+                                    format='json')
+        self.assertEqual((response.status_code, response.data['rsrp']), (201, None))
+
+    def test_columnar_validator_agrees(self):
+        rows = [measurement_data(0, rsrp=CELL_INFO_UNAVAILABLE, rxLev=CELL_INFO_UNAVAILABLE), measurement_data(1)]
+        validated, errors = ColumnarValidator(BulkMeasurementSerializer).validate(rows)
+        self.assertEqual(errors, {})
+        self.assertEqual(validated, [BulkMeasurementSerializer().run_validation(row) for row in rows])
+        self.assertEqual((validated[0]['rsrp'], validated[0]['rxLev']), (None, None))
+
+    def test_other_out_of_range_values_are_still_refused(self):
+        self.assertEqual(self.upload([measurement_data(0, rsrp=CELL_INFO_UNAVAILABLE - 1)]).status_code, 400)
+
+
+@override_settings(BULK_UPLOAD_MAX_DECOMPRESSED_SIZE=64 * 1024)
+class UploadFormatTests(APITestCase):
+    url = '/api/mobile/bulk_upload/measurement/'
+
+    def post(self, body, content_type, **headers):
+        return self.client.generic('POST', self.url, body, content_type=content_type, **headers)
+
+    def test_gzip_json(self):
+        body = gzip.compress(json.dumps({'measurements': [measurement_data(0)]}).encode())
+        response = self.post(body, 'application/json', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+
+    def test_messagepack(self):
+        for content_type in ('application/msgpack', 'application/x-msgpack'):
+            body = msgpack.packb({'measurements': [measurement_data(len(content_type))]})
+            self.assertEqual(self.post(body, content_type).status_code, 201)
+        self.assertEqual(Measurement.objects.count(), 2)
+
+    def test_gzip_messagepack(self):
+        body = gzip.compress(msgpack.packb({'measurements': [measurement_data(0)]}))
+        self.assertEqual(self.post(body, 'application/msgpack', HTTP_CONTENT_ENCODING='gzip').status_code, 201)
+
+    def test_columns(self):
+        rows = [measurement_data(index) for index in range(3)]
+        columns = list(rows[0])
+        response = self.upload({'columns': columns, 'rows': [[row[name] for name in columns] for row in rows]})
+        self.assertEqual(response.data['created'], 3)
+
+    def test_columns_of_the_wrong_width(self):
+        response = self.upload({'columns': ['latitude', 'longitude'], 'rows': [[1]]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_decompressed_size_is_capped(self):
+        body = gzip.compress(json.dumps({'measurements': [], 'padding': ' ' * 100 * 1024}).encode())
+        response = self.post(body, 'application/json', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('too large', response.data['detail'])
+
+    def test_bad_bodies(self):
+        self.assertEqual(self.post(b'{}', 'application/json', HTTP_CONTENT_ENCODING='br').status_code, 400)
+        self.assertEqual(self.post(b'not gzip', 'application/json', HTTP_CONTENT_ENCODING='gzip').status_code, 400)
+        self.assertEqual(self.post(b'\xc1', 'application/msgpack').status_code, 400)
+
+
+class StatsTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_measurements(3)
+        self.create_measurements(2, start=3600, network_type='UMTS', cell_id='42', rsrp=None)
+        self.create_measurements(1, start=7200, network_type='UNKNOWN')
+
+    def stats(self, query='', client=None):
+        response = (client or self.client).get(f'/api/mobile/measurement/stats/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_aggregates(self):
+        stats = self.stats()
+        self.assertEqual(stats['count'], 5)
+        self.assertEqual(stats['network_types'], [{'value': 'LTE', 'count': 3}, {'value': 'UMTS', 'count': 2}])
+        self.assertEqual(stats['top_cells'], [{'value': '42', 'count': 2}])
+        self.assertEqual(stats['count_by_hour'][0], 3)
+        self.assertEqual(stats['count_by_hour'][1], 2)
+        self.assertEqual([row['rsrp'] for row in stats['signal_over_time']], [-90, None])
+
+    def test_utc_offset_shifts_the_hours(self):
+        self.assertEqual(self.stats('?utc_offset=210')['count_by_hour'][3], 3)
+
+    def test_filters(self):
+        self.assertEqual(self.stats('?network_type=UMTS')['count'], 2)
+        self.assertEqual(self.stats('?start=2025-07-01T00:30:00Z')['count'], 2)
+        self.assertEqual(len(self.stats('?bucket=day')['signal_over_time']), 1)
+
+    def test_all_users_is_staff_only(self):
+        self.assertEqual(self.client.get('/api/mobile/measurement/stats/?all=true').status_code, 403)
+        self.assertEqual(self.stats('?all=true', self.staff_client)['count'], 5)
+        self.assertEqual(self.stats(client=self.staff_client)['count'], 0)
+
+
+class RollupTests(APITestCase):
+
+    def rollups(self, model=HourlyMeasurementRollup):
+        return list(model.objects.filter(user=self.user).order_by('bucket', 'network_type', 'cell_id')
+                                 .values('bucket', 'network_type', 'cell_id', *VALUE_FIELDS))
+
+    def test_ingest_updates_the_rollups(self):
+        self.upload([measurement_data(index, rsrp=-80 - index) for index in range(3)])
+        self.upload([measurement_data(3, rsrp=-100, ping_time=-1), measurement_data(3600, cell_id='7')])
+        hourly = self.rollups()
+        self.assertEqual(len(hourly), 2)
+        first = hourly[0]
+        self.assertEqual((first['count'], first['rsrp_count'], first['rsrp_sum']), (4, 4, -343))
+        self.assertEqual((first['rsrp_min'], first['rsrp_max']), (-100, -80))
+        self.assertEqual((first['ping_time_count'], first['ping_time_sum']), (3, 90))  # -1 is "not measured"
+        self.assertEqual((hourly[1]['bucket'].hour, hourly[1]['cell_id']), (1, '7'))
+        daily = self.rollups(DailyMeasurementRollup)
+        self.assertEqual(sum(row['count'] for row in daily), 5)
+
+    def test_rebuild_gives_the_same_rollups(self):
+        self.upload([measurement_data(index * 600, rsrp=-80 - index, network_type=['LTE', 'NR'][index % 2])
+                     for index in range(20)])
+        hourly, daily = self.rollups(), self.rollups(DailyMeasurementRollup)
+        rebuild(self.user)
+        self.assertEqual(self.rollups(), hourly)
+        self.assertEqual(self.rollups(DailyMeasurementRollup), daily)
+
+    def test_series(self):
+        self.upload([measurement_data(index, rsrp=-80 - index) for index in range(3)])
+        response = self.client.get('/api/mobile/measurement/rollups/?bucket=hour')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['count'], 3)
+        self.assertEqual(response.data[0]['rsrp'], {'avg': -81, 'min': -82, 'max': -80})
+
+
+    def test_deletes_update_the_rollups(self):
+        self.upload([measurement_data(index * 1800, rsrp=-80 - index) for index in range(4)])
+        ids = list(Measurement.objects.filter(user=self.user).order_by('timestamp').values_list('id', flat=True))
+        self.client.delete(f'/api/mobile/measurement/{ids[0]}/')
+        self.client.post('/api/mobile/bulk_delete/measurement/range/',
+                         {'start': (BASE_TIME + timedelta(hours=1)).isoformat()}, format='json')
+        hourly = self.rollups()
+        self.assertEqual(len(hourly), 1)
+        self.assertEqual((hourly[0]['count'], hourly[0]['rsrp_min'], hourly[0]['rsrp_max']), (1, -81, -81))
+        self.assertEqual([row['count'] for row in self.rollups(DailyMeasurementRollup)], [1])
+
+    def test_archived_rows_stay_in_the_rollups(self):
+        self.upload([measurement_data(index) for index in range(3)])
+        rows = Measurement.objects.filter(user=self.user).values_list('id', 'user_id', 'timestamp')
+        rows_deleted.send(sender=Measurement, rows=list(rows), moved=True)
+        self.assertEqual(self.rollups()[0]['count'], 3)
+
+
+@override_settings(BULK_DELETE_CHUNK_SIZE=2)
+class RangeDeleteTests(APITestCase):
+    url = '/api/mobile/bulk_delete/measurement/range/'
+
+    def delete_range(self, url=None, **data):
+        return self.client.post(url or self.url, {key: value.isoformat() if isinstance(value, datetime) else value
+                                                  for key, value in data.items()}, format='json')
+
+    def test_only_the_range_of_the_user_is_deleted(self):
+        rows = self.create_measurements(6)
+        self.create_measurements(3, user=self.staff)
+        response = self.delete_range(start=BASE_TIME + timedelta(seconds=1), end=BASE_TIME + timedelta(seconds=4))
+        self.assertEqual((response.data['deleted'], response.data['chunks'], response.data['more']), (4, 3, False))
+        self.assertEqual(list(Measurement.objects.filter(user=self.user).order_by('id').values_list('id', flat=True)),
+                         [rows[0].id, rows[5].id])
+        self.assertEqual(Measurement.objects.filter(user=self.staff).count(), 3)
+        self.assertEqual(set(Tombstone.objects.values_list('row_id', flat=True)), {row.id for row in rows[1:5]})
+
+    def test_network_type(self):
+        self.create_measurements(2)
+        self.create_measurements(2, start=10, network_type='NR')
+        self.assertEqual(self.delete_range(network_type='NR').data['deleted'], 2)
+        self.assertEqual(set(Measurement.objects.values_list('network_type', flat=True)), {'LTE'})
+        response = self.delete_range('/api/mobile/bulk_delete/test_report/range/', network_type='NR')
+        self.assertEqual(response.status_code, 400)
+
+    def test_a_request_out_of_time_asks_to_be_resent(self):
+        self.create_measurements(5)
+        with override_settings(BULK_DELETE_TIME_LIMIT=-1):
+            response = self.delete_range(end=BASE_TIME + timedelta(days=1))
+        self.assertEqual((response.data['deleted'], response.data['more']), (2, True))
+        self.assertEqual(self.delete_range(end=BASE_TIME + timedelta(days=1)).data['deleted'], 3)
+
+    def test_an_empty_or_reversed_range_is_refused(self):
+        self.assertEqual(self.delete_range().status_code, 400)
+        response = self.delete_range(start=BASE_TIME, end=BASE_TIME - timedelta(seconds=1))
+        self.assertEqual(response.status_code, 400)
+
+    def test_test_reports(self):
+        for index in range(3):
+            TestResult.objects.create(user=self.user, timestamp=BASE_TIME + timedelta(seconds=index),
+                                      test_type='PING', value=1, success=True)
+        response = self.delete_range('/api/mobile/bulk_delete/test_report/range/',
+                                     end=BASE_TIME + timedelta(seconds=1))
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(TestResult.objects.count(), 1)
+
+    def test_the_delete_is_bounded_by_the_timestamps(self):
+        self.create_measurements(3)
+        rows = list(Measurement.objects.all())
+        with mock.patch('mobile_reports.sync.forget_rows'):
+            # a timestamp range the rows are not in deletes nothing, it is what lets MySQL prune partitions
+            self.assertEqual(delete_ids(Measurement, [(row.id, row.user_id, row.timestamp + timedelta(days=1))
+                                                      for row in rows]), 0)
+            self.assertEqual(delete_ids(Measurement, [(row.id, row.user_id, row.timestamp) for row in rows]), 3)
+
+
+class DeleteRelationTests(APITestCase):
+    # SpeedTestSession.result is the one relation to these models, SET NULL
+
+    def setUp(self):
+        super().setUp()
+        self.result = TestResult.objects.create(user=self.user, timestamp=BASE_TIME, test_type='PING', value=1,
+                                                success=True)
+        self.session = SpeedTestSession.objects.create(user=self.user, direction='download', streams=1,
+                                                       stream_bytes=1024, warmup_ms=0, result=self.result)
+        self.rows = [(self.result.id, self.user.id, self.result.timestamp)]
+
+    def on_delete(self, on_delete):
+        return mock.patch.object(SpeedTestSession._meta.get_field('result').remote_field, 'on_delete', on_delete)
+
+    def test_set_null(self):
+        self.assertEqual(delete_ids(TestResult, self.rows), 1)
+        self.session.refresh_from_db()
+        self.assertIsNone(self.session.result)
+
+    def test_cascade(self):
+        with self.on_delete(models.CASCADE):
+            self.assertEqual(delete_ids(TestResult, self.rows), 1)
+        self.assertFalse(SpeedTestSession.objects.filter(id=self.session.id).exists())
+
+    def test_protect(self):
+        with self.on_delete(models.PROTECT), self.assertRaises(models.ProtectedError):
+            delete_ids(TestResult, self.rows)
+        self.assertTrue(TestResult.objects.filter(id=self.result.id).exists())
+
+    def test_unsupported_on_delete_is_refused(self):
+        with self.on_delete(models.SET(None)), self.assertRaises(ImproperlyConfigured):
+            delete_ids(TestResult, self.rows)
+
+
+class GeoTests(TestCase):
+
+    def test_tile_xy(self):
+        self.assertEqual(tile_xy(0, 0, 1), (1, 1))
+        self.assertEqual(tile_xy(85.06, -180, 2), (0, 0))
+        self.assertEqual(tile_xy(-90, 180, 2), (3, 3))  # clamped to the last tile
+
+    def test_interleave(self):
+        self.assertEqual([interleave(x, y) for y in range(2) for x in range(2)], [0, 1, 2, 3])
+        self.assertEqual(interleave(0xFFFFFF, 0xFFFFFF), 2 ** 48 - 1)
+
+    def test_a_coarser_tile_is_one_key_range(self):
+        x, y = tile_xy(35.7, 51.4, 10)
+        shift = 2 * (TILE_KEY_ZOOM - 10)
+        self.assertEqual(tile_key(35.7, 51.4) >> shift, interleave(x, y))
+        self.assertIsNone(tile_key(None, 51.4))
+
+    def test_cover_contains_every_point_of_the_box(self):
+        south, west, north, east = 35.6, 51.2, 35.8, 51.6
+        ranges = cover(south, west, north, east)
+        self.assertLessEqual(len(ranges), 32)
+        for step in range(11):
+            latitude, longitude = south + (north - south) * step / 10, west + (east - west) * step / 10
+            key = tile_key(latitude, longitude)
+            self.assertTrue(any(low <= key < high for low, high in ranges))
+
+    def test_cover_merges_adjacent_cells(self):
+        for (_, high), (low, _) in zip(cover(35, 51, 36, 52), cover(35, 51, 36, 52)[1:]):
+            self.assertLess(high, low)
+
+    def test_in_bbox(self):
+        self.assertTrue(in_bbox(10, 179, 0, 170, 20, -170))
+        self.assertTrue(in_bbox(10, -175, 0, 170, 20, -170))
+        self.assertFalse(in_bbox(10, 0, 0, 170, 20, -170))
+        self.assertFalse(in_bbox(30, 175, 0, 170, 20, -170))
+
+
+class BoundingBoxTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        points = [(35.70, 51.40), (35.75, 51.45), (35.90, 51.40), (10.0, 179.5), (10.0, -179.5), (10.0, 0.0)]
+        self.rows = [Measurement.objects.create(user=self.user, **{**measurement_data(index),
+                                                                   'latitude': latitude, 'longitude': longitude})
+                     for index, (latitude, longitude) in enumerate(points)]
+
+    def ids(self, bbox):
+        response = self.client.get(f'/api/mobile/measurement/?bbox={bbox}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['id'] for row in response.data)
+
+    def test_filter(self):
+        self.assertEqual(self.ids('51.3,35.6,51.5,35.8'), [self.rows[0].id, self.rows[1].id])
+        self.assertEqual(self.ids('51.3,35.6,51.5,36'), [row.id for row in self.rows[:3]])
+
+    def test_box_across_the_antimeridian(self):
+        self.assertEqual(self.ids('179,0,-179,20'), [self.rows[3].id, self.rows[4].id])
+
+    def test_same_rows_as_the_coordinates_alone(self):
+        for bbox in [(35.6, 51.3, 35.8, 51.5), (0, 179, 20, -179), (-90, -180, 90, 180)]:
+            expected = [row.id for row in self.rows if in_bbox(row.latitude, row.longitude, *bbox)]
+            self.assertEqual(sorted(Measurement.objects.filter(bbox_q(*bbox)).values_list('id', flat=True)), expected)
+
+    def test_invalid_boxes(self):
+        for bbox in ['1,2,3', 'a,b,c,d', '0,50,10,40', '0,0,200,10']:
+            self.assertEqual(self.client.get(f'/api/mobile/measurement/?bbox={bbox}').status_code, 400)
+
+
+
+class ArfcnTests(TestCase):
+
+    def test_bands(self):
+        self.assertEqual(arfcn_to_band(62, 'GSM'), (947.4, 'GSM 900'))
+        self.assertEqual(arfcn_to_band(700, 'EDGE'), (1842.8, 'GSM 1800'))  # DCS 1800, not PCS 1900
+        self.assertEqual(arfcn_to_band(10700, 'WCDMA'), (2140.0, 'WCDMA Band 1'))
+        self.assertEqual(arfcn_to_band(1300, 'LTE'), (1815.0, 'LTE Band 3'))
+        self.assertEqual(arfcn_to_band(5790, 'LTE'), (740.0, 'LTE Band 17'))  # not inside band 14
+        self.assertEqual(arfcn_to_band(636666, 'NR'), (3549.99, 'NR Band n78'))
+
+    def test_unknown_channels(self):
+        self.assertEqual(arfcn_to_band(126, 'GSM'), (None, None))  # between two bands
+        self.assertEqual(arfcn_to_band(99999999, 'NR'), (None, None))
+        self.assertEqual(arfcn_to_band(1300, 'WIFI'), (None, None))
+        self.assertEqual(arfcn_to_band(None, 'LTE'), (None, None))
+
+    def test_tables_do_not_overlap(self):
+        for bands in BANDS.values():
+            BandTable(bands)
+        with self.assertRaises(ValueError):
+            BandTable([(0, 10, 'a', 0, 1, 0), (5, 20, 'b', 0, 1, 0)])
+
+    def test_batch_lookup(self):
+        arfcns, network_types = [1300, 62, 1300, None, 5790], ['LTE', 'GSM', 'LTE', 'LTE', 'LTE']
+        self.assertEqual(arfcns_to_bands(arfcns, network_types),
+                         [arfcn_to_band(*pair) for pair in zip(arfcns, network_types)])
+
+    def test_fill_keeps_values_sent_by_the_client(self):
+        rows = [Measurement(arfcn=1300, network_type='LTE'),
+                Measurement(arfcn=1300, network_type='LTE', frequency=1816.0, frequency_band='mine'),
+                Measurement(arfcn=126, network_type='GSM')]
+        self.assertEqual(fill_frequencies(rows), [rows[0]])
+        self.assertEqual((rows[0].frequency, rows[0].frequency_band), (1815.0, 'LTE Band 3'))
+        self.assertEqual((rows[1].frequency, rows[1].frequency_band), (1816.0, 'mine'))
+
+
+class FrequencyTests(APITestCase):
+
+    def test_uploads_are_filled(self):
+        self.upload([measurement_data(0), measurement_data(1, frequency=1.0, frequency_band='x')])
+        self.assertEqual(list(Measurement.objects.order_by('timestamp').values_list('frequency', 'frequency_band')),
+                         [(1815.0, 'LTE Band 3'), (1.0, 'x')])
+
+    def test_backfill(self):
+        self.create_measurements(3)
+        Measurement.objects.update(frequency=None, frequency_band=None)
+        Measurement.objects.filter(id=Measurement.objects.first().id).update(frequency_band='old')
+        call_command('backfill_frequencies', batch_size=2, stdout=mock.MagicMock())
+        self.assertEqual(set(Measurement.objects.values_list('frequency', 'frequency_band')),
+                         {(1815.0, 'LTE Band 3'), (1815.0, 'old')})
+        call_command('backfill_frequencies', recompute=True, stdout=mock.MagicMock())
+        self.assertEqual(set(Measurement.objects.values_list('frequency', 'frequency_band')), {(1815.0, 'LTE Band 3')})
+
+
+
+class NetworkTypeTests(APITestCase):
+
+    def types(self, client=None):
+        response = (client or self.client).get('/api/mobile/measurement/get_network_types/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_uploads_add_their_types(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload([measurement_data(0), measurement_data(1, network_type='NR')])
+        self.assertEqual(self.types(), ['LTE', 'NR'])
+        self.assertEqual(list(UserNetworkType.objects.filter(user=self.user).values_list('network_type', flat=True)),
+                         ['LTE', 'NR'])
+
+    def test_a_stale_cache_does_not_hide_a_missing_type(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload([measurement_data(0)])
+        self.assertEqual(network_types(self.user.id), ['LTE'])  # now cached
+        UserNetworkType.objects.all().delete()
+        self.upload([measurement_data(1)])
+        self.assertTrue(UserNetworkType.objects.filter(user=self.user, network_type='LTE').exists())
+
+    def test_deletes_drop_types_without_measurements(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload([measurement_data(0), measurement_data(1, network_type='NR')])
+        self.assertEqual(self.types(), ['LTE', 'NR'])
+        nr = Measurement.objects.get(network_type='NR')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/mobile/measurement/{nr.id}/')
+        self.assertEqual(self.types(), ['LTE'])
+
+    def test_staff_see_every_type(self):
+        other = create_user(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload([measurement_data(0)])
+            self.upload([measurement_data(0, network_type='GSM')], client=self.authenticated(other))
+        self.assertEqual(self.types(self.staff_client), ['GSM', 'LTE'])
+
+    @override_settings(NETWORK_TYPES_CACHE_TIMEOUT=0)
+    def test_the_cache_expires(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload([measurement_data(0)])
+        self.assertEqual(self.types(), ['LTE'])
+        UserNetworkType.objects.create(user=self.user, network_type='NR')
+        self.assertEqual(self.types(), ['LTE', 'NR'])
+
+
+
+class ConditionalListTests(APITestCase):
+
+    def revalidate(self, client, url):
+        first = client.get(url)
+        self.assertEqual(first.status_code, 200)
+        return client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code
+
+    def assert_changed(self, client, url, change):
+        etag = client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_unchanged_listing(self):
+        self.create_measurements(3)
+        self.assertEqual(self.revalidate(self.client, '/api/mobile/measurement/'), 304)
+        self.assertEqual(self.revalidate(self.staff_client, '/api/mobile/measurement/get_all/'), 304)
+        self.assertEqual(self.revalidate(self.client, '/api/mobile/test_result/'), 304)
+
+    def test_the_tag_depends_on_the_query(self):
+        self.create_measurements(3)
+        self.assertNotEqual(self.client.get('/api/mobile/measurement/')['ETag'],
+                            self.client.get('/api/mobile/measurement/?page_size=2')['ETag'])
+
+    def test_uploads_and_deletes(self):
+        rows = self.create_measurements(3)
+        url = '/api/mobile/measurement/'
+        self.assert_changed(self.client, url, lambda: self.upload([measurement_data(10)]))
+        self.assert_changed(self.client, url, lambda: self.client.delete(f'{url}{rows[0].id}/'))
+
+    def test_every_users_listing_follows_with_a_delay(self):
+        self.create_measurements(3)
+        url = '/api/mobile/measurement/get_all/'
+        etag = self.staff_client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/mobile/bulk_delete/measurement/range/', {'start': BASE_TIME.isoformat()},
+                             format='json')
+        # uploads and deletes do not reset the shared scope, its tag moves on with the time window
+        self.assertEqual(self.staff_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with mock.patch('mobile_reports.generations.time.time', return_value=time.time() + 60):
+            self.assertEqual(self.staff_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_rows_updated_in_place(self):
+        self.create_measurements(3)
+        Measurement.objects.update(frequency=None, frequency_band=None)
+        self.assert_changed(self.client, '/api/mobile/measurement/', lambda: call_command(
+            'backfill_frequencies', stdout=mock.MagicMock()))
+
+    def test_sharing_with_staff(self):
+        self.create_measurements(3)
+        def stop_sharing():
+            self.user.allow_admin_access = False
+            self.user.save()
+        self.assert_changed(self.staff_client, '/api/mobile/measurement/get_all/', stop_sharing)
+        self.assertEqual(self.staff_client.get('/api/mobile/measurement/get_all/').data, [])
+
+    def test_other_users_changes_keep_the_tag(self):
+        self.create_measurements(3)
+        etag = self.client.get('/api/mobile/measurement/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload([measurement_data(10)], client=self.staff_client)
+        self.assertEqual(self.client.get('/api/mobile/measurement/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+
+class DeltaSyncTests(APITestCase):
+    url = '/api/mobile/measurement/'
+
+    def sync(self, watermark='', client=None, page_size=None):
+        query = f'?since={watermark}' + (f'&page_size={page_size}' if page_size else '')
+        response = (client or self.client).get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_only_changes_after_the_watermark(self):
+        rows = self.create_measurements(3)
+        first = self.sync()
+        self.assertEqual([row['id'] for row in first['results']], [row.id for row in rows])
+        self.assertEqual(self.sync(first['watermark'])['results'], [])
+        new = self.create_measurements(1, start=10)[0]
+        self.client.delete(f'{self.url}{rows[0].id}/')
+        second = self.sync(first['watermark'])
+        self.assertEqual([row['id'] for row in second['results']], [new.id])
+        self.assertEqual(second['deleted'], [rows[0].id])
+        self.assertFalse(second['more'])
+
+    def test_rows_committed_with_lower_ids_are_not_skipped(self):
+        for index, pk in enumerate([1000, 1001]):
+            Measurement(id=pk, user=self.user, **measurement_data(index)).save()
+        watermark = self.sync()['watermark']
+        # an id handed out before the watermark was issued, committed after it
+        Measurement(id=500, user=self.user, **measurement_data(5)).save()
+        self.assertEqual([row['id'] for row in self.sync(watermark)['results']], [500])
+
+    def test_rows_changed_in_place_are_sent_again(self):
+        rows = self.create_measurements(2)
+        watermark = self.sync()['watermark']
+        rows[0].rsrp = -70
+        rows[0].save(update_fields=['rsrp'])
+        self.assertEqual([row['id'] for row in self.sync(watermark)['results']], [rows[0].id])
+
+    def test_pages(self):
+        rows = self.create_measurements(5)
+        for row in rows[:2]:
+            self.client.delete(f'{self.url}{row.id}/')
+        self.create_measurements(2, start=10)
+        watermark, results, deleted, pages = '', [], [], 0
+        while True:
+            page = self.sync(watermark, page_size=2)
+            results += [row['id'] for row in page['results']]
+            deleted += page['deleted']
+            watermark, pages = page['watermark'], pages + 1
+            self.assertLessEqual(len(page['results']) + len(page['deleted']), 2)
+            if not page['more']:
+                break
+        self.assertEqual(sorted(results), sorted(Measurement.objects.values_list('id', flat=True)))
+        self.assertEqual(sorted(deleted), [rows[0].id, rows[1].id])
+
+    def test_other_users_are_not_synced(self):
+        self.create_measurements(2, user=self.staff)
+        self.assertEqual(self.sync()['results'], [])
+
+    def test_uploads_get_versions(self):
+        self.upload([measurement_data(index) for index in range(3)])
+        versions = list(Measurement.objects.order_by('id').values_list('sync_version', flat=True))
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertEqual(SyncCounter.objects.get(user=self.user).value, versions[-1])
+
+    def test_watermarks(self):
+        old = urlsafe_b64encode(json.dumps({'r': 1, 'd': 1, 't': 0}).encode()).decode()
+        self.assertEqual(self.client.get(f'{self.url}?since={old}').status_code, 410)
+        self.assertEqual(self.client.get(f'{self.url}?since=zzz').status_code, 400)
+        with mock.patch('django.utils.timezone.now', return_value=datetime(2020, 1, 1, tzinfo=dt_timezone.utc)):
+            expired = encode_watermark(5)
+        self.assertEqual(self.client.get(f'{self.url}?since={expired}').status_code, 410)
+
+    def test_versions_are_reserved_in_a_transaction(self):
+        with self.assertRaises(TransactionManagementError):
+            with mock.patch.object(transaction.get_connection(), 'in_atomic_block', False):
+                reserve_sync_versions(self.user.id, 1)
+
+    def test_purging_tombstones(self):
+        rows = self.create_measurements(2)
+        self.client.delete(f'{self.url}{rows[0].id}/')
+        Tombstone.objects.update(deleted_at=BASE_TIME - timedelta(days=365))
+        call_command('purge_tombstones', stdout=mock.MagicMock())
+        self.assertFalse(Tombstone.objects.exists())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentSyncTests(TransactionTestCase):
+
+    def test_a_transaction_committing_late_is_not_skipped(self):
+        user = create_user(1)
+        client = APIClient()
+        client.force_authenticate(user)
+        started, release = threading.Event(), threading.Event()
+
+        def write(index, hold):
+            try:
+                with transaction.atomic():
+                    Measurement(user=user, **measurement_data(index)).save()
+                    if hold:
+                        started.set()
+                        release.wait(10)
+            finally:
+                connection.close()
+
+        slow = threading.Thread(target=write, args=(0, True))
+        slow.start()
+        started.wait(10)
+        # the second writer has the next id, but waits for the first one to commit
+        fast = threading.Thread(target=write, args=(1, False))
+        fast.start()
+        fast.join(0.5)
+        first = client.get('/api/mobile/measurement/?since=').data
+        release.set()
+        slow.join()
+        fast.join()
+        second = client.get(f'/api/mobile/measurement/?since={first["watermark"]}').data
+        self.assertEqual(sorted(row['id'] for row in first['results'] + second['results']),
+                         sorted(Measurement.objects.values_list('id', flat=True)))
+
+
+
+class LiveTests(APITestCase):
+
+    def test_wsgi_requests_are_refused(self):
+        self.assertEqual(self.client.get('/api/mobile/measurement/live/').status_code, 501)
+        self.assertEqual(self.client.get('/api/mobile/measurement/live/?all=true').status_code, 403)
+
+    def test_ingests_are_published_after_commit(self):
+        broker = mock.Mock(**{'has_subscribers.return_value': True})
+        with mock.patch('mobile_reports.live.get_broker', return_value=broker):
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.upload([measurement_data(0, rsrp=-90), measurement_data(1, rsrp=-100, network_type='NR')])
+            broker.publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+        event = broker.publish.call_args.args[0]
+        self.assertEqual((event['user_id'], event['shared'], event['truncated']), (self.user.id, True, False))
+        self.assertEqual(event['delta']['network_types'], {'LTE': 1, 'NR': 1})
+        self.assertEqual(event['delta']['rsrp'], {'count': 2, 'sum': -190, 'min': -100, 'max': -90})
+        self.assertEqual(len(event['rows']), 2)
+
+    @override_settings(LIVE_MAX_ROWS=1)
+    def test_large_ingests_only_send_the_delta(self):
+        rows = self.create_measurements(2)
+        event = measurement_event(self.user.id, False, rows)
+        self.assertEqual((event['delta']['count'], event['truncated'], event['rows']), (2, True, []))
+
+    def test_stream_sends_accepted_events_and_heartbeats(self):
+        broker = LocalBroker()
+
+        async def receive():
+            stream = event_stream(lambda event: event['user_id'] == 1, heartbeat=0.05)
+            chunks = [await stream.__anext__()]
+            broker.publish({'type': 'measurements', 'user_id': 2})
+            broker.publish({'type': 'measurements', 'user_id': 1})
+            chunks += [await stream.__anext__(), await stream.__anext__()]
+            await stream.aclose()
+            return chunks
+        with mock.patch('mobile_reports.live.get_broker', return_value=broker):
+            chunks = async_to_sync(receive)()
+        self.assertEqual(chunks, [b'retry: 5000\n\n',
+                                  b'event: measurements\ndata: {"type": "measurements", "user_id": 1}\n\n',
+                                  b': keepalive\n\n'])
+        self.assertEqual(broker.subscriptions, set())
+
+    def test_slow_clients_are_told_to_resync(self):
+        async def overflow():
+            subscription = Subscription(lambda event: True)
+            for n in range(SUBSCRIPTION_QUEUE_SIZE + 1):
+                subscription.deliver({'n': n})
+            return subscription.queue.qsize(), subscription.queue.get_nowait()
+        self.assertEqual(async_to_sync(overflow)(), (1, RESYNC))
+
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'live-tests'}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CacheBrokerTests(TestCase):
+    # the poller thread reads the cache on a connection of its own, which would not see this test's
+    # uncommitted database cache rows, so these use a local memory cache shared by the threads
+
+    def setUp(self):
+        self.cache = cache
+        cache.clear()
+
+    def test_numbers_handed_out_twice_are_not_overwritten(self):
+        broker = CacheBroker()
+        self.cache.set(broker.sequence_key, 0, None)
+        incr = mock.Mock(side_effect=[1, 1, 2])
+        with mock.patch.object(self.cache, 'incr', incr):
+            self.assertEqual(broker.publish({'n': 1}), 1)
+            self.assertEqual(broker.publish({'n': 2}), 2)
+        self.assertEqual(self.cache.get_many(['live:event:1', 'live:event:2']),
+                         {'live:event:1': {'n': 1}, 'live:event:2': {'n': 2}})
+
+    def test_subscribers_of_other_processes_count(self):
+        publisher = CacheBroker()
+        self.assertFalse(publisher.has_subscribers())
+        self.cache.set(CacheBroker.listening_key, True, 10)
+        self.assertTrue(publisher.has_subscribers())
+
+    def test_events_reach_subscribers_of_another_broker(self):
+        publisher, listener = CacheBroker(), CacheBroker()
+        listener.poll_interval = 0.05
+
+        async def receive():
+            subscription = listener.subscribe(lambda event: event['n'] % 2 == 0)
+            await asyncio.sleep(0.2)  # the poller starts from the current sequence number
+            for n in range(4):
+                await sync_to_async(publisher.publish)({'n': n})
+            events = [await asyncio.wait_for(subscription.queue.get(), 5) for _ in range(2)]
+            poller = listener.poller
+            listener.unsubscribe(subscription)
+            return events, poller
+        events, poller = async_to_sync(receive)()
+        self.assertEqual(events, [{'n': 0}, {'n': 2}])
+        poller.join(5)  # stops with the last subscription
+        self.assertFalse(poller.is_alive())
+        self.assertIsNone(listener.poller)
+
+
+class IngestJobTests(APITestCase):
+
+    def enqueue(self, rows, **options):
+        response = self.client.post('/api/mobile/bulk_upload/measurement/?mode=async',
+                                    {'measurements': rows, **options}, format='json')
+        self.assertEqual(response.status_code, 202)
+        return IngestJob.objects.get(id=response.data['job']['id'])
+
+    def status(self, job):
+        response = self.client.get(f'/api/mobile/bulk_upload/jobs/{job.id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_queued_uploads_are_stored_by_the_worker(self):
+        job = self.enqueue([measurement_data(index) for index in range(5)])
+        self.assertEqual(Measurement.objects.count(), 0)
+        self.assertTrue(process_next())
+        self.assertFalse(process_next())
+        status = self.status(job)
+        self.assertEqual((status['status'], status['created'], status['validated']), ('done', 5, 5))
+        self.assertEqual(Measurement.objects.filter(user=self.user).count(), 5)
+
+    @override_settings(INGEST_JOB_CHUNK_SIZE=2)
+    def test_invalid_rows_fail_the_job(self):
+        job = self.enqueue([measurement_data(index) for index in range(4)] + [measurement_data(4, latitude='x')])
+        process_next()
+        status = self.status(job)
+        self.assertEqual(status['status'], 'failed')
+        self.assertEqual(list(status['errors']['measurements']), ['4'])
+        self.assertEqual(Measurement.objects.count(), 0)
+
+    def test_duplicates(self):
+        self.create_measurements(1)
+        failed = self.enqueue([measurement_data(0), measurement_data(1)])
+        ignored = self.enqueue([measurement_data(0), measurement_data(1)], on_conflict='ignore')
+        process_next()
+        process_next()
+        self.assertEqual(self.status(failed)['status'], 'failed')
+        self.assertEqual((self.status(ignored)['created'], self.status(ignored)['duplicates']), (1, 1))
+
+    def test_a_stalled_job_is_taken_over(self):
+        job = self.enqueue([measurement_data(0)])
+        stalled = claim()
+        self.assertIsNone(claim())
+        IngestJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(hours=1))
+        taken = claim()
+        self.assertEqual((taken.id, taken.attempts), (job.id, 2))
+        run(stalled)  # its claim is gone, nothing it does is kept
+        self.assertEqual(Measurement.objects.count(), 0)
+        run(taken)
+        self.assertEqual(IngestJob.objects.get(id=job.id).status, 'done')
+        self.assertEqual(Measurement.objects.count(), 1)
+
+    def test_other_users_jobs_are_hidden(self):
+        job = self.enqueue([measurement_data(0)])
+        self.assertEqual(self.staff_client.get(f'/api/mobile/bulk_upload/jobs/{job.id}/').status_code, 404)
+
+    def test_mode(self):
+        response = self.client.post('/api/mobile/bulk_upload/measurement/?mode=later', {'measurements': []},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+
+class DownloadTests(APITestCase):
+    url = '/api/mobile/HTTPTest/download/'
+
+    def payload(self, start, end):
+        body = b''.join(payload_chunks())
+        return b''.join(body[position % len(body):position % len(body) + 1] for position in range(start, end))
+
+    def test_payload_is_the_buffer_repeated(self):
+        size = len(b''.join(payload_chunks()))
+        for start, end in [(0, 10), (CHUNK_SIZE - 3, CHUNK_SIZE + 3), (size - 5, size + 5)]:
+            self.assertEqual(b''.join(iter_payload(start, end)), self.payload(start, end))
+        self.assertTrue(all(len(chunk) == CHUNK_SIZE for chunk in iter_payload(0, 3 * CHUNK_SIZE)))
+
+    def test_parse_range(self):
+        self.assertIsNone(parse_range(None, 100))
+        self.assertIsNone(parse_range('bytes=-', 100))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertEqual(parse_range('bytes=10-19', 100), (10, 20))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 100))
+        self.assertEqual(parse_range('bytes=-30', 100), (70, 100))
+        self.assertEqual(parse_range('bytes=50-500', 100), (50, 100))
+        for header in ('bytes=100-', 'bytes=20-10'):
+            with self.assertRaises(ValueError):
+                parse_range(header, 100)
+
+    def test_download(self):
+        response = self.client.get(f'{self.url}?bytes=1000')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response['Content-Type'], response['Content-Length']), ('application/octet-stream', '1000'))
+        self.assertEqual(b''.join(response.streaming_content), self.payload(0, 1000))
+
+    def test_ranges(self):
+        response = self.client.get(f'{self.url}?bytes=1000', HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/1000')
+        self.assertEqual(b''.join(response.streaming_content), self.payload(100, 200))
+        response = self.client.get(f'{self.url}?bytes=1000', HTTP_RANGE='bytes=1000-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */1000'))
+
+    def test_size_limits(self):
+        self.assertEqual(self.client.get(f'{self.url}?bytes=0').status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url}?bytes={10**12}').status_code, 400)
+
+    async def test_asgi_downloads_are_streamed(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = await AsyncClient().get(f'{self.url}?bytes=1000', headers=headers)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.payload(0, 1000))
+
+
+
+class UploadSpeedTests(APITestCase):
+    url = '/api/mobile/HTTPTest/upload/'
+
+    def upload_bytes(self, size, query=''):
+        return self.client.post(f'{self.url}{query}', b'x' * size, content_type='application/octet-stream')
+
+    def test_upload(self):
+        response = self.upload_bytes(3 * CHUNK_SIZE + 5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['bytes'], 3 * CHUNK_SIZE + 5)
+        self.assertGreaterEqual(response.data['duration_ms'], 0)
+        self.assertFalse(TestResult.objects.exists())
+
+    def test_saved_as_a_test_result(self):
+        response = self.upload_bytes(1000, '?save=true')
+        result = TestResult.objects.get(user=self.user)
+        self.assertEqual((result.test_type, result.success), ('HTTPU', True))
+        self.assertEqual(result.additional_info['bytes'], 1000)
+        self.assertEqual(response.data['test_result']['id'], result.id)
+
+    def test_the_body_is_not_parsed(self):
+        response = self.client.post(self.url, '{not json', content_type='application/json')
+        self.assertEqual((response.status_code, response.data['bytes']), (200, 9))
+
+    def test_asgi_body_timing(self):
+        messages = [{'type': 'http.request', 'body': b'a' * 10, 'more_body': True},
+                    {'type': 'http.request', 'body': b'b' * 5, 'more_body': False}]
+        seen = {}
+
+        async def app(scope, receive, send):
+            while (await receive()).get('more_body'):
+                pass
+            seen['transfer'] = scope[BODY_TIMING_KEY]
+
+        async def receive():
+            return messages.pop(0)
+        async_to_sync(BodyTimingMiddleware(app))({'type': 'http'}, receive, None)
+        self.assertEqual(seen['transfer'].bytes, 15)
+        self.assertIsNotNone(seen['transfer'].finished)
+
+    def test_the_asgi_timing_is_preferred(self):
+        received = Transfer(started=100, samples=[(100, 0), (101, 50)], finished=101)
+        request = mock.Mock(scope={BODY_TIMING_KEY: received}, read=mock.Mock(side_effect=[b'x' * 50, b'']))
+        self.assertIs(consume_upload(request), received)
+        request = mock.Mock(spec=['read'], read=mock.Mock(side_effect=[b'x' * 50, b'']))
+        self.assertEqual(consume_upload(request).bytes, 50)
+
+
+
+class SpeedTestSessionTests(APITestCase):
+    url = '/api/mobile/speedtest/'
+
+    def create_session(self, direction='download', streams=2):
+        response = self.client.post(self.url, {'direction': direction, 'streams': streams, 'stream_bytes': 1000,
+                                               'warmup_ms': 0}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def download(self, session):
+        response = self.client.get(f'{self.url}{session}/download/')
+        if response.status_code == 200:
+            self.assertEqual(len(b''.join(response.streaming_content)), 1000)
+        return response
+
+    def test_download_session(self):
+        session = self.create_session()
+        self.assertEqual(self.download(session).status_code, 200)
+        self.assertEqual(self.download(session).status_code, 200)
+        self.assertEqual(self.download(session).status_code, 409)
+        response = self.client.post(f'{self.url}{session}/finish/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['throughput']['streams'], response.data['throughput']['total_bytes']), (2, 2000))
+        self.assertEqual(TestResult.objects.get(user=self.user).test_type, 'HTTPD')
+        self.assertEqual(self.client.post(f'{self.url}{session}/finish/').status_code, 409)
+        self.assertEqual(self.download(session).status_code, 409)
+
+    def test_upload_session(self):
+        session = self.create_session('upload', streams=1)
+        response = self.client.post(f'{self.url}{session}/upload/', b'x' * 500, content_type='application/octet-stream')
+        self.assertEqual((response.status_code, response.data['bytes']), (200, 500))
+        self.assertEqual(self.download(session).status_code, 400)  # the wrong direction
+        self.client.post(f'{self.url}{session}/finish/')
+        self.assertEqual(TestResult.objects.get(user=self.user).test_type, 'HTTPU')
+
+    def test_streams_in_flight_hold_their_slot(self):
+        session = self.create_session()
+        running = [self.client.get(f'{self.url}{session}/download/') for _ in range(2)]  # bodies not sent yet
+        self.assertEqual([response.status_code for response in running], [200, 200])
+        self.assertEqual(self.download(session).status_code, 409)
+
+    def test_finish_needs_a_stream(self):
+        session = self.create_session()
+        self.assertEqual(self.client.post(f'{self.url}{session}/finish/').status_code, 400)
+
+    def test_expired_sessions(self):
+        session = self.create_session()
+        SpeedTestSession.objects.filter(id=session).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.download(session).status_code, 409)
+
+    def test_other_users_sessions(self):
+        session = self.create_session()
+        self.assertEqual(self.staff_client.get(f'{self.url}{session}/download/').status_code, 404)
+
+    def test_throughput_leaves_out_the_warmup(self):
+        transfers = [Transfer(0, [(0, 0), (1, 1000), (2, 3000)], 2), Transfer(0.5, [(0.5, 0), (2, 3000)], 2)]
+        result = throughput(transfers, 1)
+        self.assertEqual((result['bytes'], result['total_bytes'], result['duration_ms']), (4000, 6000, 1000))
+        self.assertEqual(result['throughput_mbps'], 0.032)
+        self.assertEqual(throughput(transfers, 5)['warmup_ms'], 0)  # longer than the streams
+
+
+class PartitionTests(APITestCase):
+
+    def detach(self, name, rows):
+        # what EXCHANGE PARTITION does on MySQL: the rows move to a table of the same shape
+        table = detached_table(name)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'mobile_reports_measurement'")
+            cursor.execute(cursor.fetchone()[0].replace('"mobile_reports_measurement"', f'"{table}"', 1))
+            cursor.execute(f'INSERT INTO "{table}" SELECT * FROM mobile_reports_measurement WHERE id IN '
+                           f'({", ".join(str(row.id) for row in rows)})')
+            cursor.execute(f'DELETE FROM mobile_reports_measurement WHERE id IN '
+                           f'({", ".join(str(row.id) for row in rows)})')
+
+    def expire(self, name, archive=False):
+        statements = []
+        command = ManagePartitionsCommand(stdout=mock.MagicMock(), stderr=mock.MagicMock())
+        with mock.patch.object(command, 'run', lambda batch, dry_run: statements.extend(batch)), \
+                self.captureOnCommitCallbacks(execute=True):
+            command.expire(name, datetime(2025, 8, 1, tzinfo=dt_timezone.utc), archive, dry_run=False)
+        return statements
+
+    def test_expired_partition_rows_are_archived(self):
+        self.upload([measurement_data(index) for index in range(5)])
+        self.upload([measurement_data(index, timestamp='2025-08-01T00:00:00Z') for index in range(1)])
+        with tempfile.TemporaryDirectory() as root, self.settings(MEASUREMENT_ARCHIVE_ROOT=root):
+            statements = self.expire('p202507', archive=True)
+            self.assertEqual(statements, expire_statements('p202507', False))
+            self.assertEqual(Measurement.objects.count(), 1)
+            self.assertEqual(MeasurementArchive.objects.get().rows, 5)
+            self.assertFalse(Tombstone.objects.exists())
+            response = self.client.get('/api/mobile/measurement/?archived=true')
+            self.assertEqual(len(response.data), 6)
+
+    def test_partitions_with_rows_left_are_kept(self):
+        self.upload([measurement_data(index) for index in range(2)])
+        with tempfile.TemporaryDirectory() as root, self.settings(MEASUREMENT_ARCHIVE_ROOT=root), \
+                mock.patch('mobile_reports.management.commands.manage_partitions.archive_month',
+                           side_effect=ArchiveConflict('rows deleted meanwhile')):
+            self.assertEqual(self.expire('p202507', archive=True), [])
+        self.assertEqual(Measurement.objects.count(), 2)
+
+    def test_expired_partition_rows_are_tombstoned(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('detach copies the table definition from sqlite_master')
+        self.upload([measurement_data(index) for index in range(5)])
+        self.upload([measurement_data(index, timestamp='2025-08-01T00:00:00Z') for index in range(1)])
+        old = list(Measurement.objects.filter(timestamp__lt=datetime(2025, 8, 1, tzinfo=dt_timezone.utc)))
+        since = encode_watermark(0)
+        self.detach('p202507', old)
+        with override_settings(BULK_DELETE_CHUNK_SIZE=2):
+            statements = self.expire('p202507')
+        self.assertEqual(statements, expire_statements('p202507', True))
+        self.assertEqual(set(Tombstone.objects.values_list('row_id', flat=True)), {row.id for row in old})
+        response = self.client.get(f'/api/mobile/measurement/?since={since}')
+        self.assertEqual(sorted(response.data['deleted']), sorted(row.id for row in old))
+        # only the August day is left in the rollups
+        self.assertEqual([row.bucket.month for row in DailyMeasurementRollup.objects.filter(user=self.user)], [8])
+
+    def test_statements(self):
+        self.assertEqual(detach_statements('p202507')[-1], 'ALTER TABLE `mobile_reports_measurement` EXCHANGE '
+                         'PARTITION p202507 WITH TABLE `mobile_reports_measurement_detached_p202507`')
+        self.assertEqual(expire_statements('p202507', False),
+                         ['ALTER TABLE `mobile_reports_measurement` DROP PARTITION p202507'])
+        self.assertEqual(expire_statements('p202507', True)[-1],
+                         'DROP TABLE `mobile_reports_measurement_detached_p202507`')
+
+    def test_measurements_need_a_timestamp(self):
+        data = measurement_data(0)
+        del data['timestamp']
+        response = self.client.post('/api/mobile/measurement/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('timestamp', response.data)
+
+
+def monthly(*months):
+    """(name, bound) of the monthly partitions of (year, month) pairs, then the catch-all."""
+    return [(f'p{year}{month:02d}', datetime(year + month // 12, month % 12 + 1, 1)) for year, month in months] + \
+        [('pmax', None)]
+
+
+def layout_names(layout):
+    return re.findall(r'PARTITION (\w+) VALUES', layout)
+
+
+class PartitionLayoutTests(SimpleTestCase):
+
+    def test_initial_layout(self):
+        now = datetime(2025, 7, 15, 12)
+        self.assertEqual(layout_names(initial_layout(None, now, 2)), ['p202507', 'p202508', 'p202509', 'pmax'])
+        self.assertEqual(layout_names(initial_layout(datetime(2025, 5, 31, 23, 59), now, 1)),
+                         ['p202505', 'p202506', 'p202507', 'p202508', 'pmax'])
+        # rows older than INITIAL_MONTHS share one partition
+        names = layout_names(initial_layout(datetime(2020, 1, 1), now, 0))
+        self.assertEqual((names[0], names[1], names[-2], len(names)), ('p202306_older', 'p202307', 'p202507', 27))
+        self.assertIn("PARTITION p202306_older VALUES LESS THAN ('2023-07-01 00:00:00')",
+                      initial_layout(datetime(2020, 1, 1), now, 0))
+
+    def test_initial_layout_across_the_year(self):
+        layout = initial_layout(None, datetime(2025, 12, 31, 23, 59, 59), 2)
+        self.assertEqual(layout_names(layout), ['p202512', 'p202601', 'p202602', 'pmax'])
+        self.assertIn("PARTITION p202602 VALUES LESS THAN ('2026-03-01 00:00:00')", layout)
+        self.assertEqual(layout_names(initial_layout(None, datetime(2026, 1, 1), 0)), ['p202601', 'pmax'])
+
+    def test_future_statements(self):
+        partitions = monthly((2025, 6), (2025, 7))
+        statement, = future_statements(partitions, datetime(2025, 7, 31, 23, 59, 59), 2)
+        self.assertEqual(statement, 'ALTER TABLE `mobile_reports_measurement` REORGANIZE PARTITION pmax INTO ('
+                         "PARTITION p202508 VALUES LESS THAN ('2025-09-01 00:00:00'), "
+                         "PARTITION p202509 VALUES LESS THAN ('2025-10-01 00:00:00'), "
+                         'PARTITION pmax VALUES LESS THAN (MAXVALUE))')
+        # a day later the month turned, one more month is due
+        statement, = future_statements(partitions, datetime(2025, 8, 1), 2)
+        self.assertIn('p202510', statement)
+
+    def test_future_statements_when_the_last_bound_is_reached(self):
+        # the last partition ends where the month `ahead` starts, that month gets its partition
+        statement, = future_statements(monthly((2025, 7), (2025, 8)), datetime(2025, 7, 1), 2)
+        self.assertEqual(statement.count('PARTITION p2025'), 1)
+        self.assertIn("PARTITION p202509 VALUES LESS THAN ('2025-10-01 00:00:00')", statement)
+        # it ends after that month, nothing to split
+        self.assertEqual(future_statements(monthly((2025, 7), (2025, 8), (2025, 9)), datetime(2025, 7, 1), 2), [])
+        self.assertEqual(future_statements(monthly((2025, 7)), datetime(2025, 7, 1), 0), [])
+
+    def test_future_statements_across_the_year(self):
+        statement, = future_statements(monthly((2025, 11), (2025, 12)), datetime(2025, 12, 31, 23, 59, 59), 2)
+        self.assertIn("PARTITION p202601 VALUES LESS THAN ('2026-02-01 00:00:00'), "
+                      "PARTITION p202602 VALUES LESS THAN ('2026-03-01 00:00:00'), PARTITION pmax", statement)
+        statement, = future_statements([('pmax', None)], datetime(2026, 1, 1), 0)
+        self.assertIn("PARTITION p202601 VALUES LESS THAN ('2026-02-01 00:00:00')", statement)
+
+    def test_expired_partitions(self):
+        partitions = [('p202501_older', datetime(2025, 2, 1))] + monthly((2025, 2), (2025, 3), (2025, 4))
+        # three full months kept before July: April, May and June
+        cutoff = retention_cutoff(datetime(2025, 7, 31, 23, 59, 59), 3)
+        self.assertEqual(cutoff, datetime(2025, 4, 1))
+        self.assertEqual(expired_partitions(partitions, cutoff), ['p202501_older', 'p202502', 'p202503'])
+        # August keeps May to July, April expires
+        cutoff = retention_cutoff(datetime(2025, 8, 1), 3)
+        self.assertEqual(expired_partitions(partitions, cutoff), ['p202501_older', 'p202502', 'p202503', 'p202504'])
+        self.assertEqual(expired_partitions(partitions, retention_cutoff(datetime(2025, 8, 1), 12)), [])
+
+    def test_expired_partitions_across_the_year(self):
+        partitions = monthly((2025, 10), (2025, 11), (2025, 12))
+        self.assertEqual(retention_cutoff(datetime(2026, 1, 1), 2), datetime(2025, 11, 1))
+        self.assertEqual(expired_partitions(partitions, retention_cutoff(datetime(2026, 1, 1), 2)), ['p202510'])
+        self.assertEqual(retention_cutoff(datetime(2026, 2, 28), 14), datetime(2024, 12, 1))
+
+    def test_existing_partitions(self):
+        rows = [('p202506_older', "'2025-07-01 00:00:00'"), ('p202507', "'2025-08-01 00:00:00'"), ('pmax', 'MAXVALUE')]
+        with mock.patch('mobile_reports.partitions.connection') as connection:
+            connection.cursor.return_value.__enter__.return_value.fetchall.return_value = rows
+            partitions = existing_partitions()
+        self.assertEqual(partitions, [('p202506_older', datetime(2025, 7, 1)), ('p202507', datetime(2025, 8, 1)),
+                                      ('pmax', None)])
+        with mock.patch('mobile_reports.partitions.connection') as connection:
+            connection.cursor.return_value.__enter__.return_value.fetchall.return_value = []
+            self.assertEqual(existing_partitions(), [])
+
+
+class ArchiveTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings = self.settings(MEASUREMENT_ARCHIVE_ROOT=root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.upload([measurement_data(index, rsrp=-80 - index) for index in range(5)])
+        self.rows = list(Measurement.objects.filter(user=self.user).order_by('timestamp'))
+        # the three oldest go to the archive
+        self.archive = archive_month(self.user.id, BASE_TIME, BASE_TIME + timedelta(seconds=3))
+        self.archived = self.rows[:3]
+
+    def ids(self, rows):
+        return [row['id'] for row in rows]
+
+    def test_the_listing_reads_the_archive_only_when_asked(self):
+        with mock.patch('mobile_reports.archive.pq.read_table') as read_table:
+            response = self.client.get('/api/mobile/measurement/')
+        read_table.assert_not_called()
+        self.assertEqual(self.ids(response.data), [row.id for row in reversed(self.rows[3:])])
+        response = self.client.get('/api/mobile/measurement/?archived=true')
+        self.assertEqual(self.ids(response.data), [row.id for row in reversed(self.rows)])
+        ids, url = [], '/api/mobile/measurement/?archived=true&page_size=2'
+        while url:
+            response = self.client.get(url)
+            ids, url = ids + self.ids(response.data['results']), response.data['next']
+        self.assertEqual(ids, [row.id for row in reversed(self.rows)])
+
+    def test_archived_rows_are_retrieved_and_deleted_by_id(self):
+        row = self.archived[1]
+        response = self.client.get(f'/api/mobile/measurement/{row.id}/')
+        self.assertEqual((response.status_code, response.data['rsrp']), (200, row.rsrp))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/mobile/measurement/{row.id}/').status_code, 204)
+        self.assertEqual(self.client.get(f'/api/mobile/measurement/{row.id}/').status_code, 404)
+        self.assertTrue(Tombstone.objects.filter(row_id=row.id).exists())
+        manifest = MeasurementArchive.objects.get()
+        self.assertEqual((manifest.rows, manifest.first_id, manifest.last_id),
+                         (2, self.archived[0].id, self.archived[2].id))
+        self.assertFalse(os.path.exists(full_path(self.archive.path)))
+        self.assertTrue(os.path.exists(full_path(manifest.path)))
+
+    def test_bulk_and_range_deletes_reach_the_archive(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/mobile/bulk_delete/measurement/',
+                                        {'ids': [self.archived[0].id, self.rows[4].id]}, format='json')
+        self.assertIn('2 measurement', response.data['detail'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/mobile/bulk_delete/measurement/range/',
+                                        {'end': (BASE_TIME + timedelta(seconds=3)).isoformat()}, format='json')
+        self.assertEqual(response.data['deleted'], 3)
+        self.assertFalse(MeasurementArchive.objects.exists())
+        self.assertEqual(os.listdir(os.path.dirname(full_path(self.archive.path))), [])
+        self.assertEqual(set(Tombstone.objects.values_list('row_id', flat=True)), {row.id for row in self.rows[:5]})
+
+    def test_bulk_delete_errors(self):
+        url, data = '/api/mobile/bulk_delete/measurement/', {'ids': [self.rows[4].id]}
+        with mock.patch('mobile_reports.views.delete_rows', side_effect=DatabaseError):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual((response.status_code, response.data['detail']), (417, 'error while deleting,0 records deleted'))
+        with mock.patch('mobile_reports.views.delete_archived', side_effect=OSError), self.assertRaises(OSError):
+            self.client.post(url, data, format='json')
+
+    def test_archived_timestamps_are_duplicates(self):
+        self.assertEqual(self.upload([measurement_data(1)]).status_code, 409)
+        response = self.upload([measurement_data(1), measurement_data(10)], on_conflict='ignore')
+        self.assertEqual((response.data['created'], response.data['duplicates']), (1, 1))
+        response = self.client.post('/api/mobile/measurement/', measurement_data(2), format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rollups_count_archived_rows(self):
+        hourly = HourlyMeasurementRollup.objects.get(user=self.user)
+        rebuild(self.user)
+        self.assertEqual(HourlyMeasurementRollup.objects.get(user=self.user).count, 5)
+        self.assertEqual(HourlyMeasurementRollup.objects.get(user=self.user).rsrp_min, hourly.rsrp_min)
+        self.client.delete(f'/api/mobile/measurement/{self.archived[2].id}/')
+        self.assertEqual(HourlyMeasurementRollup.objects.get(user=self.user).count, 4)
+
+
+def tile_of(latitude, longitude, z):
+    n = 2 ** z
+    row = (1 - math.log(math.tan(math.radians(latitude)) + 1 / math.cos(math.radians(latitude))) / math.pi) / 2
+    return int((longitude + 180) / 360 * n), int(row * n)
+
+
+class TileTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.x, self.y = tile_of(35.7, 51.4, 12)
+        self.url = f'/api/mobile/measurement/tiles/12/{self.x}/{self.y}/?grid=4'
+
+    def count(self, client=None, url=None):
+        response = (client or self.client).get(url or self.url)
+        self.assertEqual(response.status_code, 200)
+        return sum(cell['count'] for cell in response.data['cells'])
+
+    def test_cells(self):
+        self.create_measurements(5)
+        response = self.client.get(self.url)
+        south, west, north, east = tile_bounds(12, self.x, self.y)
+        for cell in response.data['cells']:
+            self.assertTrue(0 <= cell['x'] < 4 and 0 <= cell['y'] < 4)
+            self.assertEqual(cell['network_type'], 'LTE')
+            self.assertEqual((cell['rsrp_mean'], cell['rsrp_median']), (-90, -90))
+            cell_south, cell_west, cell_north, cell_east = cell['bounds']
+            self.assertTrue(south <= cell_south < cell_north <= north and west <= cell_west < cell_east <= east)
+        self.assertEqual(sum(cell['count'] for cell in response.data['cells']), 5)
+
+    def test_uploads_invalidate_the_cached_tiles(self):
+        self.create_measurements(3)
+        self.assertEqual(self.count(), 3)
+        Measurement.objects.filter(user=self.user).update(rsrp=-70)
+        self.assertEqual(self.client.get(self.url).data['cells'][0]['rsrp_mean'], -90)  # served from the cache
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload([measurement_data(index) for index in range(3, 5)])
+        self.assertEqual(self.count(), 5)
+
+    def test_deletes_invalidate_the_cached_tiles(self):
+        rows = self.create_measurements(6)
+        self.assertEqual(self.count(), 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/mobile/measurement/{rows[0].id}/')
+        self.assertEqual(self.count(), 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/mobile/bulk_delete/measurement/', {'ids': [rows[1].id]}, format='json')
+        self.assertEqual(self.count(), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/mobile/bulk_delete/measurement/range/',
+                             {'end': (BASE_TIME + timedelta(seconds=3)).isoformat()}, format='json')
+        self.assertEqual(self.count(), 2)
+
+    def test_all_users_tiles_time_out_instead(self):
+        self.user.allow_admin_access = True
+        self.user.save()
+        rows = self.create_measurements(2)
+        with mock.patch('mobile_reports.tiles.cache.set', wraps=cache.set) as cache_set:
+            self.assertEqual(self.count(self.staff_client, f'{self.url}&all=true'), 2)
+        self.assertEqual(cache_set.call_args.args[2], 60)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/mobile/measurement/{rows[0].id}/')
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(self.count(self.staff_client, f'{self.url}&all=true'), 2)
@@ -0,0 +1,131 @@
+import math
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, FloatField, IntegerField, Value
+from django.db.models.functions import Cast, Cos, Floor, Ln, Pi, Radians, Tan
+from django.dispatch import receiver
+from users.purge import account_purged
+from users.signals import admin_access_changed
+from . import generations
+from .geo import TILE_KEY_ZOOM, interleave
+from .models import Measurement
+from .signals import rows_deleted, rows_ingested
+
+MAX_ZOOM = 22
+GRID_SIZES = (4, 8, 16, 32, 64)
+
+
+def tile_bounds(z, x, y):
+    """(south, west, north, east) of a slippy map tile in degrees."""
+    n = 2 ** z
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    return latitude(y + 1), x / n * 360 - 180, latitude(y), (x + 1) / n * 360 - 180
+
+
+def grid_cells(queryset, z, x, y, grid):
+    """
+    Bin the measurements of tile z/x/y into a grid x grid raster with one GROUP BY over
+    (cell, network_type, rsrp), the rsrp histogram gives exact medians.
+    """
+    south, west, north, east = tile_bounds(z, x, y)
+    n = 2 ** z * grid
+    latitude = Radians('latitude')
+    column = Floor((F('longitude') + 180.0) / 360.0 * n, output_field=FloatField())
+    row = Floor((Value(1.0) - Ln(Tan(latitude) + Value(1.0) / Cos(latitude)) / Pi()) / 2.0 * n, output_field=FloatField())
+    # the tile is one contiguous tile_key range, the coordinates only trim points on its edges
+    shift = 2 * (TILE_KEY_ZOOM - z)
+    rows = (queryset.filter(tile_key__gte=interleave(x, y) << shift, tile_key__lt=(interleave(x, y) + 1) << shift,
+                            latitude__gte=south, latitude__lte=north, longitude__gte=west, longitude__lte=east)
+            .annotate(gx=Cast(column, IntegerField()) - x * grid, gy=Cast(row, IntegerField()) - y * grid)
+            .values('gx', 'gy', 'network_type', 'rsrp').annotate(count=Count('id')).order_by())
+
+    cells = {}
+    for item in rows:
+        gx, gy = item['gx'], item['gy']
+        if not (0 <= gx < grid and 0 <= gy < grid):
+            continue  # points exactly on the right or bottom edge belong to the next tile
+        cell = cells.setdefault((gx, gy), {'count': 0, 'types': {}, 'rsrp': {}})
+        cell['count'] += item['count']
+        cell['types'][item['network_type']] = cell['types'].get(item['network_type'], 0) + item['count']
+        if item['rsrp'] is not None:
+            cell['rsrp'][item['rsrp']] = cell['rsrp'].get(item['rsrp'], 0) + item['count']
+
+    result = []
+    for (gx, gy), cell in sorted(cells.items()):
+        result.append({
+            'x': gx,
+            'y': gy,
+            # a grid cell is exactly the tile `log2(grid)` zoom levels deeper
+            'bounds': list(tile_bounds(z + grid.bit_length() - 1, x * grid + gx, y * grid + gy)),
+            'count': cell['count'],
+            'rsrp_mean': mean(cell['rsrp']),
+            'rsrp_median': median(cell['rsrp']),
+            'network_type': max(sorted(cell['types']), key=cell['types'].get),
+        })
+    return result
+
+
+def mean(histogram):
+    total = sum(histogram.values())
+    return sum(value * count for value, count in histogram.items()) / total if total else None
+
+
+def median(histogram):
+    total = sum(histogram.values())
+    if not total:
+        return None
+    values = sorted(histogram)
+    def nth(rank):
+        for value in values:
+            rank -= histogram[value]
+            if rank < 0:
+                return value
+    return (nth((total - 1) // 2) + nth(total // 2)) / 2
+
+
+def tile_cache_key(scope, z, x, y, grid, network_type):
+    return f'tiles:{scope}:{generations.current(f"tiles:generation:{scope}")}:{z}/{x}/{y}:{grid}:{network_type or ""}'
+
+
+def invalidate(user_ids, shared=False):
+    # bumping the generation orphans every cached tile of the scope, they expire on their own; the
+    # tiles of every user's rows are only bumped when sharing changes, otherwise they time out quickly
+    keys = {f'tiles:generation:user:{user_id}' for user_id in user_ids}
+    if shared:
+        keys.add('tiles:generation:all')
+    transaction.on_commit(lambda: generations.bump(keys))
+
+
+@receiver(rows_ingested, sender=Measurement)
+def invalidate_ingested(sender, rows, **kwargs):
+    invalidate({row.user_id for row in rows})
+
+
+@receiver(rows_deleted, sender=Measurement)
+def invalidate_deleted(sender, rows, **kwargs):
+    # archived rows leave the tiles as well, they are drawn from the table only
+    invalidate({user_id for _, user_id, _ in rows})
+
+
+@receiver(account_purged)
+def invalidate_purged(sender, account_id, **kwargs):
+    invalidate({account_id}, shared=True)
+
+
+@receiver(admin_access_changed)
+def invalidate_shared(sender, user_ids, **kwargs):
+    # the tiles of every user's measurements only draw those shared with staff
+    invalidate((), shared=True)
+
+
+def get_tile(queryset, scope, z, x, y, grid=16, network_type=None):
+    key = tile_cache_key(scope, z, x, y, grid, network_type)
+    tile = cache.get(key)
+    if tile is None:
+        if network_type:
+            queryset = queryset.filter(network_type=network_type)
+        tile = {'z': z, 'x': x, 'y': y, 'grid': grid, 'cells': grid_cells(queryset, z, x, y, grid)}
+        cache.set(key, tile, settings.SHARED_SCOPE_CACHE_TIMEOUT if scope == 'all' else settings.MAP_TILE_CACHE_TIMEOUT)
+    return tile
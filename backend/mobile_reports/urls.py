@@ -9,6 +9,7 @@ router.register('test_result', TestResultViewSet, 'test_result')
 router.register('bulk_upload', BulkUploadViewSet, 'bulk_upload')
 router.register('bulk_delete', BulkDeleteViewSet, 'bulk_delete')
 router.register('HTTPTest', HTTPTestViewSet, 'HTTPTest')
+router.register('speedtest', SpeedTestViewSet, 'speedtest')
 
 urlpatterns = [
 
@@ -1,97 +1,135 @@
+from bisect import bisect_right
+
+# network types reported by the app, per radio access technology
+RAT_NETWORK_TYPES = {
+    'GSM': ('GSM', 'GPRS', 'EDGE'),
+    'UMTS': ('UMTS', 'WCDMA', 'HSPA', 'HSPA+', 'HSDPA', 'HSUPA', '3G'),
+    'LTE': ('LTE', 'LTE-Adv', 'LTE+'),
+    'NR': ('5G', 'NR'),
+}
+NETWORK_TYPE_RAT = {network_type: rat for rat, types in RAT_NETWORK_TYPES.items() for network_type in types}
+
+# downlink channel ranges as (first, last, band, f_offset, step, n_offset),
+# frequency in MHz = f_offset + step * (channel - n_offset), the same labels the app uses.
+# ranges within a technology must not overlap, where 3GPP reuses channel numbers the band
+# deployed here wins (DCS 1800 over PCS 1900, the NR n78 block over n77)
+BANDS = {
+    'GSM': [  # TS 45.005
+        (0, 124, 'GSM 900', 935.0, 0.2, 0),
+        (128, 251, 'GSM 850', 869.2, 0.2, 128),
+        (512, 885, 'GSM 1800', 1805.2, 0.2, 512),
+        (955, 1023, 'Extended GSM 900', 935.0, 0.2, 1024),
+    ],
+    'UMTS': [  # TS 25.101, general and additional channels
+        (412, 687, 'WCDMA Band 2', 1850.1, 0.2, 0),
+        (1007, 1087, 'WCDMA Band 5', 670.1, 0.2, 0),
+        (1162, 1513, 'WCDMA Band 3', 1575.0, 0.2, 0),
+        (1537, 1738, 'WCDMA Band 4', 1805.0, 0.2, 0),
+        (1887, 2087, 'WCDMA Band 4', 1735.1, 0.2, 0),
+        (2237, 2563, 'WCDMA Band 7', 2175.0, 0.2, 0),
+        (2937, 3088, 'WCDMA Band 8', 340.0, 0.2, 0),
+        (4357, 4458, 'WCDMA Band 5', 0.0, 0.2, 0),
+        (9662, 9938, 'WCDMA Band 2', 0.0, 0.2, 0),
+        (10562, 10838, 'WCDMA Band 1', 0.0, 0.2, 0),
+    ],
+    'LTE': [  # TS 36.101
+        (first, last, f'LTE Band {band}', f_low, 0.1, first)
+        for band, first, last, f_low in (
+            (1, 0, 599, 2110.0), (2, 600, 1199, 1930.0), (3, 1200, 1949, 1805.0),
+            (4, 1950, 2399, 2110.0), (5, 2400, 2649, 869.0), (6, 2650, 2749, 875.0),
+            (7, 2750, 3449, 2620.0), (8, 3450, 3799, 925.0), (9, 3800, 4149, 1844.9),
+            (10, 4150, 4749, 2110.0), (11, 4750, 4949, 1475.9), (12, 5010, 5179, 729.0),
+            (13, 5180, 5279, 746.0), (14, 5280, 5379, 758.0), (17, 5730, 5849, 734.0),
+            (18, 5850, 5999, 860.0), (19, 6000, 6149, 875.0), (20, 6150, 6449, 791.0),
+            (21, 6450, 6599, 1495.9), (22, 6600, 7399, 3510.0), (24, 7700, 8039, 1525.0),
+            (25, 8040, 8689, 1930.0), (26, 8690, 9039, 859.0), (27, 9040, 9209, 852.0),
+            (28, 9210, 9659, 758.0), (29, 9660, 9769, 717.0), (30, 9770, 9869, 2350.0),
+            (31, 9870, 9919, 462.5), (32, 9920, 10359, 1452.0), (33, 36000, 36199, 1900.0),
+            (34, 36200, 36349, 2010.0), (35, 36350, 36949, 1850.0), (36, 36950, 37549, 1930.0),
+            (37, 37550, 37749, 1910.0), (38, 37750, 38249, 2570.0), (39, 38250, 38649, 1880.0),
+            (40, 38650, 39649, 2300.0), (41, 39650, 41589, 2496.0), (42, 41590, 43589, 3400.0),
+            (43, 43590, 45589, 3600.0), (66, 66436, 67335, 2110.0), (71, 68586, 68935, 617.0),
+        )
+    ],
+    'NR': [  # TS 38.104, frequencies follow the global raster
+        (first, last, f'NR Band n{band}', *(
+            (0.0, 0.005, 0) if first < 600000 else
+            (3000.0, 0.015, 600000) if first < 2016667 else
+            (24250.08, 0.06, 2016667)))
+        for band, first, last in (
+            (71, 123400, 130400), (28, 151600, 160600), (5, 173800, 178800), (8, 185000, 192000),
+            (3, 361000, 376000), (2, 386000, 398000), (1, 422000, 434000), (40, 460000, 480000),
+            (41, 499200, 537999), (78, 620000, 653333), (77, 653334, 680000), (79, 693334, 733333),
+            (258, 2016667, 2070832), (257, 2070833, 2104165),
+        )
+    ],
+}
+
+
+class BandTable:
+    """
+    Sorted, non-overlapping channel ranges of one technology, looked up by binary search.
+    """
+
+    def __init__(self, bands):
+        self.bands = sorted(bands)
+        for previous, band in zip(self.bands, self.bands[1:]):
+            if band[0] <= previous[1]:
+                raise ValueError(f'{band[2]} overlaps {previous[2]}')
+        self.firsts = [band[0] for band in self.bands]
+
+    def lookup(self, channel):
+        """Return (frequency in MHz, band name), or (None, None) outside every band."""
+        index = bisect_right(self.firsts, channel) - 1
+        if index < 0:
+            return None, None
+        first, last, name, f_offset, step, n_offset = self.bands[index]
+        if channel > last:
+            return None, None
+        return round(f_offset + step * (channel - n_offset), 3), name
+
+
+BAND_TABLES = {rat: BandTable(bands) for rat, bands in BANDS.items()}
+
+
+def arfcn_to_band(arfcn, network_type):
+    """Return (downlink frequency in MHz, band name) of a channel number, (None, None) if unknown."""
+    table = BAND_TABLES.get(NETWORK_TYPE_RAT.get(network_type))
+    if table is None or type(arfcn) is not int:
+        return None, None
+    return table.lookup(arfcn)
+
 
 def arfcn_to_frequency(arfcn : int, network_type : str) -> float:
-    
-    if arfcn is None or network_type in [None , 'UNKNOWN']:
-        return None
-    
-    if network_type in ('GSM', 'GPRS', 'EDGE'):
-        # GSM bands
-        if 0 <= arfcn <= 124:
-            return 890.0 + 0.2 * arfcn  # GSM 900
-        elif 955 <= arfcn <= 1023:
-            return 890.0 + 0.2 * (arfcn - 1024)  # GSM 900 Extended
-        elif 512 <= arfcn <= 885:
-            return 1710.2 + 0.2 * (arfcn - 512)  # DCS 1800
-        elif 128 <= arfcn <= 251:
-            return 824.2 + 0.2 * (arfcn - 128)  # GSM 850
-        elif 512 <= arfcn <= 810:
-            return 1850.2 + 0.2 * (arfcn - 512)  # PCS 1900
-        else:
-            return None
-    
-    elif network_type in ('UMTS', 'HSPA', 'HSPA+'):
-        # UMTS bands
-        if 0 <= arfcn <= 124:
-            return 2110.0 - 0.2 * (10562 - arfcn)  # Band I (2100)
-        elif 512 <= arfcn <= 885:
-            return 1930.0 - 0.2 * (9662 - arfcn)  # Band II (1900)
-        elif 256 <= arfcn <= 511:
-            return 1805.0 - 0.2 * (9262 - arfcn)  # Band III (1800)
-        elif 1537 <= arfcn <= 1738:
-            return 2110.0 - 0.2 * (1537 - arfcn)  # Band IV (1700/2100)
-        elif 4357 <= arfcn <= 4458:
-            return 869.0 - 0.1 * (4357 - arfcn)  # Band V (850)
-        elif 4387 <= arfcn <= 4413:
-            return 2620.0 - 0.2 * (4387 - arfcn)  # Band VII (2600)
-        else:
-            return None
-    
-    elif network_type in ('LTE', 'LTE-Adv'):
-        # LTE bands (بر اساس جدول 3GPP TS 36.101)
-        if 0 <= arfcn <= 599:
-            return 2110.0 + 0.1 * (arfcn - 0)  # Band 1 (2100)
-        elif 600 <= arfcn <= 1199:
-            return 1930.0 + 0.1 * (arfcn - 600)  # Band 2 (1900)
-        elif 1200 <= arfcn <= 1949:
-            return 1805.0 + 0.1 * (arfcn - 1200)  # Band 3 (1800)
-        elif 1950 <= arfcn <= 2399:
-            return 2110.0 + 0.1 * (arfcn - 1950)  # Band 4 (1700/2100)
-        elif 2400 <= arfcn <= 2649:
-            return 869.0 + 0.1 * (arfcn - 2400)  # Band 5 (850)
-        elif 2650 <= arfcn <= 2749:
-            return 875.0 + 0.1 * (arfcn - 2650)  # Band 6 (800)
-        elif 2750 <= arfcn <= 3449:
-            return 2620.0 + 0.1 * (arfcn - 2750)  # Band 7 (2600)
-        elif 3450 <= arfcn <= 3799:
-            return 925.0 + 0.1 * (arfcn - 3450)  # Band 8 (900)
-        elif 3800 <= arfcn <= 4149:
-            return 1844.9 + 0.1 * (arfcn - 3800)  # Band 9 (1800)
-        elif 4150 <= arfcn <= 4749:
-            return 2110.0 + 0.1 * (arfcn - 4150)  # Band 10 (1700/2100)
-        elif 5010 <= arfcn <= 5179:
-            return 1475.9 + 0.1 * (arfcn - 5010)  # Band 11 (1500)
-        elif 5180 <= arfcn <= 5279:
-            return 729.9 + 0.1 * (arfcn - 5180)  # Band 12 (700)
-        elif 5280 <= arfcn <= 5379:
-            return 746.0 + 0.1 * (arfcn - 5280)  # Band 13 (700)
-        elif 5730 <= arfcn <= 5849:
-            return 758.0 + 0.1 * (arfcn - 5730)  # Band 14 (700)
-        elif 5760 <= arfcn <= 5999:
-            return 869.0 + 0.1 * (arfcn - 5760)  # Band 17 (700)
-        elif 6000 <= arfcn <= 6149:
-            return 791.0 + 0.1 * (arfcn - 6000)  # Band 18 (800)
-        else:
-            return None
-    
-    elif network_type == '5G':
-        # NR bands (5G)
-        if 0 <= arfcn <= 2016667:
-            # FR1 (Sub-6 GHz)
-            if 422000 <= arfcn <= 434000:
-                return 617.0 + 0.015 * (arfcn - 422000)  # n71 (600 MHz)
-            elif 386000 <= arfcn <= 398000:
-                return 703.0 + 0.015 * (arfcn - 386000)  # n12 (700 MHz)
-            elif 399000 <= arfcn <= 404000:
-                return 728.0 + 0.015 * (arfcn - 399000)  # n28 (700 MHz)
-            elif 120000 <= arfcn <= 130000:
-                return 1930.0 + 0.015 * (arfcn - 120000)  # n1 (2100 MHz)
-            elif 185000 <= arfcn <= 191000:
-                return 859.0 + 0.015 * (arfcn - 185000)  # n5 (850 MHz)
-            else:
-                return None
-        else:
-            # FR2 (mmWave)
-            return None
-    
-    else:
-        return None
\ No newline at end of file
+    return arfcn_to_band(arfcn, network_type)[0]
+
+
+def arfcns_to_bands(arfcns, network_types):
+    """
+    Batch form of `arfcn_to_band`, each distinct (arfcn, network_type) pair is looked up once; a sorted
+    bisect pass over the batch measured slower with benchmark_arfcn.
+    """
+    seen = {}
+    result = []
+    for pair in zip(arfcns, network_types):
+        bands = seen.get(pair)
+        if bands is None:
+            bands = seen[pair] = arfcn_to_band(*pair)
+        result.append(bands)
+    return result
+
+
+def fill_frequencies(measurements):
+    """Set missing `frequency` / `frequency_band` of measurements from their arfcn, returns the changed ones."""
+    changed = []
+    bands = arfcns_to_bands([m.arfcn for m in measurements], [m.network_type for m in measurements])
+    for measurement, (frequency, band) in zip(measurements, bands):
+        if frequency is None:
+            continue
+        if measurement.frequency is None or measurement.frequency_band is None:
+            if measurement.frequency is None:
+                measurement.frequency = frequency
+            if measurement.frequency_band is None:
+                measurement.frequency_band = band
+            changed.append(measurement)
+    return changed
@@ -0,0 +1,200 @@
+import math
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import MaxLengthValidator, MaxValueValidator, MinValueValidator
+from rest_framework import serializers
+from rest_framework.fields import empty, ProhibitNullCharactersValidator, ProhibitSurrogateCharactersValidator
+
+# plausible bounds for measurement fields, shared by the serializers and the columnar validator.
+# timings use -1 as the app's "not measured" value
+MEASUREMENT_RANGES = {
+    'latitude': {'min_value': -90, 'max_value': 90},
+    'longitude': {'min_value': -180, 'max_value': 180},
+    'rsrp': {'min_value': -156, 'max_value': -31},
+    'rsrq': {'min_value': -43, 'max_value': 20},
+    'http_upload': {'min_value': -1},
+    'http_download': {'min_value': -1},
+    'ping_time': {'min_value': -1},
+    'dns_response': {'min_value': -1},
+    'web_response': {'min_value': -1},
+    'sms_delivery_time': {'min_value': -1},
+}
+
+# Android's CellInfo.UNAVAILABLE, what the app sends for a signal value the modem did not report
+CELL_INFO_UNAVAILABLE = 2 ** 31 - 1
+SIGNAL_FIELDS = ('rsrp', 'rsrq', 'rscp', 'ecIo', 'rxLev')
+
+SLOW = object()
+
+
+class SignalField(serializers.IntegerField):
+    # CELL_INFO_UNAVAILABLE is stored as null, before the bounds are checked
+
+    def validate_empty_values(self, data):
+        return super().validate_empty_values(None if data == CELL_INFO_UNAVAILABLE else data)
+
+
+class SignalFieldsMixin:
+    # for model serializers of Measurement
+
+    def build_standard_field(self, field_name, model_field):
+        field_class, field_kwargs = super().build_standard_field(field_name, model_field)
+        if field_name in SIGNAL_FIELDS:
+            field_class = SignalField
+        return field_class, field_kwargs
+
+
+class ColumnarValidator:
+    """
+    Validate rows against a serializer one column at a time with plain type and bound checks; rows
+    that fail are re-run through the serializer, so data and errors match `ListField(child=serializer)`.
+    """
+
+    def __init__(self, serializer_class):
+        self.child = serializer_class()
+        self.fields = [field for field in self.child.fields.values() if not field.read_only]
+        self.validates_rows = (type(self.child).validate is not serializers.Serializer.validate
+                               or bool(self.child.validators))
+
+    def validate(self, rows):
+        """Return (validated rows, errors by row index)."""
+        for field in self.fields:
+            if isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone'):
+                # resolve the active timezone once instead of once per value
+                field.timezone = field.default_timezone()
+        results = [{} if isinstance(row, dict) else SLOW for row in rows]
+        for field in self.fields:
+            self.validate_column(field, rows, results)
+
+        errors = {}
+        for index, result in enumerate(results):
+            if result is not SLOW and self.validates_rows:
+                try:
+                    self.child.run_validators(result)
+                    results[index] = result = self.child.validate(result)
+                except (serializers.ValidationError, DjangoValidationError):
+                    result = SLOW
+            if result is SLOW:
+                try:
+                    results[index] = self.child.run_validation(rows[index])
+                except serializers.ValidationError as e:
+                    errors[index] = e.detail
+        return [result for index, result in enumerate(results) if index not in errors], errors
+
+    def validate_column(self, field, rows, results):
+        name, source = field.field_name, field.source
+        column = [row.get(name, empty) if result is not SLOW else empty
+                  for row, result in zip(rows, results)]
+        convert = self.converter(field)
+        custom = getattr(self.child, f'validate_{name}', None)
+        signal = isinstance(field, SignalField)
+
+        for index, value in enumerate(column):
+            result = results[index]
+            if result is SLOW:
+                continue
+            if signal and value == CELL_INFO_UNAVAILABLE:
+                value = None
+            if value is empty:
+                if field.required or field.default is not empty:
+                    results[index] = SLOW
+                continue
+            if value is None:
+                if not field.allow_null:
+                    results[index] = SLOW
+                    continue
+                result[source] = None
+                continue
+            value = convert(value)
+            if value is SLOW:
+                results[index] = SLOW
+                continue
+            if custom is not None:
+                try:
+                    value = custom(value)
+                except (serializers.ValidationError, DjangoValidationError):
+                    results[index] = SLOW
+                    continue
+            result[source] = value
+
+    def converter(self, field):
+        bounds = self.bounds(field)
+        if isinstance(field, serializers.IntegerField) and bounds is not None:
+            return self.integer(bounds, field)
+        if isinstance(field, serializers.FloatField) and bounds is not None:
+            return self.float(bounds, field)
+        if type(field) is serializers.CharField and self.plain_char(field):
+            return self.char(field)
+        return self.generic(field)
+
+    @staticmethod
+    def bounds(field):
+        low, high = -math.inf, math.inf
+        for validator in field.validators:
+            if isinstance(validator, MinValueValidator) and not callable(validator.limit_value):
+                low = max(low, validator.limit_value)
+            elif isinstance(validator, MaxValueValidator) and not callable(validator.limit_value):
+                high = min(high, validator.limit_value)
+            else:
+                return None
+        return low, high
+
+    @staticmethod
+    def plain_char(field):
+        return field.trim_whitespace and all(
+            isinstance(validator, (MaxLengthValidator, ProhibitNullCharactersValidator,
+                                   ProhibitSurrogateCharactersValidator))
+            for validator in field.validators)
+
+    def integer(self, bounds, field):
+        low, high = bounds
+        generic = self.generic(field)
+
+        def convert(value):
+            if type(value) is int and low <= value <= high:
+                return value
+            # integral floats such as 12.0 are accepted by IntegerField, it parses str(value)
+            if type(value) is float and value.is_integer() and abs(value) < 1e16 and low <= value <= high:
+                return int(value)
+            return generic(value)
+        return convert
+
+    def float(self, bounds, field):
+        low, high = bounds
+        generic = self.generic(field)
+
+        def convert(value):
+            if type(value) is float or type(value) is int:
+                try:
+                    converted = float(value)
+                except OverflowError:
+                    return generic(value)
+                if low <= converted <= high and math.isfinite(converted):
+                    return converted
+            return generic(value)
+        return convert
+
+    def char(self, field):
+        max_length = field.max_length if field.max_length is not None else math.inf
+        generic = self.generic(field)
+
+        def convert(value):
+            if type(value) is str and value.isascii() and '\x00' not in value:
+                stripped = value.strip()
+                if len(stripped) <= max_length and (stripped or field.allow_blank):
+                    return stripped
+            return generic(value)
+        return convert
+
+    @staticmethod
+    def generic(field):
+        # empty and null values never get here, so for plain fields without validators
+        # to_internal_value is all run_validation would do
+        plain = not field.validators and type(field).run_validation is serializers.Field.run_validation
+        parse = field.to_internal_value if plain else field.run_validation
+
+        def convert(value):
+            try:
+                return parse(value)
+            except (serializers.ValidationError, DjangoValidationError):
+                return SLOW
+        return convert
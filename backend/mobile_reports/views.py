@@ -5,9 +5,37 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated , IsAdminUser
 from .permissions import IsNotBanned
+from .pagination import KeysetPagination
+from .filters import BoundingBoxFilter
+from .parsers import GzipJSONParser, MessagePackParser, XMessagePackParser
+from rest_framework.parsers import FormParser, MultiPartParser
+from .streaming import *
+from .stats import filter_measurements, measurement_stats
+from django.http import StreamingHttpResponse
+from django.db import DatabaseError, IntegrityError, transaction
+from .signals import rows_ingested
+from .ingest import is_duplicate
+from .rollups import GRANULARITIES, filter_rollups, rollup_series
+from .tiles import get_tile
+from .network_types import network_types, refresh_network_types
+from .conditional import ConditionalListMixin, conditional
+from .sync import DeltaSyncMixin, delete_in_chunks, delete_rows
+from .archive import ArchiveListMixin, check_not_archived, delete_archived
+from .live import event_stream
+from .renderers import EventStreamRenderer, OctetStreamRenderer
+from rest_framework.renderers import JSONRenderer
+from django.core.handlers.asgi import ASGIRequest
+from django.shortcuts import get_object_or_404
+from rest_framework.reverse import reverse
+from .jobs import enqueue
 from rest_framework.viewsets import GenericViewSet , ModelViewSet , mixins
 from rest_framework.decorators import action
-from random import randbytes
+from rest_framework.exceptions import ValidationError
+from .speedtest import consume_upload, parse_range, save_test_result, stream_payload, throughput, Transfer
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -28,6 +56,9 @@ class DeviceViewSet(ModelViewSet):
 class MeasurementViewSet(mixins.CreateModelMixin,
                    mixins.RetrieveModelMixin,
                    mixins.DestroyModelMixin,
+                   DeltaSyncMixin,
+                   ConditionalListMixin,
+                   ArchiveListMixin,
                    mixins.ListModelMixin,
                    GenericViewSet):
     
@@ -36,9 +67,26 @@ class MeasurementViewSet(mixins.CreateModelMixin,
     
     serializer_class = MeasurementSerializer
     permission_classes = [IsAuthenticated,IsNotBanned]
+    pagination_class = KeysetPagination
+    filter_backends = [BoundingBoxFilter]
     
     def perform_create(self, serializer):
-        serializer.save(user = self.request.user)
+        try:
+            with transaction.atomic():
+                check_not_archived(Measurement, self.request.user.id, {serializer.validated_data['timestamp']})
+                instance = serializer.save(user = self.request.user)
+                rows_ingested.send(sender=type(instance), rows=[instance])
+        except IntegrityError as e:
+            if not is_duplicate(e):
+                raise
+            raise ValidationError({'timestamp': ['a report with this timestamp already exists for this user']})
+    
+    def perform_destroy(self, instance):
+        if instance._state.adding:  # found in the archive, see ArchiveListMixin.get_object
+            delete_archived(instance.user_id, ids=[instance.pk])
+        else:
+            delete_rows(Measurement.objects.filter(pk=instance.pk))
+        refresh_network_types(instance.user_id)
         
     @action(methods=['GET'],detail=False)
     def latest(self, request):
@@ -49,23 +97,98 @@ class MeasurementViewSet(mixins.CreateModelMixin,
     @action(methods=['GET'],detail=False)
     def get_all(self, request):
         if request.user.is_staff:
-            data = Measurement.objects.filter(user__allow_admin_access = True)
-            serializer = self.get_serializer(data, many=True)
+            data = self.filter_queryset(Measurement.objects.filter(user__allow_admin_access = True))
+            return conditional(request, Measurement, 'all', lambda: self.all_measurements(data))
         else:
             return Response({'detail': 'access denied:admin access level is required for this operation'},status=status.HTTP_403_FORBIDDEN)
+    
+    def all_measurements(self, data):
+        export = self.request.query_params.get('export')
+        if export is not None:
+            return self.export(data, export)
+        page = self.paginate_queryset(data)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(data, many=True)
         return Response(serializer.data ,status=status.HTTP_200_OK)
     
+    def export(self, queryset, export_format):
+        if export_format not in EXPORT_FORMATS:
+            return Response({'detail': f'export format must be one of {", ".join(EXPORT_FORMATS)}'},status=status.HTTP_400_BAD_REQUEST)
+        stream = export_stream(queryset, model_fields(Measurement), export_format,
+                               isinstance(self.request._request, ASGIRequest))
+        return StreamingHttpResponse(stream, content_type=EXPORT_FORMATS[export_format])
+    
+    @action(methods=['GET'],detail=False)
+    def stats(self, request):
+        serializer = MeasurementStatsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        if params['all'] and not request.user.is_staff:
+            return Response({'detail': 'access denied:admin access level is required for this operation'},status=status.HTTP_403_FORBIDDEN)
+        queryset = Measurement.objects.filter(user__allow_admin_access = True) if params['all'] else self.get_queryset()
+        queryset = filter_measurements(queryset, params.get('network_type'), params.get('start'), params.get('end'))
+        return Response(measurement_stats(queryset, params['utc_offset'], params['bucket']),status=status.HTTP_200_OK)
+    
+    @action(methods=['GET'],detail=False)
+    def rollups(self, request):
+        serializer = MeasurementStatsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        if params['all'] and not request.user.is_staff:
+            return Response({'detail': 'access denied:admin access level is required for this operation'},status=status.HTTP_403_FORBIDDEN)
+        model = GRANULARITIES[params['bucket']][0]
+        queryset = model.objects.filter(user__allow_admin_access = True) if params['all'] else model.objects.filter(user=request.user)
+        queryset = filter_rollups(queryset, params.get('network_type'), params.get('start'), params.get('end'))
+        return Response(rollup_series(queryset),status=status.HTTP_200_OK)
+    
+    @action(methods=['GET'],detail=False,url_path=r'tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)')
+    def tiles(self, request, z=None, x=None, y=None):
+        serializer = MapTileSerializer(data={**request.query_params.dict(), 'z': z, 'x': x, 'y': y})
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        if params['all'] and not request.user.is_staff:
+            return Response({'detail': 'access denied:admin access level is required for this operation'},status=status.HTTP_403_FORBIDDEN)
+        if params['all']:
+            queryset, scope = Measurement.objects.filter(user__allow_admin_access = True), 'all'
+        else:
+            queryset, scope = self.get_queryset(), f'user:{request.user.id}'
+        tile = get_tile(queryset, scope, params['z'], params['x'], params['y'], params['grid'], params.get('network_type'))
+        return Response(tile,status=status.HTTP_200_OK)
+    
+    @action(methods=['GET'],detail=False,renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def live(self, request):
+        serializer = LiveSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        if serializer.validated_data['all'] and not request.user.is_staff:
+            return Response({'detail': 'access denied:admin access level is required for this operation'},status=status.HTTP_403_FORBIDDEN)
+        if not isinstance(request._request, ASGIRequest):
+            # a WSGI worker would be held for the whole connection
+            return Response({'detail': 'live updates are only served by the ASGI application'},status=status.HTTP_501_NOT_IMPLEMENTED)
+        if serializer.validated_data['all']:
+            accept = lambda event: event['shared']
+        else:
+            user_id = request.user.id
+            accept = lambda event: event['user_id'] == user_id
+        response = StreamingHttpResponse(event_stream(accept), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
     @action(methods=['GET'],detail=False)
     def get_network_types(self, request):
         if request.user.is_staff:
-            network_types=Measurement.objects.order_by('network_type').values_list('network_type', flat=True).distinct()
+            types=network_types()
         else:
-            network_types=self.get_queryset().order_by('network_type').values_list('network_type', flat=True).distinct()
-        return Response(list(network_types) ,status=status.HTTP_200_OK)
+            types=network_types(request.user.id)
+        return Response(types ,status=status.HTTP_200_OK)
 
 class TestResultViewSet(mixins.CreateModelMixin,
                    mixins.RetrieveModelMixin,
                    mixins.DestroyModelMixin,
+                   DeltaSyncMixin,
+                   ConditionalListMixin,
                    mixins.ListModelMixin,
                    GenericViewSet):
     
@@ -74,9 +197,20 @@ class TestResultViewSet(mixins.CreateModelMixin,
         
     serializer_class = TestResultSerializer
     permission_classes = [IsAuthenticated,IsNotBanned]
+    pagination_class = KeysetPagination
     
     def perform_create(self, serializer):
-        serializer.save(user = self.request.user)
+        try:
+            with transaction.atomic():
+                instance = serializer.save(user = self.request.user)
+                rows_ingested.send(sender=type(instance), rows=[instance])
+        except IntegrityError as e:
+            if not is_duplicate(e):
+                raise
+            raise ValidationError({'timestamp': ['a report with this timestamp already exists for this user']})
+    
+    def perform_destroy(self, instance):
+        delete_rows(TestResult.objects.filter(pk=instance.pk))
         
     @action(methods=['GET'],detail=False)
     def latest(self, request):
@@ -88,27 +222,68 @@ class TestResultViewSet(mixins.CreateModelMixin,
     
 class BulkUploadViewSet(GenericViewSet):
     
+    parser_classes = [GzipJSONParser, MessagePackParser, XMessagePackParser, FormParser, MultiPartParser]
+    
     def get_serializer_class(self):
         if self.action == 'measurement':
             return BulkUploadMeasurementSerializer
         elif self.action == 'test_report':
             return BulkUploadTestResultSerializer
+        elif self.action == 'job':
+            return IngestJobSerializer
     
     permission_classes = [IsAuthenticated,IsNotBanned]
     
     @action(methods=['POST'],detail=False)
     def measurement(self,request):
+        if self.is_async(request):
+            return self.enqueue(request, 'measurement')
         serializer = self.get_serializer(data=request.data ,context={"user": request.user})
         serializer.is_valid(raise_exception=True)
-        result = serializer.save()
-        return Response({'detail':f'{len(result)} measurement reports has successfully created'},status=status.HTTP_201_CREATED)
+        return self.save(serializer, 'measurement reports')
 
     @action(methods=['POST'],detail=False)
     def test_report(self,request):
+        if self.is_async(request):
+            return self.enqueue(request, 'test_report')
         serializer = self.get_serializer(data=request.data,context={"user": request.user})
         serializer.is_valid(raise_exception=True)
-        result = serializer.save()
-        return Response({'detail':f'{len(result[0])} test reports has successfully created'},status=status.HTTP_201_CREATED) 
+        return self.save(serializer, 'test reports')
+    
+    @action(methods=['GET'],detail=False,url_path=r'jobs/(?P<job_id>\d+)')
+    def job(self, request, job_id=None):
+        job = get_object_or_404(IngestJob.objects.defer('payload'), id=job_id, user=request.user)
+        return Response(self.get_serializer(job).data,status=status.HTTP_200_OK)
+    
+    def is_async(self, request):
+        serializer = BulkUploadModeSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['mode'] == 'async'
+    
+    def enqueue(self, request, kind):
+        # only the envelope is checked here, the rows are validated by process_ingest_jobs
+        serializer = self.get_serializer_class().envelope(data=request.data,context={"user": request.user})
+        serializer.is_valid(raise_exception=True)
+        rows = len(serializer.validated_data[serializer.rows_field])
+        job = enqueue(request.user, kind, request.data, rows)
+        location = reverse('bulk_upload-job', kwargs={'job_id': job.id}, request=request)
+        return Response({'detail':f'{rows} rows are queued',
+                         'job':IngestJobSerializer(job).data,
+                         'status_url':location},status=status.HTTP_202_ACCEPTED,headers={'Location': location})
+    
+    def save(self, serializer, name):
+        try:
+            serializer.save()
+        except IntegrityError as e:
+            if not is_duplicate(e):
+                raise
+            return Response({'detail':f'some {name} already exist for this user and timestamp, '
+                                      'resend with "on_conflict": "ignore" to skip them'},status=status.HTTP_409_CONFLICT)
+        return Response({'detail':f'{serializer.created_count} {name} has successfully created',
+                         'created':serializer.created_count,
+                         'duplicates':serializer.duplicate_count,
+                         'rejected':serializer.rejected,
+                         'batches':serializer.batch_timings},status=status.HTTP_201_CREATED)
     
 
 
@@ -122,11 +297,15 @@ class BulkDeleteViewSet(GenericViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         validated_data = serializer.validated_data
+        delete_count = 0
         try:
-            delete_count,_ = Measurement.objects.filter(user = request.user,
-                                                        id__in = validated_data['ids']).delete()
-        except: #set a good except for it
+            delete_count = delete_rows(Measurement.objects.filter(user = request.user,
+                                                                  id__in = validated_data['ids']))
+        except DatabaseError:
             return Response({'detail':f'error while deleting,{delete_count} records deleted'},status=status.HTTP_417_EXPECTATION_FAILED)
+        # outside the try, a failing archive is a server error rather than a partial delete
+        delete_count += delete_archived(request.user.id, ids=validated_data['ids'])
+        refresh_network_types(request.user.id)
 
         return Response({'detail':f'{delete_count} measurement reports has successfully deleted'},status=status.HTTP_200_OK)
 
@@ -135,14 +314,53 @@ class BulkDeleteViewSet(GenericViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         validated_data = serializer.validated_data
+        delete_count = 0
         try:
-            delete_count,_ = TestResult.objects.filter(user = request.user
-                                                       ,id__in = validated_data['ids']).delete()
-        except: #set a good except for it
+            delete_count = delete_rows(TestResult.objects.filter(user = request.user
+                                                                 ,id__in = validated_data['ids']))
+        except DatabaseError:
             return Response({'detail':f'error while deleting,{delete_count} records deleted'},status=status.HTTP_417_EXPECTATION_FAILED)
 
         return Response({'detail':f'{delete_count} measurement reports has successfully deleted'},status=status.HTTP_200_OK)
     
+    @action(methods=['POST'],detail=False,url_path='measurement/range',serializer_class=DeleteRangeSerializer)
+    def measurement_range(self,request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        queryset = Measurement.objects.filter(user=request.user)
+        if 'network_type' in params:
+            queryset = queryset.filter(network_type=params['network_type'])
+        archived = lambda: delete_archived(request.user.id, start=params.get('start'), end=params.get('end'),
+                                           network_type=params.get('network_type'))
+        response = self.delete_range(self.filter_range(queryset, params), 'measurement reports', archived)
+        refresh_network_types(request.user.id)
+        return response
+    
+    @action(methods=['POST'],detail=False,url_path='test_report/range',serializer_class=DeleteRangeSerializer)
+    def test_report_range(self,request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        if 'network_type' in params:
+            return Response({'network_type': ['test reports have no network type']},status=status.HTTP_400_BAD_REQUEST)
+        return self.delete_range(self.filter_range(TestResult.objects.filter(user=request.user), params), 'test reports')
+    
+    def filter_range(self, queryset, params):
+        if 'start' in params:
+            queryset = queryset.filter(timestamp__gte=params['start'])
+        if 'end' in params:
+            queryset = queryset.filter(timestamp__lte=params['end'])
+        return queryset
+    
+    def delete_range(self, queryset, name, archived=None):
+        # `archived` deletes the matching archived rows, once the table has none left
+        deleted, chunks, more = delete_in_chunks(queryset)
+        if archived is not None and not more:
+            deleted += archived()
+        detail = f'{deleted} {name} deleted' + (', send the request again to delete the rest' if more else '')
+        return Response({'detail': detail, 'deleted': deleted, 'chunks': chunks, 'more': more},status=status.HTTP_200_OK)
+
 
 
 class HTTPTestViewSet(GenericViewSet):
@@ -152,10 +370,114 @@ class HTTPTestViewSet(GenericViewSet):
     
     permission_classes = [IsAuthenticated,IsNotBanned]
     
-    @action(methods=['GET'],detail=False)
+    @action(methods=['GET'],detail=False,renderer_classes=[JSONRenderer, OctetStreamRenderer])
     def download(self,request):
-        return Response(data=str(randbytes(2**19)),status=status.HTTP_200_OK)
+        serializer = HTTPDownloadSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        size = serializer.validated_data['bytes']
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            return Response({'detail': 'requested range not satisfiable'},status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                            headers={'Content-Range': f'bytes */{size}'})
+        start, end = byte_range or (0, size)
+        response = StreamingHttpResponse(stream_payload(start, end, isinstance(request._request, ASGIRequest)),
+                                         content_type='application/octet-stream',
+                                         status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK)
+        response['Content-Length'] = end - start
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'no-store, no-transform'
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        return response
         
-    @action(methods=['POST'],detail=False)
+    @action(methods=['POST'],detail=False,renderer_classes=[JSONRenderer, OctetStreamRenderer])
     def upload(self,request = None):
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = HTTPUploadSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        # the body is read raw from the underlying request, request.data would parse it
+        transfer = consume_upload(request._request)
+        result = {
+            'bytes': transfer.bytes,
+            'duration_ms': round(transfer.seconds * 1000, 3),
+            'throughput_mbps': round(transfer.bytes * 8 / transfer.seconds / 10**6, 3) if transfer.seconds > 0 else None,
+        }
+        if serializer.validated_data['save']:
+            instance = save_test_result(request.user, 'HTTPU', result)
+            result['test_result'] = TestResultSerializer(instance).data if instance else None
+        return Response(result,status=status.HTTP_200_OK)
+
+
+
+class SpeedTestViewSet(mixins.CreateModelMixin,
+                       mixins.RetrieveModelMixin,
+                       GenericViewSet):
+    """
+    Multi-stream speed tests: create a session, run its `streams` downloads or uploads in parallel
+    against it, then `finish` it to combine them into one HTTPD / HTTPU test result.
+    """
+    
+    def get_queryset(self):
+        return SpeedTestSession.objects.filter(user=self.request.user)
+    
+    serializer_class = SpeedTestSessionSerializer
+    permission_classes = [IsAuthenticated,IsNotBanned]
+    
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+    
+    @action(methods=['GET'],detail=True,renderer_classes=[JSONRenderer, OctetStreamRenderer])
+    def download(self, request, pk=None):
+        session = self.get_object()
+        closed = self.closed(session, 'download')
+        if closed is not None:
+            return closed
+        record = lambda transfer: self.record(session, transfer)
+        response = StreamingHttpResponse(stream_payload(0, session.stream_bytes, isinstance(request._request, ASGIRequest), record),
+                                         content_type='application/octet-stream')
+        response['Content-Length'] = session.stream_bytes
+        response['Cache-Control'] = 'no-store, no-transform'
+        return response
+    
+    @action(methods=['POST'],detail=True,renderer_classes=[JSONRenderer, OctetStreamRenderer])
+    def upload(self, request, pk=None):
+        session = self.get_object()
+        closed = self.closed(session, 'upload')
+        if closed is not None:
+            consume_upload(request._request)
+            return closed
+        transfer = consume_upload(request._request)
+        self.record(session, transfer)
+        return Response({'bytes': transfer.bytes, 'duration_ms': round(transfer.seconds * 1000, 3)},status=status.HTTP_200_OK)
+    
+    @action(methods=['POST'],detail=True)
+    def finish(self, request, pk=None):
+        with transaction.atomic():
+            session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if session.is_finished:
+                return Response({'detail': 'this session is already finished'},status=status.HTTP_409_CONFLICT)
+            transfers = [Transfer(stream.started_at, stream.samples, stream.finished_at) for stream in session.transfers.all()]
+            if not transfers:
+                return Response({'detail': 'no stream of this session has completed'},status=status.HTTP_400_BAD_REQUEST)
+            result = throughput(transfers, session.warmup_ms / 1000)
+            session.result = save_test_result(request.user, SpeedTestSession.TEST_TYPES[session.direction], result)
+            session.is_finished = True
+            session.save(update_fields=['result', 'is_finished'])
+        return Response({**self.get_serializer(session).data, 'throughput': result},status=status.HTTP_200_OK)
+    
+    def closed(self, session, direction):
+        if session.direction != direction:
+            return Response({'detail': f'this session measures the {session.direction} speed'},status=status.HTTP_400_BAD_REQUEST)
+        if session.is_finished or session.created_at < timezone.now() - timedelta(seconds=settings.SPEED_TEST_SESSION_TIMEOUT):
+            return Response({'detail': 'this session is closed'},status=status.HTTP_409_CONFLICT)
+        # the stream takes its slot in the same UPDATE that checks for a free one, so concurrent
+        # requests cannot all see the last slot free the way counting finished streams would
+        reserved = (SpeedTestSession.objects.filter(pk=session.pk, is_finished=False, reserved__lt=F('streams'))
+                                            .update(reserved=F('reserved') + 1))
+        if not reserved:
+            return Response({'detail': f'all {session.streams} streams of this session have run'},status=status.HTTP_409_CONFLICT)
+        return None
+    
+    def record(self, session, transfer):
+        SpeedTestStream.objects.create(session=session, bytes=transfer.bytes, started_at=transfer.started,
+                                       finished_at=transfer.finished, samples=transfer.samples)
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'polaris.settings')
 
 application = get_asgi_application()
+
+from mobile_reports.speedtest import BodyTimingMiddleware  # noqa: E402 needs the settings configured
+
+application = BodyTimingMiddleware(application)
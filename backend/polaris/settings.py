@@ -22,6 +22,34 @@ SMS_API_TOKEN = env('SMS_API_TOKEN')
 BASE_URL = f"api"
 ADMIN_PASSWORD = hash(env('ADMIN_PASSWORD'))
 AUTH_USER_MODEL = 'users.User'
+BULK_UPLOAD_BATCH_SIZE = env.int('BULK_UPLOAD_BATCH_SIZE', default=500)
+BULK_VALIDATION_ENGINE = env('BULK_VALIDATION_ENGINE', default='columnar') # 'columnar' or 'serializer'
+BULK_UPLOAD_MAX_DECOMPRESSED_SIZE = env.int('BULK_UPLOAD_MAX_DECOMPRESSED_SIZE', default=200 * 1024 * 1024)
+MAP_TILE_CACHE_TIMEOUT = env.int('MAP_TILE_CACHE_TIMEOUT', default=300)
+SHARED_SCOPE_CACHE_TIMEOUT = env.int('SHARED_SCOPE_CACHE_TIMEOUT', default=60) # seconds the staff views of every user's rows may lag behind uploads and deletes
+NETWORK_TYPES_CACHE_TIMEOUT = env.int('NETWORK_TYPES_CACHE_TIMEOUT', default=600)
+SYNC_TOMBSTONE_RETENTION_DAYS = env.int('SYNC_TOMBSTONE_RETENTION_DAYS', default=30)
+LIVE_BROKER_BACKEND = env('LIVE_BROKER_BACKEND', default='mobile_reports.live.CacheBroker') # LocalBroker with a single process
+LIVE_HEARTBEAT_INTERVAL = env.int('LIVE_HEARTBEAT_INTERVAL', default=15)
+LIVE_MAX_ROWS = env.int('LIVE_MAX_ROWS', default=200) # larger ingests only push their aggregate delta
+INGEST_JOB_CHUNK_SIZE = env.int('INGEST_JOB_CHUNK_SIZE', default=5000)
+INGEST_JOB_TIMEOUT = env.int('INGEST_JOB_TIMEOUT', default=600) # seconds before a running job is taken over
+HTTP_TEST_BUFFER_SIZE = env.int('HTTP_TEST_BUFFER_SIZE', default=4 * 1024 * 1024) # random bytes kept in memory per process
+HTTP_TEST_MAX_BYTES = env.int('HTTP_TEST_MAX_BYTES', default=256 * 1024 * 1024)
+SPEED_TEST_MAX_STREAMS = env.int('SPEED_TEST_MAX_STREAMS', default=16)
+SPEED_TEST_SESSION_TIMEOUT = env.int('SPEED_TEST_SESSION_TIMEOUT', default=300) # seconds a session accepts streams
+BULK_DELETE_CHUNK_SIZE = env.int('BULK_DELETE_CHUNK_SIZE', default=2000) # rows deleted per transaction
+BULK_DELETE_TIME_LIMIT = env.int('BULK_DELETE_TIME_LIMIT', default=20) # seconds a delete request runs before asking to be resent
+MEASUREMENT_PARTITIONS_AHEAD = env.int('MEASUREMENT_PARTITIONS_AHEAD', default=3) # months, see manage_partitions
+MEASUREMENT_RETENTION_MONTHS = env.int('MEASUREMENT_RETENTION_MONTHS', default=0) # 0 keeps every measurement
+MEASUREMENT_RETENTION_POLICY = env('MEASUREMENT_RETENTION_POLICY', default='archive') # 'archive' moves expired months to the Parquet archive, 'drop' deletes them
+MEASUREMENT_ARCHIVE_AFTER_DAYS = env.int('MEASUREMENT_ARCHIVE_AFTER_DAYS', default=365) # see archive_measurements
+MEASUREMENT_ARCHIVE_ROOT = env('MEASUREMENT_ARCHIVE_ROOT', default=str(BASE_DIR / 'archive'))
+ACCOUNT_PURGE_TIMEOUT = env.int('ACCOUNT_PURGE_TIMEOUT', default=600) # seconds before a running purge is taken over
+AUTH_PRINCIPAL_CACHE_SIZE = env.int('AUTH_PRINCIPAL_CACHE_SIZE', default=10000)
+AUTH_PRINCIPAL_CACHE_TTL = env.int('AUTH_PRINCIPAL_CACHE_TTL', default=5) # seconds, how late other workers may see a ban without a shared cache
+AUTH_PRINCIPAL_SHARED_CACHE = env('AUTH_PRINCIPAL_SHARED_CACHE', default='') # a CACHES alias shared by the workers, if any
+AUTH_PRINCIPAL_SHARED_CACHE_TTL = env.int('AUTH_PRINCIPAL_SHARED_CACHE_TTL', default=300)
 
 if VERIFICATION_METHOD not in ['email','phone_number']:
     raise NameError(f'{VERIFICATION_METHOD} is not a valid verification method')
@@ -95,6 +123,12 @@ DATABASES = {
     }
 }
 
+# Cache shared by the web workers, the ingest and purge workers and the manage.py commands, which
+# all invalidate what the others cached; redis://host:6379/0 works as well
+CACHES = {
+    'default': env.cache('CACHE_URL', default='dbcache://polaris_cache?max_entries=100000'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -146,7 +180,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
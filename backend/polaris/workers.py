@@ -0,0 +1,68 @@
+from datetime import timedelta
+import logging
+from time import sleep
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def claim(queryset, timeout):
+    """
+    Take the oldest pending task of `queryset` (status, started_at, attempts), or a running one not
+    finished within `timeout` seconds; SKIP LOCKED keeps workers from waiting on each other.
+    """
+    stale = timezone.now() - timedelta(seconds=timeout)
+    with transaction.atomic():
+        task = (queryset.select_for_update(skip_locked=True)
+                        .filter(Q(status='pending') | Q(status='running', started_at__lt=stale))
+                        .order_by('id').first())
+        if task is None:
+            return None
+        queryset.model.objects.filter(id=task.id).update(status='running', started_at=timezone.now(),
+                                                         attempts=F('attempts') + 1)
+    return queryset.model.objects.get(id=task.id)
+
+
+def claimed(task):
+    # the task, as long as no other worker has claimed it since
+    return type(task).objects.filter(id=task.id, attempts=task.attempts)
+
+
+def process_next(claim, run, fail):
+    """Run the task `claim()` returns, `fail(task)` if it raises; returns False when there was none."""
+    task = claim()
+    if task is None:
+        return False
+    try:
+        run(task)
+    except Exception:
+        logger.exception('%s %s failed', task._meta.verbose_name, task.id)
+        fail(task)
+    return True
+
+
+class WorkerCommand(BaseCommand):
+    """Calls `process_next` until stopped, or until the queue is empty with --once."""
+    processed = 'tasks'
+    sleep = 1.0
+
+    def process_next(self):
+        raise NotImplementedError
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='exit when the queue is empty')
+        parser.add_argument('--sleep', type=float, default=self.sleep, help='seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            if self.process_next():
+                processed += 1
+                continue
+            if options['once']:
+                break
+            sleep(options['sleep'])
+        self.stdout.write(f'processed {processed} {self.processed}')
@@ -1,4 +1,33 @@
 from django.contrib import admin
 from .models import *
+from .purge import request_purge
 # Register your models here.
-admin.site.register(User)
\ No newline at end of file
+
+
+@admin.register(User)
+class UserAdmin(admin.ModelAdmin):
+    # deleting a user disables it and leaves the rows to process_account_purges,
+    # collecting them here would load every measurement of the account
+    
+    def get_deleted_objects(self, objs, request):
+        perms_needed = set() if self.has_delete_permission(request) else {self.opts.verbose_name}
+        return [str(obj) for obj in objs], {self.opts.verbose_name_plural: len(objs)}, perms_needed, []
+    
+    def delete_model(self, request, obj):
+        request_purge(obj)
+    
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            request_purge(user)
+
+
+@admin.register(AccountPurge)
+class AccountPurgeAdmin(admin.ModelAdmin):
+    list_display = ['phone_number', 'status', 'deleted', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .models import users_updated
+
+User = get_user_model()
+
+# what authentication and the permission checks read, everything else is loaded on first access
+PRINCIPAL_FIELDS = ('id', 'is_active', 'is_staff', 'is_superuser', 'is_banned', 'allow_admin_access')
+
+
+class LRUCache:
+    """
+    Bounded in-process cache, the least recently used entry goes first and entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = time.monotonic() + self.ttl, value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+principals = LRUCache(settings.AUTH_PRINCIPAL_CACHE_SIZE, settings.AUTH_PRINCIPAL_CACHE_TTL)
+
+
+def shared_cache():
+    alias = settings.AUTH_PRINCIPAL_SHARED_CACHE
+    return caches[alias] if alias else None
+
+
+def cache_key(user_id):
+    return f'principal:{user_id}'
+
+
+def load_principal(user_id):
+    """
+    The principal fields of a user as a tuple, None when there is no such user, from the shared
+    cache when one is configured, otherwise from the local one.
+    """
+    user_id = str(user_id)  # the token claim is a string
+    shared = shared_cache()
+    if shared is None:
+        values = principals.get(user_id)
+        if values is None:
+            values = User.objects.filter(id=user_id).values_list(*PRINCIPAL_FIELDS).first()
+            if values is not None:
+                principals.set(user_id, values)
+        return values
+    values = shared.get(cache_key(user_id))
+    if values is None:
+        values = User.objects.filter(id=user_id).values_list(*PRINCIPAL_FIELDS).first()
+        if values is not None:
+            shared.set(cache_key(user_id), values, settings.AUTH_PRINCIPAL_SHARED_CACHE_TTL)
+    return values
+
+
+def principal(values):
+    """
+    A User with only the principal fields loaded, the others are deferred and read together on first
+    access, so it can be used anywhere a user fetched from the database is.
+    """
+    loaded = dict(zip(PRINCIPAL_FIELDS, values))
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in loaded]
+    return User.from_db(DEFAULT_DB_ALIAS, field_names, [loaded[name] for name in field_names])
+
+
+def invalidate_principal(user_id):
+    user_id = str(user_id)
+    principals.delete(user_id)
+    shared = shared_cache()
+    if shared is not None:
+        shared.delete(cache_key(user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # ban, unban, make_admin and make_superuser all save the user; dropped now so this worker sees the
+    # change at once, and again after commit in case a request cached the old row in between
+    invalidate_principal(instance.pk)
+    transaction.on_commit(lambda: invalidate_principal(instance.pk))
+
+
+@receiver(users_updated, sender=User)
+def users_changed(sender, user_ids, **kwargs):
+    # queryset.update(is_banned=True) and bulk_update, which send no post_save
+    def invalidate():
+        for user_id in user_ids:
+            invalidate_principal(user_id)
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reads the user from the principal cache instead of the database."""
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # needs the password hash, which is not cached
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        values = load_principal(user_id)
+        if values is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        user = principal(values)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
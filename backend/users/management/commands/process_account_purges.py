@@ -0,0 +1,12 @@
+from polaris.workers import WorkerCommand
+from users.purge import process_next
+
+
+class Command(WorkerCommand):
+    help = ('Delete the accounts removed through the admin, in small batches. Runs until stopped, '
+            'several instances can run side by side.')
+    processed = 'account purges'
+    sleep = 5.0
+
+    def process_next(self):
+        return process_next()
@@ -1,7 +1,8 @@
 from datetime import timedelta
 from django.utils import timezone
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
 from django.db import models
+from django.dispatch import Signal
 from django.core.validators import RegexValidator
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.conf import settings
@@ -13,6 +14,21 @@ SENDER_EMAIL = settings.EMAIL_HOST_USER
 def name_generator():
     return uuid4().hex[:10]
 
+# sent after a queryset update of users, which sends no post_save, with their `user_ids` and the `fields` set
+users_updated = Signal()
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # bulk_update goes through here as well
+        user_ids = list(self.values_list('pk', flat=True))
+        count = super().update(**kwargs)
+        if user_ids:
+            users_updated.send(sender=self.model, user_ids=user_ids, fields=set(kwargs))
+        return count
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
+
 class User(AbstractUser):
     phone_validator=RegexValidator(
                 regex=r'^09\d{9}$',
@@ -26,6 +42,7 @@ class User(AbstractUser):
     expire_at = models.DateTimeField(null=True,blank=True) #if is_verified==true,this field show last validated date
     is_banned = models.BooleanField(default=False)
     allow_admin_access = models.BooleanField(default=True)
+    objects = UserManager()
     USERNAME_FIELD = 'phone_number'
     REQUIRED_FIELDS = ['email',]
     def send_code(self):
@@ -45,6 +62,14 @@ class User(AbstractUser):
         self.save()
         return True
     
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # a cached principal (users.authentication) has most fields deferred, load them all on first access
+        if fields is not None:
+            deferred_fields = self.get_deferred_fields()
+            if deferred_fields.intersection(fields):
+                fields = deferred_fields.union(fields)
+        super().refresh_from_db(using, fields, **kwargs)
+    
     def verify_code(self,code):
         return code == self.verification_code
     
@@ -91,4 +116,31 @@ class User(AbstractUser):
             "refresh":f"JWT {str(refresh)}"
         }      
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return self.username
+
+
+class AccountPurge(models.Model):
+    # a deleted account whose rows are being removed by the process_account_purges command, see purge.py
+    STATUSES = {
+        'pending': 'pending',
+        'running': 'running',
+        'done': 'done',
+        'failed': 'failed',
+    }
+    account_id = models.BigIntegerField(unique=True)  # no foreign key, the user row goes last
+    phone_number = models.CharField(max_length=11)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    deleted = models.JSONField(default=dict, blank=True)  # rows deleted so far, per model label
+    detail = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"purge of {self.phone_number} ({self.status})"
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from mobile_reports.models import Measurement, TestResult
+from mobile_reports.sync import delete_ids
+from polaris import workers
+from polaris.workers import claimed
+from .models import AccountPurge, User
+
+# sent inside the transaction that deletes the user, once everything it owned is gone, with `account_id`
+account_purged = Signal()
+
+
+def request_purge(user):
+    """
+    Disable `user` at once and queue the deletion of the account and everything it owns for the
+    process_account_purges command.
+    """
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        purge, created = AccountPurge.objects.get_or_create(account_id=user.id,
+                                                            defaults={'phone_number': user.phone_number})
+        if not created and purge.status == 'failed':
+            AccountPurge.objects.filter(id=purge.id).update(status='pending', detail='')
+    return purge
+
+
+def owned_relations():
+    """The foreign keys to User that cascade, the rows they point from are what a purge deletes."""
+    return [relation for relation in User._meta.get_fields(include_hidden=True)
+            if relation.one_to_many and relation.auto_created and relation.on_delete is models.CASCADE]
+
+
+def claim():
+    """Take the oldest pending purge, or a running one whose worker has not finished it in time."""
+    return workers.claim(AccountPurge.objects.all(), settings.ACCOUNT_PURGE_TIMEOUT)
+
+
+def run(purge):
+    """
+    Delete the rows of the account, then the user, in transactions of BULK_DELETE_CHUNK_SIZE rows
+    that save the progress; an interrupted purge can simply run again.
+    """
+    chunk_size = settings.BULK_DELETE_CHUNK_SIZE
+    deleted = dict(purge.deleted)
+    for relation in owned_relations():
+        queryset = relation.related_model._base_manager.filter(**{relation.field.name: purge.account_id})
+        label = relation.related_model._meta.label
+        synced = relation.related_model in (Measurement, TestResult)
+        while True:
+            with transaction.atomic():
+                if synced:
+                    # tombstoned like any other delete, and rows_deleted keeps rollups, tiles and ETags in step
+                    rows = list(queryset.order_by().values_list('id', 'user_id', 'timestamp')[:chunk_size])
+                    delete_ids(relation.related_model, rows)
+                    ids = [pk for pk, _, _ in rows]
+                else:
+                    ids = list(queryset.order_by().values_list('pk', flat=True)[:chunk_size])
+                    if ids:
+                        # small enough for the collector, which also follows relations to these rows
+                        relation.related_model._base_manager.filter(pk__in=ids).delete()
+                deleted[label] = deleted.get(label, 0) + len(ids)
+                if not claimed(purge).update(deleted=deleted):
+                    # another worker took the purge over after ACCOUNT_PURGE_TIMEOUT
+                    transaction.set_rollback(True)
+                    return
+            if len(ids) < chunk_size:
+                break
+    with transaction.atomic():
+        User.objects.filter(id=purge.account_id).delete()
+        claimed(purge).update(status='done', finished_at=timezone.now())
+        account_purged.send(sender=AccountPurge, account_id=purge.account_id)
+
+
+def process_next():
+    """Run one purge, returns False when there was none."""
+    return workers.process_next(claim, lambda purge: run(purge), lambda purge: claimed(purge).update(
+        status='failed', detail='internal error while deleting the account', finished_at=timezone.now()))
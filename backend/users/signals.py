@@ -0,0 +1,28 @@
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import Signal, receiver
+from .models import User, users_updated
+
+# sent inside the saving transaction when users start or stop sharing their data with staff, with `user_ids`
+admin_access_changed = Signal()
+
+
+@receiver(pre_save, sender=User)
+def remember_admin_access(sender, instance, update_fields=None, **kwargs):
+    # saves that leave allow_admin_access alone, like the last_login update, cost nothing
+    if instance.pk is None or (update_fields is not None and 'allow_admin_access' not in update_fields):
+        return
+    instance._stored_admin_access = (User.objects.filter(pk=instance.pk)
+                                                 .values_list('allow_admin_access', flat=True).first())
+
+
+@receiver(post_save, sender=User)
+def announce_admin_access(sender, instance, **kwargs):
+    stored = instance.__dict__.pop('_stored_admin_access', None)
+    if stored is not None and stored != instance.allow_admin_access:
+        admin_access_changed.send(sender=User, user_ids=[instance.pk])
+
+
+@receiver(users_updated, sender=User)
+def announce_updated_admin_access(sender, user_ids, fields, **kwargs):
+    if 'allow_admin_access' in fields:
+        admin_access_changed.send(sender=User, user_ids=user_ids)
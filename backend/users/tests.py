@@ -1,3 +1,197 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from mobile_reports.models import Measurement
+from mobile_reports.signals import rows_deleted
+from mobile_reports.sync import delete_ids
+from .authentication import cache_key, load_principal, principals, shared_cache
+from .models import AccountPurge
+from .purge import account_purged, claim, claimed, process_next, request_purge, run
+from .signals import admin_access_changed
 
-# Create your tests here.
+User = get_user_model()
+
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'users-tests'},
+                'principals': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                               'LOCATION': 'users-tests-principals'}}
+
+MEASUREMENT = {'latitude': 35.7, 'longitude': 51.4, 'network_type': 'LTE', 'http_upload': 1.0, 'http_download': 2.0,
+               'ping_time': 30.0, 'dns_response': 10, 'web_response': 100, 'sms_delivery_time': 1000}
+
+
+def create_user(number, **fields):
+    return User.objects.create_user(username=f'user{number}', phone_number=f'0912{number:07d}',
+                                    email=f'user{number}@example.com', password='x', **fields)
+
+
+def token_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+class PrincipalCacheTests(TestCase):
+
+    def setUp(self):
+        principals.entries.clear()
+        self.user = create_user(1)
+
+    def banned(self):
+        return load_principal(self.user.id)[4]
+
+    def test_save_invalidates(self):
+        self.assertFalse(self.banned())
+        self.user.ban()
+        self.assertTrue(self.banned())
+
+    def test_queryset_update_invalidates(self):
+        self.assertFalse(self.banned())
+        User.objects.filter(id=self.user.id).update(is_banned=True)
+        self.assertTrue(self.banned())
+
+    def test_bulk_update_invalidates(self):
+        self.assertFalse(self.banned())
+        self.user.is_banned = True
+        User.objects.bulk_update([self.user], ['is_banned'])
+        self.assertTrue(self.banned())
+
+    def test_deactivated_token_is_refused(self):
+        client = token_client(self.user)
+        self.assertEqual(client.get('/api/users/profile/').status_code, 200)
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertEqual(client.get('/api/users/profile/').status_code, 401)
+
+    def test_admin_access_update_is_announced(self):
+        announced = []
+        def receiver(sender, user_ids, **kwargs):
+            announced.extend(user_ids)
+        admin_access_changed.connect(receiver)
+        self.addCleanup(admin_access_changed.disconnect, receiver)
+        User.objects.filter(id=self.user.id).update(is_banned=True)
+        self.assertEqual(announced, [])
+        User.objects.filter(id=self.user.id).update(allow_admin_access=False)
+        self.assertEqual(announced, [self.user.id])
+
+
+@override_settings(CACHES=LOCAL_CACHES, AUTH_PRINCIPAL_SHARED_CACHE='principals')
+class SharedPrincipalCacheTests(TestCase):
+
+    def setUp(self):
+        principals.entries.clear()
+        shared_cache().clear()
+        self.user = create_user(1)
+
+    def test_shared_cache_is_read_first(self):
+        load_principal(self.user.id)
+        # what another worker's invalidation and reload leave behind
+        values = shared_cache().get(cache_key(self.user.id))
+        shared_cache().set(cache_key(self.user.id), values[:4] + (True,) + values[5:])
+        self.assertTrue(load_principal(self.user.id)[4])
+
+    def test_update_clears_shared_cache(self):
+        load_principal(self.user.id)
+        User.objects.filter(id=self.user.id).update(is_banned=True)
+        self.assertIsNone(shared_cache().get(cache_key(self.user.id)))
+        self.assertTrue(load_principal(self.user.id)[4])
+
+
+@override_settings(BULK_DELETE_CHUNK_SIZE=2)
+class AccountPurgeTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user(1)
+        self.other = create_user(2)
+        for user in (self.user, self.other):
+            Measurement.objects.bulk_create([Measurement(user=user, timestamp=timezone.now() - timedelta(seconds=index),
+                                                         **MEASUREMENT) for index in range(5)])
+
+    def measurements(self, user):
+        return Measurement.objects.filter(user_id=user.id).count()
+
+    def expire(self, purge):
+        # as if its worker died ACCOUNT_PURGE_TIMEOUT ago
+        AccountPurge.objects.filter(id=purge.id).update(started_at=timezone.now() - timedelta(days=1))
+
+    def test_request_disables_the_account(self):
+        client = token_client(self.user)
+        purge = request_purge(self.user)
+        self.assertEqual((purge.status, purge.account_id), ('pending', self.user.id))
+        self.assertEqual(client.get('/api/users/profile/').status_code, 401)
+        self.assertEqual(request_purge(self.user).id, purge.id)
+
+    def test_purge_deletes_the_account_and_its_rows(self):
+        purged = []
+        def receiver(sender, account_id, **kwargs):
+            purged.append(account_id)
+        account_purged.connect(receiver)
+        self.addCleanup(account_purged.disconnect, receiver)
+        purge = request_purge(self.user)
+        call_command('process_account_purges', '--once', stdout=mock.Mock())
+        purge.refresh_from_db()
+        self.assertEqual((purge.status, purge.attempts), ('done', 1))
+        self.assertEqual(purge.deleted['mobile_reports.Measurement'], 5)
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+        self.assertEqual(self.measurements(self.user), 0)
+        self.assertEqual(self.measurements(self.other), 5)
+        self.assertEqual(purged, [self.user.id])
+        self.assertFalse(process_next())
+
+    def test_chunks_are_deleted_like_any_other_delete(self):
+        chunks = []
+        def receiver(sender, rows, **kwargs):
+            chunks.append(len(rows))
+        rows_deleted.connect(receiver, sender=Measurement)
+        self.addCleanup(rows_deleted.disconnect, receiver, sender=Measurement)
+        request_purge(self.user)
+        with mock.patch('users.purge.delete_ids', wraps=delete_ids) as deletes:
+            self.assertTrue(process_next())
+        self.assertEqual(chunks, [2, 2, 1])
+        self.assertEqual(deletes.call_count, 4)  # and one chunk of no test results
+
+    def test_interrupted_purge_restarts_where_it_stopped(self):
+        purge = request_purge(self.user)
+        def crash_on_second_chunk(purge):
+            if self.measurements(self.user) == 1:
+                raise RuntimeError('worker killed')
+            return claimed(purge)
+        with mock.patch('users.purge.claimed', crash_on_second_chunk), self.assertRaises(RuntimeError):
+            run(claim())
+        # the first chunk stays deleted, the second was rolled back
+        self.assertEqual(self.measurements(self.user), 3)
+        self.assertIsNone(claim())  # still running, not stale yet
+        self.expire(purge)
+        self.assertTrue(process_next())
+        purge.refresh_from_db()
+        self.assertEqual((purge.status, purge.attempts), ('done', 2))
+        self.assertEqual(purge.deleted['mobile_reports.Measurement'], 5)
+        self.assertEqual(self.measurements(self.user), 0)
+
+    def test_taken_over_purge_stops_its_first_worker(self):
+        request_purge(self.user)
+        first = claim()
+        self.expire(first)
+        second = claim()
+        self.assertEqual(second.attempts, 2)
+        run(first)
+        self.assertEqual(self.measurements(self.user), 5)  # its chunk was rolled back
+        self.assertTrue(User.objects.filter(id=self.user.id).exists())
+        run(second)
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'done')
+        self.assertEqual(self.measurements(self.user), 0)
+
+    def test_failed_purge_is_retried_when_requested_again(self):
+        purge = request_purge(self.user)
+        with mock.patch('users.purge.run', side_effect=RuntimeError), self.assertLogs('polaris.workers', 'ERROR'):
+            self.assertTrue(process_next())
+        purge.refresh_from_db()
+        self.assertEqual(purge.status, 'failed')
+        self.assertFalse(process_next())
+        request_purge(User.objects.get(id=self.user.id))
+        self.assertTrue(process_next())
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
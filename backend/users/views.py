@@ -60,6 +60,8 @@ class AuthenticationViewSet(GenericViewSet):
         user = validated_data['user']
         if user.is_banned:
             return Response({'detail':'this account is banned and cannot be accessed'}, status=status.HTTP_403_FORBIDDEN)
+        elif not user.is_active:
+            return Response({'detail':'this account has been deleted'}, status=status.HTTP_403_FORBIDDEN)
         elif user.is_verified:
             user.last_login = timezone.now()
             user.save()